@@ -0,0 +1,131 @@
+"""
+Context-window compaction for long consultations.
+
+Once the history sent to Groq passes ``TOKEN_BUDGET`` (estimated locally),
+the oldest turns are folded into a running summary plus the structured
+fields collected so far (name, age, gender, symptoms, duration). Only the
+``KEEP_RECENT`` newest messages are always sent verbatim.
+
+The compaction state (summary, number of messages already folded, facts) is
+stored on the Conversation so each turn only summarizes newly aged-out
+messages.
+"""
+import re
+
+from django.conf import settings
+
+from llm import gateway, prompts
+from llm.tokens import estimate_messages_tokens, estimate_tokens
+
+DEFAULTS = {
+    "TOKEN_BUDGET": 1500,
+    "KEEP_RECENT": 6,
+    "SUMMARY_MODEL": "llama-3.1-8b-instant",
+    "SUMMARY_MAX_TOKENS": 250,
+}
+
+FACT_FIELDS = ["name", "age", "gender", "symptoms", "duration"]
+
+# The lead-in in any case ("My name is"), the name itself capitalized
+_NAME = re.compile(r"\b(?i:my name is|i am|i'm|this is|call me)\s+([A-Z][a-z]+)\b")
+_AGE = re.compile(r"\b(\d{1,3})\s*(?:years?|yrs?|y/?o)\b(?:\s*old)?", re.IGNORECASE)
+_GENDER = re.compile(r"\b(male|female|man|woman|boy|girl|non-binary)\b", re.IGNORECASE)
+_DURATION = re.compile(r"\b(?:for|since|past|last)\s+(\d+)\s*days?\b", re.IGNORECASE)
+_GENDERS = {"man": "male", "boy": "male", "woman": "female", "girl": "female"}
+
+
+def get_config(name):
+    return getattr(settings, "CONVERSATION_COMPACTION", {}).get(name, DEFAULTS[name])
+
+
+def extract_facts(messages):
+    """Pull consultation fields out of user messages with cheap regexes."""
+    facts = {}
+    for message in messages:
+        if message.get("role") != "user":
+            continue
+        text = message.get("content", "")
+        if match := _NAME.search(text):
+            facts["name"] = match.group(1)
+        if match := _AGE.search(text):
+            facts["age"] = int(match.group(1))
+        if match := _GENDER.search(text):
+            gender = match.group(1).lower()
+            facts["gender"] = _GENDERS.get(gender, gender)
+        if match := _DURATION.search(text):
+            facts["duration"] = int(match.group(1))
+    return facts
+
+
+def merge_facts(facts, new):
+    merged = dict(facts or {})
+    merged.update({k: v for k, v in (new or {}).items() if k in FACT_FIELDS and v not in (None, "", 0)})
+    return merged
+
+
+def summarize_locally(summary, messages):
+    """Extractive fallback: keep the first sentence of every aged-out turn."""
+    lines = [summary] if summary else []
+    for message in messages:
+        first = re.split(r"(?<=[.!?])\s", message.get("content", "").strip(), maxsplit=1)[0]
+        if first:
+            lines.append(f"{message.get('role', 'user')}: {first[:200]}")
+    # Keep the summary itself bounded; the oldest lines go first
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > get_config("SUMMARY_MAX_TOKENS"):
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def summarize_with_llm(summary, messages):
+    transcript = "\n".join(f"{m.get('role')}: {m.get('content', '')}" for m in messages)
+    summary_prompt = prompts.get("summary")
+    prompt = [
+        summary_prompt.message(),
+        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+    ]
+    try:
+        return gateway.chat(
+            prompt, model=get_config("SUMMARY_MODEL"), max_tokens=get_config("SUMMARY_MAX_TOKENS"), prompt=summary_prompt,
+        )
+    except Exception:
+        return summarize_locally(summary, messages)
+
+
+def summary_message(summary, facts):
+    known = ", ".join(f"{field.title()}: {facts[field]}" for field in FACT_FIELDS if field in facts)
+    content = f"Summary of the earlier conversation:\n{summary}"
+    if known:
+        content += f"\n\nDetails already collected (do not ask again): {known}"
+    return {"role": "system", "content": content}
+
+
+def compact_history(history, state=None, summarizer=summarize_with_llm):
+    """
+    Return ``(messages, state)`` where ``messages`` fits the token budget and
+    ``state`` is the updated ``{"summary", "summarized", "facts"}`` dict.
+    """
+    state = {"summary": "", "summarized": 0, "facts": {}, **(state or {})}
+    budget = get_config("TOKEN_BUDGET")
+    keep_recent = get_config("KEEP_RECENT")
+
+    def prompt_tokens(cut):
+        tokens = estimate_messages_tokens(history[cut:])
+        if cut:
+            tokens += estimate_tokens(state["summary"]) + 60
+        return tokens
+
+    cut = state["summarized"]
+    limit = max(len(history) - keep_recent, cut)
+    while cut < limit and prompt_tokens(cut) > budget:
+        # Age out a user/assistant pair at a time
+        cut = min(cut + 2, limit)
+
+    if cut > state["summarized"]:
+        aged = history[state["summarized"]:cut]
+        state["summary"] = summarizer(state["summary"], aged)
+        state["facts"] = merge_facts(state["facts"], extract_facts(aged))
+        state["summarized"] = cut
+
+    if not state["summarized"]:
+        return history, state
+    return [summary_message(state["summary"], state["facts"])] + history[state["summarized"]:], state
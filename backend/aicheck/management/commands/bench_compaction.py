@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from aicheck.compaction import compact_history, summarize_locally, summarize_with_llm
+from llm import gateway, prompts
+from llm.tokens import estimate_messages_tokens
+
+USER_TURNS = [
+    "Hi, my name is Priya.",
+    "I'm 34 years old, female.",
+    "I have had a fever and a bad headache for 3 days.",
+    "The fever goes up to 101F in the evenings and I feel tired all the time.",
+    "No cough, but my throat is a bit sore and my joints ache.",
+    "I took paracetamol twice a day, it helps for a few hours.",
+    "Should I be worried about dengue? There were cases near my office.",
+    "What foods should I eat while I recover?",
+]
+
+ASSISTANT_REPLY = (
+    "Thank you, Priya. Based on what you've shared, a few conditions could explain these symptoms. "
+    "A viral infection such as influenza is common and usually settles within a week with rest and fluids. "
+    "Dengue is possible given local cases; watch for rash, bleeding gums or severe abdominal pain and get a "
+    "platelet count if the fever persists. Typhoid and malaria are less likely but worth testing for if the "
+    "fever continues beyond five days. Precautions: stay hydrated with oral rehydration salts, avoid "
+    "ibuprofen until dengue is ruled out, and rest as much as possible. How are you feeling right now?"
+)
+
+
+def build_conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": USER_TURNS[i % len(USER_TURNS)]})
+        history.append({"role": "assistant", "content": ASSISTANT_REPLY})
+    # The request being answered ends with a fresh user message
+    history.append({"role": "user", "content": "Thanks. Anything else I should do?"})
+    return history
+
+
+class Command(BaseCommand):
+    help = "Compare prompt size and latency of long consultations with and without history compaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--turns", type=int, nargs="+", default=[5, 20, 50])
+        parser.add_argument(
+            "--live",
+            action="store_true",
+            help="Also send each prompt through the LLM gateway (GROQ_BASE_URL may point at a local fake server) "
+                 "and summarize with the LLM instead of the local extractive summarizer.",
+        )
+
+    def handle(self, *args, **options):
+        summarizer = summarize_with_llm if options["live"] else summarize_locally
+        system = [prompts.get("consultation").message()]
+
+        self.stdout.write(f"{'turns':>5} {'mode':>10} {'prompt_tokens':>14} {'prep_ms':>9} {'llm_ms':>9}")
+        for turns in options["turns"]:
+            history = build_conversation(turns)
+
+            full = system + history
+            self._report(turns, "full", full, 0.0, options["live"])
+
+            # Replay the conversation turn by turn, as the view does, so the
+            # summary is built incrementally from the stored state
+            state = None
+            started = time.perf_counter()
+            for end in range(1, len(history) + 1, 2):
+                messages, state = compact_history(history[:end], state, summarizer=summarizer)
+            prep_ms = (time.perf_counter() - started) * 1000
+            self._report(turns, "compacted", system + messages, prep_ms, options["live"])
+
+    def _report(self, turns, mode, messages, prep_ms, live):
+        llm_ms = "-"
+        if live:
+            started = time.perf_counter()
+            gateway.chat(messages, max_tokens=1)
+            llm_ms = f"{(time.perf_counter() - started) * 1000:.1f}"
+        tokens = estimate_messages_tokens(messages)
+        self.stdout.write(f"{turns:>5} {mode:>10} {tokens:>14} {prep_ms:>9.2f} {llm_ms:>9}")
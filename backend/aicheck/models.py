@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
 
@@ -7,4 +7,63 @@ from django.contrib.auth.models import User
 class SymptomLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
-    date_logged = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    date_logged = models.DateTimeField(auto_now_add=True)
+
+GREETING = "Hello! I'm MiniMedi, your AI Health Assistant. 👋 Before we begin, may I know your name?"
+
+class Conversation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    # Whole chat log as one JSON array of {"role", "content"} dicts
+    messages = models.JSONField(default=list)
+    # Compaction state: running summary of messages[:summarized_count] and
+    # the consultation fields extracted so far (see aicheck.compaction)
+    summary = models.TextField(blank=True, default='')
+    summarized_count = models.PositiveIntegerField(default=0)
+    facts = models.JSONField(default=dict, blank=True)
+    # llm.prompts id ("consultation@v1") the conversation runs on
+    prompt_version = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - conversation {self.pk}"
+
+    @classmethod
+    def start(cls, user):
+        return cls.objects.create(user=user, messages=[{"role": "assistant", "content": GREETING}])
+
+    def compaction_state(self):
+        return {"summary": self.summary, "summarized": self.summarized_count, "facts": self.facts}
+
+    def job_reply(self, job_id):
+        """The assistant message stored by queued job ``job_id``, or None."""
+        return next((m for m in self.messages if m.get('job_id') == job_id), None)
+
+    def append(self, *messages, state=None, prompt_version=None, job_id=None):
+        """
+        Add ``messages`` to the log. With ``job_id`` the last message is tagged
+        with it, and nothing is added if that job's turn is already stored (a
+        reclaimed job running again); returns False then.
+        """
+        # Lock the row so concurrent turns on one conversation don't drop messages
+        with transaction.atomic():
+            locked = type(self).objects.select_for_update().get(pk=self.pk)
+            if job_id is not None:
+                if locked.job_reply(job_id) is not None:
+                    self.messages = locked.messages
+                    return False
+                messages = messages[:-1] + ({**messages[-1], 'job_id': job_id},)
+            locked.messages.extend(messages)
+            fields = ['messages', 'updated_at']
+            if prompt_version and locked.prompt_version != prompt_version:
+                locked.prompt_version = prompt_version
+                fields.append('prompt_version')
+            if state is not None and state["summarized"] >= locked.summarized_count:
+                locked.summary = state["summary"]
+                locked.summarized_count = state["summarized"]
+                locked.facts = state["facts"]
+                fields += ['summary', 'summarized_count', 'facts']
+            locked.save(update_fields=fields)
+        for field in ('messages', 'summary', 'summarized_count', 'facts', 'prompt_version', 'updated_at'):
+            setattr(self, field, getattr(locked, field))
+        return True
@@ -0,0 +1,75 @@
+"""
+Server-side persistence of the consultation record.
+
+When a reply carries a ###DATA_START### block, the validated fields are
+upserted into the Symptom linked to the conversation in the same transaction
+that stores the turn, so the browser no longer POSTs/PATCHes the record.
+"""
+from analytics import rollups
+from symptoms.models import Symptom
+from .serializers import ConsultationRecordSerializer
+
+# Model field <- DATA block key
+FIELD_MAP = {
+    'patient_name': 'name',
+    'age': 'age',
+    'gender': 'gender',
+    'description': 'symptoms',
+    'duration': 'duration',
+    'severity': 'severity',
+    'risk_score': 'risk_score',
+}
+
+# Used for fields the model has not filled in yet on the first save
+CREATE_DEFAULTS = {
+    'title': 'Health Analysis Report',
+    'patient_name': 'Guest',
+    'description': 'In progress...',
+    'gender': 'Unknown',
+    'severity': 'MEDIUM',
+}
+
+
+def conversation_analysis(conversation):
+    return "\n\n".join(m['content'] for m in conversation.messages if m.get('role') == 'assistant')
+
+
+def save_consultation_record(conversation, record=None):
+    """
+    Create or update the Symptom for ``conversation``. Without a (valid)
+    record only an existing Symptom's ai_analysis is refreshed. Must run
+    inside a transaction. Returns the Symptom or None.
+    """
+    fields = {}
+    if record is not None:
+        serializer = ConsultationRecordSerializer(data=record)
+        if serializer.is_valid():
+            data = serializer.validated_data
+            fields = {
+                field: data[key]
+                for field, key in FIELD_MAP.items()
+                if data.get(key) not in (None, '')
+            }
+
+    symptom = Symptom.objects.select_for_update().filter(conversation=conversation).first()
+    if symptom is None and not fields:
+        return None
+
+    fields['ai_analysis'] = conversation_analysis(conversation)
+    if conversation.prompt_version:
+        fields['prompt_version'] = conversation.prompt_version
+    if symptom is None:
+        symptom = Symptom.objects.create(
+            user=conversation.user,
+            conversation=conversation,
+            **{**CREATE_DEFAULTS, **fields},
+        )
+        rollups.Delta().add(symptom).apply()
+        return symptom
+
+    delta = rollups.Delta().remove(symptom)
+    for field, value in fields.items():
+        setattr(symptom, field, value)
+    symptom.save(update_fields=list(fields))
+    delta.add(symptom).apply()
+    return symptom
@@ -0,0 +1,23 @@
+from rest_framework import serializers
+from .models import Conversation
+
+class ConversationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Conversation
+        fields = ['id', 'messages', 'created_at', 'updated_at']
+
+class ConsultationRecordSerializer(serializers.Serializer):
+    """Validates the ###DATA_START### block emitted by the model."""
+    name = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    age = serializers.IntegerField(min_value=0, max_value=150, required=False, allow_null=True)
+    gender = serializers.CharField(max_length=50, required=False, allow_blank=True, allow_null=True)
+    symptoms = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    duration = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+    severity = serializers.ChoiceField(choices=['LOW', 'MEDIUM', 'HIGH'], required=False, allow_null=True)
+    risk_score = serializers.IntegerField(min_value=0, max_value=100, required=False, allow_null=True)
+    complete = serializers.BooleanField(required=False, default=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict) and isinstance(data.get('severity'), str):
+            data = {**data, 'severity': data['severity'].strip().upper()}
+        return super().to_internal_value(data)
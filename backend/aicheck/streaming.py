@@ -0,0 +1,80 @@
+import json
+
+DATA_START = "###DATA_START###"
+DATA_END = "###DATA_END###"
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class DataBlockFilter:
+    """
+    Splits a streamed completion into user-visible text and the hidden
+    ###DATA_START###...###DATA_END### trailer.
+
+    Text is released as soon as it can no longer be the beginning of the
+    start marker, so only a marker-sized tail is ever held back.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._trailer = None
+        self.visible = ""
+
+    def feed(self, chunk):
+        if self._trailer is not None:
+            self._trailer += chunk
+            return ""
+
+        self._pending += chunk
+        idx = self._pending.find(DATA_START)
+        if idx != -1:
+            out = self._pending[:idx]
+            self._trailer = self._pending[idx + len(DATA_START):]
+            self._pending = ""
+        else:
+            keep = self._partial_marker_len(self._pending)
+            out = self._pending[:len(self._pending) - keep]
+            self._pending = self._pending[len(self._pending) - keep:]
+
+        self.visible += out
+        return out
+
+    def close(self):
+        """Flush held-back text and return ``(text, record)``."""
+        out = self._pending
+        self._pending = ""
+        self.visible += out
+
+        record = None
+        if self._trailer is not None:
+            body, _, rest = self._trailer.partition(DATA_END)
+            try:
+                record = json.loads(body.strip())
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                record = None
+            # Anything the model wrote after the trailer is still shown
+            rest = rest.strip()
+            if rest:
+                out += rest
+                self.visible += rest
+        return out, record
+
+    @staticmethod
+    def _partial_marker_len(text):
+        for size in range(min(len(DATA_START) - 1, len(text)), 0, -1):
+            if DATA_START.startswith(text[-size:]):
+                return size
+        return 0
+
+
+def split_data_block(text):
+    """Return ``(visible_text, record)`` for a complete reply."""
+    data_filter = DataBlockFilter()
+    data_filter.feed(text)
+    _, record = data_filter.close()
+    return data_filter.visible.strip(), record
@@ -1,3 +1,624 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.test import APIClient
+
+from llm import gateway, prompts, resilience, throttling, tokens
+from metrics import instrument, registry as metrics_registry
+from analytics.models import DailyRollup, DailyTerm
+from symptoms.models import Symptom
+from users.views import create_jwt
+from . import compaction
+from .models import Conversation
+from .records import CREATE_DEFAULTS, save_consultation_record
+from .views import _record_turn, _resolve_turn
+from .streaming import DATA_END, DATA_START, DataBlockFilter, split_data_block
+
+User = get_user_model()
+
+PRIMARY = "llama-3.3-70b-versatile"
+SMALL = "llama-3.1-8b-instant"
+
+
+class FakeGroq(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible chat endpoint. ``plan`` maps a model to the outcomes of
+    its next calls: an int is returned as that HTTP error status, a float is
+    a delay in seconds before a normal reply. Unplanned calls succeed.
+    """
+
+    protocol_version = "HTTP/1.1"
+    plan = {}
+    calls = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model = body["model"]
+        self.calls.append(model)
+        outcome = self.plan.get(model, []).pop(0) if self.plan.get(model) else None
+
+        try:
+            if isinstance(outcome, int):
+                self._reply(outcome, {"error": {"message": f"injected {outcome}", "type": "server_error"}})
+                return
+            if isinstance(outcome, float):
+                time.sleep(outcome)
+            self._reply(200, {
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": f"reply from {model}"},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a delayed reply
+            pass
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeGroqTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGroq)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            GROQ_API_KEY="test",
+            LLM_GATEWAY={"BASE_URL": f"http://127.0.0.1:{cls.server.server_port}"},
+            LLM_RESILIENCE={
+                "DEADLINE": 3.0,
+                "ATTEMPT_TIMEOUT": 0.5,
+                "MAX_ATTEMPTS": 3,
+                "BACKOFF_BASE": 0.01,
+                "BACKOFF_MAX": 0.05,
+                "BREAKER_THRESHOLD": 3,
+                "BREAKER_RESET": 60.0,
+                "FALLBACK_MODELS": {PRIMARY: [SMALL]},
+            },
+            LLM_THROTTLE={},
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        gateway.reset()
+        super().tearDownClass()
+
+    def setUp(self):
+        gateway.reset()
+        resilience.reset_breakers()
+        throttling.reset_backend()
+        FakeGroq.plan = {}
+        FakeGroq.calls = []
+        user = User.objects.create_user(username="patient", email="patient@example.com", password="x")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + create_jwt(user))
+
+    def ask(self):
+        return self.client.post(
+            "/api/ai-check/", {"messages": [{"role": "user", "content": "I have a headache"}]}, format="json"
+        )
+
+
+class ResilienceTests(FakeGroqTestCase):
+    def test_transient_errors_are_retried(self):
+        FakeGroq.plan = {PRIMARY: [503, 502]}
+        response = self.ask()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["response"], f"reply from {PRIMARY}")
+        self.assertEqual(FakeGroq.calls, [PRIMARY] * 3)
+
+    def test_slow_primary_falls_back_to_smaller_model(self):
+        FakeGroq.plan = {PRIMARY: [1.5]}
+        response = self.ask()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["response"], f"reply from {SMALL}")
+        self.assertEqual(FakeGroq.calls, [PRIMARY, SMALL])
+
+    def test_exhausted_retries_fall_back(self):
+        FakeGroq.plan = {PRIMARY: [500, 500, 500]}
+        response = self.ask()
+        self.assertEqual(response.data["response"], f"reply from {SMALL}")
+        self.assertEqual(FakeGroq.calls, [PRIMARY] * 3 + [SMALL])
+
+    def test_open_circuit_skips_model_without_calling_it(self):
+        FakeGroq.plan = {PRIMARY: [503, 503, 503]}
+        self.ask()
+        FakeGroq.calls = []
+        response = self.ask()
+        self.assertEqual(response.data["response"], f"reply from {SMALL}")
+        self.assertEqual(FakeGroq.calls, [SMALL])
+        self.assertEqual(resilience.breaker_states()[PRIMARY], resilience.CircuitBreaker.OPEN)
+
+    def test_client_errors_are_not_retried(self):
+        FakeGroq.plan = {PRIMARY: [400]}
+        response = self.ask()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data, {"error": gateway.UNAVAILABLE_MESSAGE})
+        self.assertEqual(FakeGroq.calls, [PRIMARY])
+
+    def test_total_outage_fails_within_deadline(self):
+        FakeGroq.plan = {PRIMARY: [503] * 3, SMALL: [503] * 3}
+        started = time.monotonic()
+        response = self.ask()
+        self.assertLess(time.monotonic() - started, 3.0)
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn("injected", response.data["error"])
+        self.assertEqual(len(FakeGroq.calls), 6)
+
+    def test_trial_call_that_raises_reopens_the_circuit(self):
+        breaker = resilience.get_breaker(PRIMARY)
+        for _ in range(3):
+            breaker.record_failure()
+        breaker.opened_at -= 60.0
+
+        def broken(model, timeout):
+            raise ValueError("not an upstream error")
+
+        with self.assertRaises(ValueError):
+            resilience.call(broken, PRIMARY)
+        self.assertEqual(breaker.state, resilience.CircuitBreaker.OPEN)
+        # Open again for a full BREAKER_RESET, rather than stuck half-open
+        self.assertFalse(breaker.allow())
+        breaker.opened_at -= 60.0
+        self.assertTrue(breaker.allow())
+
+
+class AsyncClientTests(FakeGroqTestCase):
+    def test_client_is_closed_with_its_event_loop(self):
+        async def ask():
+            client = await gateway.get_async_client()
+            reply = await gateway.achat([{"role": "user", "content": "hello"}])
+            self.assertIs(await gateway.get_async_client(), client)
+            return reply, client
+
+        reply, client = async_to_sync(ask)()
+        self.assertEqual(reply, f"reply from {PRIMARY}")
+        # async_to_sync ran it on a loop of its own, which is gone now
+        self.assertTrue(client.is_closed())
+
+
+class PromptVersionTests(FakeGroqTestCase):
+    def setUp(self):
+        super().setUp()
+        prompts.reset_stats()
+
+    def test_conversation_keeps_its_prompt_version(self):
+        with self.settings(LLM_PROMPTS={"ACTIVE": {"consultation": "v2"}}):
+            first = self.client.post("/api/ai-check/", {"message": "I have a headache"}, format="json")
+        conversation_id = first.data["conversation_id"]
+        self.assertEqual(Conversation.objects.get(pk=conversation_id).prompt_version, "consultation@v2")
+
+        # Switching the active version doesn't move a running conversation
+        with self.settings(LLM_PROMPTS={"ACTIVE": {"consultation": "v1"}}):
+            self.client.post("/api/ai-check/", {"message": "Sam", "conversation_id": conversation_id}, format="json")
+        self.assertEqual(prompts.stats()["consultation@v2"]["calls"], 2)
+        self.assertEqual(prompts.stats()["consultation@v1"]["calls"], 0)
+
+    def test_stats_use_reported_usage(self):
+        self.ask()
+        stats = prompts.stats()[prompts.get("consultation").id]
+        self.assertEqual((stats["calls"], stats["prompt_tokens"], stats["completion_tokens"]), (1, 1, 1))
+        self.assertIsNotNone(stats["p95_latency_ms"])
+
+    def test_failed_calls_are_counted(self):
+        FakeGroq.plan = {PRIMARY: [400]}
+        self.ask()
+        self.assertEqual(prompts.stats()[prompts.get("consultation").id]["errors"], 1)
+
+
+class LlmMetricsTests(FakeGroqTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+
+    def test_calls_are_counted_per_route_and_model(self):
+        self.ask()
+        self.assertEqual(instrument.LLM_DURATION.count(("api/ai-check/", PRIMARY, "ok")), 1)
+        self.assertEqual(instrument.LLM_TOKENS.value(("api/ai-check/", PRIMARY, "in")), 1)
+        self.assertEqual(instrument.LLM_TOKENS.value(("api/ai-check/", PRIMARY, "out")), 1)
+        self.assertGreater(instrument.PHASE_TIME.value(("api/ai-check/", "llm")), 0)
+
+    def test_fallback_is_counted_against_the_model_that_answered(self):
+        FakeGroq.plan = {PRIMARY: [500, 500, 500]}
+        self.ask()
+        self.assertEqual(instrument.LLM_DURATION.count(("api/ai-check/", SMALL, "ok")), 1)
+        self.assertEqual(instrument.LLM_DURATION.count(("api/ai-check/", PRIMARY, "ok")), 0)
+
+    def test_calls_outside_a_request(self):
+        FakeGroq.plan = {PRIMARY: [400]}
+        with self.assertRaises(gateway.LLMError):
+            gateway.chat([{"role": "user", "content": "hello"}])
+        self.assertEqual(instrument.LLM_DURATION.count((instrument.BACKGROUND, PRIMARY, "error")), 1)
+
+
+class PromptRegistryTests(SimpleTestCase):
+    def test_prompts_are_loaded_with_token_counts(self):
+        prompt = prompts.get("consultation", "v1")
+        self.assertIn("###DATA_START###", prompt.text)
+        self.assertGreater(prompt.tokens, prompts.get("consultation", "v2").tokens)
+
+    @override_settings(LLM_PROMPTS={"EXPERIMENTS": {"consultation": {"v1": 50, "v2": 50}}})
+    def test_experiment_split_is_stable_per_key(self):
+        picks = {key: prompts.select("consultation", key=key).version for key in range(200)}
+        self.assertEqual(picks, {key: prompts.select("consultation", key=key).version for key in range(200)})
+        self.assertLess(abs(list(picks.values()).count("v1") - 100), 30)
+
+
+RECORD = {"name": "Amy", "age": 30, "gender": "Female", "symptoms": "headache", "duration": 2, "severity": "low", "risk_score": 20}
+
+
+class DataBlockFilterTests(SimpleTestCase):
+    def test_marker_split_across_chunks_is_held_back(self):
+        data_filter = DataBlockFilter()
+        self.assertEqual(data_filter.feed("Drink water. ###DA"), "Drink water. ")
+        self.assertEqual(data_filter.feed("TA_START###{\"age\": "), "")
+        self.assertEqual(data_filter.feed("30}" + DATA_END), "")
+        self.assertEqual(data_filter.close(), ("", {"age": 30}))
+        self.assertEqual(data_filter.visible, "Drink water. ")
+
+    def test_text_that_only_looked_like_the_marker_is_released(self):
+        data_filter = DataBlockFilter()
+        self.assertEqual(data_filter.feed("Rest ###D"), "Rest ")
+        self.assertEqual(data_filter.feed("ONE"), "###DONE")
+
+    def test_close_flushes_held_back_text(self):
+        data_filter = DataBlockFilter()
+        self.assertEqual(data_filter.feed("Rest ##"), "Rest ")
+        self.assertEqual(data_filter.close(), ("##", None))
+        self.assertEqual(data_filter.visible, "Rest ##")
+
+    def test_text_after_the_trailer_is_shown(self):
+        data_filter = DataBlockFilter()
+        data_filter.feed(f"Rest. {DATA_START}{{\"age\": 30}}{DATA_END}\nTake care.")
+        self.assertEqual(data_filter.close(), ("Take care.", {"age": 30}))
+        self.assertEqual(data_filter.visible, "Rest. Take care.")
+
+    def test_split_data_block(self):
+        self.assertEqual(split_data_block(f"  Rest.\n{DATA_START}\n{json.dumps(RECORD)}\n{DATA_END}"), ("Rest.", RECORD))
+        # No end marker: the block runs to the end of the reply
+        self.assertEqual(split_data_block(f"Rest. {DATA_START} {{\"age\": 30}}"), ("Rest.", {"age": 30}))
+        self.assertEqual(split_data_block("Rest."), ("Rest.", None))
+
+    def test_malformed_data_block_gives_no_record(self):
+        self.assertEqual(split_data_block(f"Rest. {DATA_START} {{\"age\": 30,{DATA_END}"), ("Rest.", None))
+        self.assertEqual(split_data_block(f"Rest. {DATA_START} [1, 2]{DATA_END}"), ("Rest.", None))
+
+
+@override_settings(GROQ_API_KEY="test", LLM_THROTTLE={})
+class StreamingViewTests(TestCase):
+    CHUNKS = ["You may have ", "a tension headache. ###DATA", f"_START###{json.dumps(RECORD)[:20]}", json.dumps(RECORD)[20:], DATA_END]
+
+    def setUp(self):
+        throttling.reset_backend()
+        self.user = User.objects.create_user(username="patient", email="patient@example.com", password="x")
+        self.headers = {"Authorization": f"Bearer {create_jwt(self.user)}"}
+
+    def stream(self, body):
+        async def astream(messages, prompt=None, **kwargs):
+            for chunk in self.CHUNKS:
+                yield chunk
+
+        async def request():
+            response = await AsyncClient().post("/api/ai-check/stream/", body, content_type="application/json", headers=self.headers)
+            content = b"".join([chunk async for chunk in response.streaming_content]) if response.streaming else response.content
+            return response, content.decode()
+
+        with mock.patch.object(gateway, "astream", astream):
+            return async_to_sync(request)()
+
+    def events(self, body):
+        frames = body.split("\n\n")
+        self.assertEqual(frames[-1], "")
+        events = []
+        for frame in frames[:-1]:
+            event, data = frame.split("\n")
+            self.assertTrue(event.startswith("event: ") and data.startswith("data: "), frame)
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return events
+
+    def test_tokens_then_record_then_done(self):
+        response, body = self.stream({"message": "I have a headache"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertNotIn("###", body)
+        events = self.events(body)
+
+        kinds = [kind for kind, _ in events]
+        self.assertEqual(kinds[-2:], ["record", "done"])
+        self.assertEqual(set(kinds[:-2]), {"token"})
+        text = "".join(data["text"] for _, data in events[:-2])
+        self.assertEqual(text, "You may have a tension headache. ")
+        for _, data in events[:-2]:
+            self.assertNotIn("Amy", data["text"])
+
+        record, done = events[-2][1], events[-1][1]
+        self.assertEqual(record["name"], "Amy")
+        self.assertEqual(done["response"], "You may have a tension headache.")
+        self.assertEqual(done["record_id"], record["record_id"])
+        conversation = Conversation.objects.get(pk=done["conversation_id"])
+        self.assertEqual(conversation.messages[-1]["content"], "You may have a tension headache.")
+        self.assertEqual(conversation.symptom.patient_name, "Amy")
+
+    def test_errors_before_the_stream(self):
+        response, body = self.stream({})
+        self.assertEqual(response.status_code, 400)
+        self.headers = {}
+        response, body = self.stream({"message": "hi"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_llm_failure_mid_stream_is_an_error_event(self):
+        async def failing(messages, prompt=None, **kwargs):
+            yield "You may "
+            raise gateway.LLMUnavailable("down")
+
+        async def request():
+            response = await AsyncClient().post(
+                "/api/ai-check/stream/", {"message": "hi"}, content_type="application/json", headers=self.headers
+            )
+            return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+        with mock.patch.object(gateway, "astream", failing):
+            events = self.events(async_to_sync(request)())
+        self.assertEqual(events, [("token", {"text": "You may "}), ("error", {"error": gateway.UNAVAILABLE_MESSAGE})])
+
+
+def turns(count, words=20):
+    """``count`` alternating user/assistant messages of ``words`` words each."""
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * (words - 2)}
+        for i in range(count)
+    ]
+
+
+class StubSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, summary, messages):
+        self.calls.append((summary, messages))
+        return f"summary of {len(messages)}"
+
+
+@override_settings(CONVERSATION_COMPACTION={"TOKEN_BUDGET": 200, "KEEP_RECENT": 2, "SUMMARY_MAX_TOKENS": 40})
+class CompactionTests(SimpleTestCase):
+    def setUp(self):
+        self.summarizer = StubSummarizer()
+
+    def compact(self, history, state=None):
+        return compaction.compact_history(history, state, summarizer=self.summarizer)
+
+    def test_history_within_the_budget_is_sent_as_is(self):
+        history = turns(4)
+        messages, state = self.compact(history)
+        self.assertEqual(messages, history)
+        self.assertEqual(state, {"summary": "", "summarized": 0, "facts": {}})
+        self.assertEqual(self.summarizer.calls, [])
+
+    def test_oldest_pairs_are_summarized_until_the_prompt_fits(self):
+        history = turns(10)
+        messages, state = self.compact(history)
+        # Each message is ~24 tokens: four pairs go, a whole pair at a time
+        self.assertEqual(state["summarized"], 6)
+        self.assertEqual(self.summarizer.calls, [("", history[:6])])
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertIn("summary of 6", messages[0]["content"])
+        self.assertEqual(messages[1:], history[6:])
+        self.assertLessEqual(tokens.estimate_messages_tokens(messages), 200)
+
+    def test_recent_turns_stay_verbatim_over_the_budget(self):
+        history = turns(6, words=100)
+        messages, state = self.compact(history)
+        self.assertEqual(state["summarized"], 4)
+        self.assertEqual(messages[1:], history[-2:])
+
+    def test_only_newly_aged_messages_are_summarized(self):
+        history = turns(10)
+        _, state = self.compact(history)
+        history += turns(4)
+        messages, state = self.compact(history, state)
+        self.assertEqual(self.summarizer.calls[1], ("summary of 6", history[6:10]))
+        self.assertEqual(state["summarized"], 10)
+        self.assertEqual(messages[1:], history[10:])
+
+    def test_facts_are_extracted_from_aged_user_messages(self):
+        history = [
+            {"role": "user", "content": "My name is Ravi, a 34 yrs old man. Fever for 3 days."},
+            {"role": "assistant", "content": "I am Medi. Is this a woman's issue for 9 days?"},
+        ] + turns(10)
+        messages, state = self.compact(history)
+        self.assertEqual(state["facts"], {"name": "Ravi", "age": 34, "gender": "male", "duration": 3})
+        self.assertIn("Details already collected (do not ask again): Name: Ravi, Age: 34", messages[0]["content"])
+
+    def test_later_facts_are_merged_into_earlier_ones(self):
+        state = {"summary": "earlier", "summarized": 0, "facts": {"name": "Ravi", "age": 34}}
+        history = [{"role": "user", "content": "Now it has been since 5 days"}] + turns(11)
+        _, state = self.compact(history, state)
+        self.assertEqual(state["facts"], {"name": "Ravi", "age": 34, "duration": 5})
+
+    def test_summarize_locally_keeps_first_sentences_within_its_budget(self):
+        summary = compaction.summarize_locally("", [{"role": "user", "content": "Headache since noon. It is dull."}])
+        self.assertEqual(summary, "user: Headache since noon.")
+        summary = compaction.summarize_locally(summary, turns(10, words=10))
+        self.assertLessEqual(tokens.estimate_tokens(summary), 40)
+        # The oldest lines are dropped first
+        self.assertNotIn("Headache", summary)
+        self.assertTrue(summary.endswith("assistant: message 9 " + "word " * 7 + "word"))
+
+    def test_llm_summary(self):
+        with mock.patch.object(gateway, "chat", return_value="LLM summary") as chat:
+            self.assertEqual(compaction.summarize_with_llm("old", turns(2)), "LLM summary")
+        self.assertEqual(chat.call_args.kwargs["model"], compaction.DEFAULTS["SUMMARY_MODEL"])
+        self.assertIn("Current summary:\nold", chat.call_args.args[0][1]["content"])
+
+    def test_llm_failure_falls_back_to_the_local_summary(self):
+        history = turns(10)
+        with mock.patch.object(gateway, "chat", side_effect=gateway.LLMUnavailable("down")):
+            messages, state = compaction.compact_history(history)
+        self.assertEqual(state["summary"], compaction.summarize_locally("", history[:6]))
+        self.assertIn(state["summary"], messages[0]["content"])
+
+
+class ResolveTurnTests(TestCase):
+    def setUp(self):
+        throttling.reset_backend()
+        self.user = User.objects.create_user(username="amy", email="amy@example.com", password="x")
+        self.other = User.objects.create_user(username="bob", email="bob@example.com", password="x")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt(self.user)}")
+
+    def test_new_conversation_is_started(self):
+        conversation, history, user_message = _resolve_turn(self.user, {"message": " Hi "})
+        self.assertEqual(conversation.user, self.user)
+        self.assertEqual(user_message, {"role": "user", "content": "Hi"})
+        self.assertEqual(history, conversation.messages + [user_message])
+
+    def test_own_conversation_is_continued(self):
+        started = Conversation.start(self.user)
+        conversation, _, _ = _resolve_turn(self.user, {"message": "Hi", "conversation_id": str(started.pk)})
+        self.assertEqual(conversation, started)
+
+    def test_unknown_or_malformed_id_is_not_found(self):
+        for conversation_id in (12345, "abc"):
+            with self.subTest(conversation_id=conversation_id), self.assertRaises(NotFound):
+                _resolve_turn(self.user, {"message": "Hi", "conversation_id": conversation_id})
+
+    def test_another_users_conversation_is_not_found(self):
+        theirs = Conversation.start(self.other)
+        with self.assertRaises(NotFound):
+            _resolve_turn(self.user, {"message": "Hi", "conversation_id": theirs.pk})
+        response = self.client.post("/api/ai-check/", {"message": "Hi", "conversation_id": theirs.pk}, format="json")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Conversation not found"})
+        self.assertEqual(Conversation.objects.get(pk=theirs.pk).messages, theirs.messages)
+
+    def test_legacy_messages_are_stateless(self):
+        messages = [{"role": "user", "content": "I have a headache"}]
+        self.assertEqual(_resolve_turn(self.user, {"messages": messages}), (None, messages, None))
+        with mock.patch.object(gateway, "chat", return_value="Rest and drink water.") as chat:
+            response = self.client.post("/api/ai-check/", {"messages": messages}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"response": "Rest and drink water."})
+        self.assertEqual(chat.call_args.args[0][1:], messages)
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_missing_or_blank_message(self):
+        for data in ({}, {"messages": []}, {"message": "  "}, {"message": 3}):
+            with self.subTest(data=data), self.assertRaises(ParseError):
+                _resolve_turn(self.user, data)
+
+
+FULL_RECORD = {
+    "name": "Ravi", "age": 34, "gender": "male", "symptoms": "fever and cough", "duration": 5,
+    "severity": "high", "risk_score": 70, "complete": True,
+}
+
+
+class ConsultationRecordTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="amy", email="amy@example.com", password="x")
+        self.conversation = Conversation.start(self.user)
+        self.conversation.append({"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Tell me more."})
+
+    def save(self, record=None):
+        with transaction.atomic():
+            return save_consultation_record(self.conversation, record)
+
+    def rollup(self):
+        return DailyRollup.objects.get(user=self.user)
+
+    def terms(self):
+        return dict(DailyTerm.objects.filter(user=self.user, count__gt=0).values_list("term", "count"))
+
+    def test_data_block_fields_are_mapped(self):
+        self.conversation.prompt_version = "consultation@v2"
+        symptom = self.save(FULL_RECORD)
+        self.assertEqual(
+            (symptom.patient_name, symptom.age, symptom.gender, symptom.description, symptom.duration),
+            ("Ravi", 34, "male", "fever and cough", 5),
+        )
+        self.assertEqual((symptom.severity, symptom.risk_score), ("HIGH", 70))
+        self.assertEqual((symptom.user, symptom.conversation), (self.user, self.conversation))
+        self.assertEqual(symptom.ai_analysis, f"{self.conversation.messages[0]['content']}\n\nTell me more.")
+        self.assertEqual(symptom.prompt_version, "consultation@v2")
+
+    def test_missing_fields_get_create_defaults(self):
+        symptom = self.save({"age": 30, "name": ""})
+        self.assertEqual(symptom.age, 30)
+        for field, value in CREATE_DEFAULTS.items():
+            self.assertEqual(getattr(symptom, field), value)
+
+    def test_update_keeps_fields_the_record_leaves_out(self):
+        first = self.save(FULL_RECORD)
+        symptom = self.save({"name": "", "severity": "LOW", "risk_score": None})
+        self.assertEqual(symptom.pk, first.pk)
+        symptom.refresh_from_db()
+        self.assertEqual((symptom.patient_name, symptom.severity, symptom.risk_score), ("Ravi", "LOW", 70))
+        self.assertEqual(Symptom.objects.count(), 1)
+
+    def test_no_valid_record_only_refreshes_an_existing_analysis(self):
+        self.assertIsNone(self.save())
+        self.assertIsNone(self.save({"age": 500}))
+        self.assertFalse(Symptom.objects.exists())
+
+        symptom = self.save(FULL_RECORD)
+        self.conversation.append({"role": "user", "content": "And?"}, {"role": "assistant", "content": "Rest."})
+        self.save({"age": 500})
+        symptom.refresh_from_db()
+        self.assertEqual(symptom.age, 34)
+        self.assertTrue(symptom.ai_analysis.endswith("Tell me more.\n\nRest."))
+
+    def test_rollups_follow_the_record(self):
+        self.save({"age": 30})
+        row = self.rollup()
+        self.assertEqual((row.consultations, row.severity_medium, row.duration_count), (1, 1, 0))
+        # The placeholder description isn't a term
+        self.assertEqual(self.terms(), {})
+
+        self.save(FULL_RECORD)
+        row = self.rollup()
+        self.assertEqual((row.consultations, row.severity_medium, row.severity_high), (1, 0, 1))
+        self.assertEqual((row.risk_score_sum, row.duration_count, row.duration_4_7), (70, 1, 1))
+        self.assertEqual(self.terms(), {"fever": 1, "cough": 1})
+
+    def test_turn_and_record_roll_back_together(self):
+        before = list(self.conversation.messages)
+        state = self.conversation.compaction_state()
+        with mock.patch("analytics.rollups.Delta.apply", side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                _record_turn(self.conversation, {"role": "user", "content": "Fever"}, "Noted.", state, FULL_RECORD)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.messages, before)
+        self.assertFalse(Symptom.objects.exists())
+        self.assertFalse(DailyRollup.objects.exists())
+
+        record_id = _record_turn(self.conversation, {"role": "user", "content": "Fever"}, "Noted.", state, FULL_RECORD)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.messages[-1], {"role": "assistant", "content": "Noted."})
+        self.assertEqual(Symptom.objects.get().pk, record_id)
+        self.assertEqual(self.rollup().consultations, 1)
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import analyze_symptom
+from .views import analyze_symptom, analyze_symptom_stream, conversation_detail
 
 urlpatterns = [
     path('', analyze_symptom),
+    path('stream/', analyze_symptom_stream),
+    path('conversations/<int:pk>/', conversation_detail),
 ]
-
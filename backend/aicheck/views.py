@@ -1,68 +1,250 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from groq import Groq
-from django.conf import settings
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotFound, ParseError, Throttled
+from rest_framework.request import Request
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.db import transaction
+import json
+
+from llm import gateway, prompts
+from llm.throttling import (
+    UpstreamConcurrencyThrottle, UserConcurrencyThrottle, UserTokenBucketThrottle, check_throttles, deferred,
+)
+from jobs.views import enqueue_job, requested_webhook
+from users.authentication import JWTAuthentication
+from .compaction import compact_history, merge_facts, summarize_locally
+from .models import Conversation
+from .records import save_consultation_record
+from .serializers import ConversationSerializer
+from .streaming import DataBlockFilter, split_data_block, sse_event
+
+class AICheckRateThrottle(UserTokenBucketThrottle):
+    scope = 'ai_check'
+
+
+AI_CHECK_THROTTLES = [AICheckRateThrottle, UserConcurrencyThrottle, UpstreamConcurrencyThrottle]
+
+
+def _resolve_turn(user, data):
+    """
+    Work out the history for one chat turn.
+
+    Clients send ``{"message": ..., "conversation_id": ...}`` and the server
+    keeps the history (omit the id to start a new conversation). Legacy
+    clients that post the full ``messages`` list still work, statelessly.
+    Returns ``(conversation, history, user_message)``.
+    """
+    message = data.get('message')
+    if message is None:
+        messages = data.get('messages', [])
+        if not messages:
+            raise ParseError('Messages required')
+        return None, messages, None
+
+    if not isinstance(message, str) or not message.strip():
+        raise ParseError('Message required')
+
+    conversation_id = data.get('conversation_id')
+    if conversation_id:
+        try:
+            conversation = Conversation.objects.get(pk=conversation_id, user=user)
+        except (Conversation.DoesNotExist, ValueError, TypeError):
+            raise NotFound('Conversation not found')
+    else:
+        conversation = Conversation.start(user)
+
+    user_message = {"role": "user", "content": message.strip()}
+    return conversation, conversation.messages + [user_message], user_message
+
+
+def _build_prompt(user, conversation, history):
+    """
+    Prepend the system prompt to the history, compacted to the token budget.
+    Stateless requests get a local extractive summary so they never pay for
+    an extra LLM call. A conversation keeps the prompt version it started
+    with; otherwise the version comes from the registry (and its A/B split).
+    Returns ``(messages, state, prompt)``.
+    """
+    if conversation is None:
+        prompt = prompts.select('consultation', key=user.pk)
+        messages, state = compact_history(history, summarizer=summarize_locally)
+    else:
+        prompt = prompts.select('consultation', key=user.pk, stored=conversation.prompt_version)
+        messages, state = compact_history(history, conversation.compaction_state())
+    # Stored messages may carry a job_id, which the API doesn't accept
+    messages = [{'role': m['role'], 'content': m['content']} for m in messages]
+    return [prompt.message()] + messages, state, prompt
+
+
+def _record_turn(conversation, user_message, reply, state, record=None, prompt=None, job_id=None):
+    """
+    Store the turn and upsert the consultation record in one transaction.
+    Returns the Symptom id, if the conversation has one.
+    """
+    if conversation is None:
+        return None
+    if record:
+        state = {**state, "facts": merge_facts(state["facts"], record)}
+    with transaction.atomic():
+        appended = conversation.append(
+            user_message, {"role": "assistant", "content": reply},
+            state=state, prompt_version=prompt.id if prompt else None, job_id=job_id,
+        )
+        # Another run of the same job stored the turn first: keep its record
+        symptom = save_consultation_record(conversation, record if appended else None)
+    return symptom.pk if symptom else None
+
+
+def run_turn(user, data, job_id=None):
+    """
+    One chat turn, returning what analyze_symptom responds with. Raises
+    APIException for bad input and gateway.LLMError when the LLM fails; also
+    the body of queued ``ai_check`` jobs, which pass their ``job_id`` so a
+    job that runs again after its lease was reclaimed doesn't add the turn
+    twice.
+    """
+    conversation, history, user_message = _resolve_turn(user, data)
+    if job_id is not None and conversation is not None:
+        stored = conversation.job_reply(job_id)
+        if stored is not None:
+            with transaction.atomic():
+                symptom = save_consultation_record(conversation)
+            return {'response': stored['content'], 'conversation_id': conversation.pk,
+                    'record_id': symptom.pk if symptom else None}
+    full_messages, state, prompt = _build_prompt(user, conversation, history)
+    text = gateway.chat(full_messages, prompt=prompt)
+
+    visible, record = split_data_block(text)
+    record_id = _record_turn(conversation, user_message, visible, state, record, prompt, job_id)
+
+    result = {'response': text}
+    if conversation is not None:
+        result['conversation_id'] = conversation.pk
+        result['record_id'] = record_id
+    return result
+
+
+def _enqueue_turn(request):
+    """
+    Queue the turn as an ``ai_check`` job. The conversation is resolved (or
+    started) now so bad ids fail fast and the client gets its id straight away.
+    """
+    webhook_url = requested_webhook(request)
+    conversation, history, user_message = _resolve_turn(request.user, request.data)
+    if conversation is None:
+        return enqueue_job(request.user, 'ai_check', {'messages': history}, webhook_url)
+    payload = {'message': user_message['content'], 'conversation_id': conversation.pk}
+    return enqueue_job(request.user, 'ai_check', payload, webhook_url, conversation_id=conversation.pk)
 
-# Initialize Groq client
-client = Groq(api_key=settings.GROQ_API_KEY)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes(AI_CHECK_THROTTLES)
 def analyze_symptom(request):
-    messages = request.data.get('messages', [])
-    if not messages:
-        return Response({'error': 'Messages required'}, status=status.HTTP_400_BAD_REQUEST)
-
-    system_prompt = (
-        "You are MiniMedi, a warm and professional AI health assistant with dual capabilities:\n\n"
-        
-        "🔍 CONVERSATION ANALYSIS:\n"
-        "First, analyze the ENTIRE conversation context to determine the user's intent:\n"
-        "- HEALTH CONSULTATION: User mentions symptoms, feeling unwell, medical concerns, or explicitly wants health assessment\n"
-        "- GENERAL QUESTION: Greetings, general health tips, non-medical questions, casual conversation\n\n"
-        
-        "📋 MODE 1 - CHATGPT MODE (General Questions):\n"
-        "When user asks general questions, health tips, or casual conversation:\n"
-        "- Respond naturally and directly like ChatGPT\n"
-        "- Be helpful, friendly, and informative\n"
-        "- Provide concise, useful answers\n"
-        "- NO structured data collection\n"
-        "- NO DATA block required\n"
-        "- Examples: 'What is diabetes?', 'Give me health tips', 'Hello!'\n\n"
-        
-        "🏥 MODE 2 - HEALTH CONSULTATION MODE (Medical Queries):\n"
-        "When user mentions symptoms or requests health assessment:\n"
-        "- Switch to structured consultation flow\n"
-        "- Gather: Name, Symptoms, Age, Gender, Duration\n"
-        "- Start by asking for name if unknown\n"
-        "- Address user by name in every response once known\n"
-        "- Dynamically extract info from natural speech (e.g., 'I'm 20 and have cold' → Age: 20, Symptom: cold)\n"
-        "- DO NOT repeat questions for info already provided\n"
-        "- Once all fields collected, provide detailed analysis with 5 possible causes and 3 precautions\n"
-        "- End with: 'Thank you [Name]! I have saved this consultation to your history for your records.'\n"
-        "- MUST append: ###DATA_START###{\"name\": \"...\", \"age\": 0, \"gender\": \"...\", \"symptoms\": \"...\", \"duration\": 0, \"complete\": true}###DATA_END###\n\n"
-        
-        "⚡ INTELLIGENCE RULES:\n"
-        "1. Read the FULL conversation history before responding\n"
-        "2. If user is just chatting → ChatGPT Mode\n"
-        "3. If user mentions symptoms/health issues → Health Consultation Mode\n"
-        "4. Once in Health Consultation Mode, stay in it until complete\n"
-        "5. Be context-aware and switch modes naturally\n"
-        "6. Never ask 'which mode' - detect automatically\n\n"
-        
-        "Remember: Be smart about detecting intent. Natural conversation = ChatGPT Mode. Health concerns = Consultation Mode."
-    )
-
-    full_messages = [{"role": "system", "content": system_prompt}] + messages
+    try:
+        if deferred(request):
+            return _enqueue_turn(request)
+        return Response(run_turn(request.user, request.data))
+    except APIException as e:
+        return Response({'error': str(e.detail)}, status=e.status_code)
+    except gateway.LLMBusy as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except gateway.LLMError:
+        return Response({'error': gateway.UNAVAILABLE_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def conversation_detail(request, pk):
     try:
-        chat_completion = client.chat.completions.create(
-            messages=full_messages,
-            model="llama-3.3-70b-versatile",
-        )
-        text = chat_completion.choices[0].message.content.strip()
-        return Response({'response': text})
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        conversation = Conversation.objects.get(pk=pk, user=request.user)
+    except Conversation.DoesNotExist:
+        return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'DELETE':
+        conversation.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    return Response(ConversationSerializer(conversation).data)
+
+
+@csrf_exempt
+async def analyze_symptom_stream(request):
+    """
+    Streaming variant of analyze_symptom. Tokens are sent as Server-Sent
+    Events while the DATA trailer is held back and delivered as a final
+    ``record`` event. Runs natively under ASGI (minimedi.asgi).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'error': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if auth is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+    user = auth[0]
+
+    drf_request = Request(request)
+    drf_request.user = user
+    try:
+        await sync_to_async(check_throttles)(drf_request, AI_CHECK_THROTTLES)
+    except Throttled as e:
+        response = JsonResponse({'error': str(e.detail)}, status=e.status_code)
+        if e.wait is not None:
+            response['Retry-After'] = str(int(e.wait))
+        return response
+
+    try:
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        conversation, history, user_message = await sync_to_async(_resolve_turn)(user, data)
+    except APIException as e:
+        return JsonResponse({'error': str(e.detail)}, status=e.status_code)
+
+    full_messages, state, prompt = await sync_to_async(_build_prompt)(user, conversation, history)
+
+    async def event_stream():
+        data_filter = DataBlockFilter()
+        try:
+            async for delta in gateway.astream(full_messages, prompt=prompt):
+                text = data_filter.feed(delta)
+                if text:
+                    yield sse_event('token', {'text': text})
+        except gateway.LLMBusy as e:
+            yield sse_event('error', {'error': str(e)})
+            return
+        except Exception:
+            # Includes connection drops after the stream has started
+            yield sse_event('error', {'error': gateway.UNAVAILABLE_MESSAGE})
+            return
+
+        text, record = data_filter.close()
+        if text:
+            yield sse_event('token', {'text': text})
+
+        visible = data_filter.visible.strip()
+        record_id = await sync_to_async(_record_turn)(conversation, user_message, visible, state, record, prompt)
+        if record is not None:
+            yield sse_event('record', {**record, 'record_id': record_id})
+
+        done = {'response': visible}
+        if conversation is not None:
+            done['conversation_id'] = conversation.pk
+            done['record_id'] = record_id
+        yield sse_event('done', done)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
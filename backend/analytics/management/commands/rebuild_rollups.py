@@ -0,0 +1,34 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from analytics import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-day analytics rollups from the symptom table, a chunk of users "
+        "per transaction. Use after a backfill or whenever the rollups have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="only this user id (repeatable)")
+        parser.add_argument("--chunk-size", type=int, default=None, help="users per transaction")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"] or rollups.get_config("REBUILD_CHUNK")
+        users = User.objects.order_by("pk")
+        if options["users"]:
+            users = users.filter(pk__in=options["users"])
+
+        started, done, last = time.perf_counter(), 0, 0
+        while True:
+            # Keyset over user ids so each chunk is one indexed range
+            ids = list(users.filter(pk__gt=last).values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                break
+            rollups.rebuild(ids)
+            done, last = done + len(ids), ids[-1]
+            self.stdout.write(f"{done} users rebuilt")
+        self.stdout.write(f"Rebuilt rollups for {done} users in {time.perf_counter() - started:.1f}s")
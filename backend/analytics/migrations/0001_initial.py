@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('consultations', models.IntegerField(default=0)),
+                ('severity_low', models.IntegerField(default=0)),
+                ('severity_medium', models.IntegerField(default=0)),
+                ('severity_high', models.IntegerField(default=0)),
+                ('risk_score_sum', models.IntegerField(default=0)),
+                ('duration_count', models.IntegerField(default=0)),
+                ('duration_sum', models.IntegerField(default=0)),
+                ('duration_0_1', models.IntegerField(default=0)),
+                ('duration_2_3', models.IntegerField(default=0)),
+                ('duration_4_7', models.IntegerField(default=0)),
+                ('duration_8_14', models.IntegerField(default=0)),
+                ('duration_15_30', models.IntegerField(default=0)),
+                ('duration_31_plus', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='rollup_user_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('term', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'term'), name='term_user_day_uniq')],
+            },
+        ),
+    ]
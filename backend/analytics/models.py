@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class DailyRollup(models.Model):
+    """
+    One user's symptom records for one (local) day, kept up to date by
+    analytics.rollups. Every column is a count or a sum, so changes are
+    applied as additive deltas.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+
+    consultations = models.IntegerField(default=0)
+    severity_low = models.IntegerField(default=0)
+    severity_medium = models.IntegerField(default=0)
+    severity_high = models.IntegerField(default=0)
+    risk_score_sum = models.IntegerField(default=0)
+
+    # Records that reported a duration, their total, and how they spread
+    # over the ranges in rollups.DURATION_BUCKETS
+    duration_count = models.IntegerField(default=0)
+    duration_sum = models.IntegerField(default=0)
+    duration_0_1 = models.IntegerField(default=0)
+    duration_2_3 = models.IntegerField(default=0)
+    duration_4_7 = models.IntegerField(default=0)
+    duration_8_14 = models.IntegerField(default=0)
+    duration_15_30 = models.IntegerField(default=0)
+    duration_31_plus = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index behind every per-user range read
+            models.UniqueConstraint(fields=['user', 'day'], name='rollup_user_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day}: {self.consultations}"
+
+
+class DailyTerm(models.Model):
+    """How often a symptom term was reported by one user on one day."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_terms')
+    day = models.DateField()
+    term = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'term'], name='term_user_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.term}: {self.count}"
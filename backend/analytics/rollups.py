@@ -0,0 +1,229 @@
+"""
+Incremental per-user, per-day aggregates of the symptom history.
+
+Code that writes Symptom rows describes the change as a ``Delta`` and applies
+it in the same transaction::
+
+    delta = rollups.Delta().remove(symptom)  # before the change
+    ...save...
+    delta.add(symptom).apply()
+
+A delta is folded by (user, day) before it is written, and the touched rows
+are updated with ``INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col``,
+so concurrent writers never lose an update and a change that touches no
+aggregated field writes nothing. Days are local dates (settings.TIME_ZONE).
+
+Writes that bypass these calls (the admin, raw SQL) leave the rollups stale
+until ``manage.py rebuild_rollups`` recomputes them from the Symptom table.
+"""
+import re
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from symptoms.models import Symptom
+from .models import DailyRollup, DailyTerm
+
+DEFAULTS = {
+    "MAX_TERMS": 5,        # symptom terms counted per record
+    "TOP_TERMS": 10,       # terms returned by the summary API
+    "DEFAULT_DAYS": 84,    # summary range when none is given
+    "MAX_DAYS": 731,
+    "REBUILD_CHUNK": 500,  # users recomputed per transaction
+}
+
+# (upper bound in days, column); None catches everything longer
+DURATION_BUCKETS = [
+    (1, "duration_0_1"),
+    (3, "duration_2_3"),
+    (7, "duration_4_7"),
+    (14, "duration_8_14"),
+    (30, "duration_15_30"),
+    (None, "duration_31_plus"),
+]
+SEVERITY_COLUMNS = {"LOW": "severity_low", "MEDIUM": "severity_medium", "HIGH": "severity_high"}
+ROLLUP_COLUMNS = [
+    f.column for f in DailyRollup._meta.concrete_fields if f.column not in ("id", "user_id", "day")
+]
+
+# Fields a record's contribution depends on
+SOURCE_FIELDS = ["user", "created_at", "severity", "risk_score", "duration", "description"]
+
+# "fever, headache and nausea" -> fever / headache / nausea
+_TERM_SEPARATORS = re.compile(r"[,;/\n]|\band\b|\bwith\b", re.IGNORECASE)
+MAX_TERM_WORDS = 4
+# Placeholder description of a consultation record that isn't filled in yet
+IGNORED_TERMS = {"in progress"}
+
+
+def get_config(name):
+    return getattr(settings, "ANALYTICS", {}).get(name, DEFAULTS[name])
+
+
+def day_of(created_at):
+    return timezone.localdate(created_at)
+
+
+def terms(description):
+    """Short symptom phrases in a free-text description, lower-cased, first seen first."""
+    found = []
+    for part in _TERM_SEPARATORS.split(description or ""):
+        term = " ".join(part.lower().split()).strip(" .!?-")
+        if (
+            term
+            and term not in IGNORED_TERMS
+            and term not in found
+            and len(term) <= DailyTerm._meta.get_field("term").max_length
+            and len(term.split()) <= MAX_TERM_WORDS
+        ):
+            found.append(term)
+    return found[:get_config("MAX_TERMS")]
+
+
+def columns_for(symptom):
+    """``{column: value}`` that one record adds to its day's rollup."""
+    columns = {"consultations": 1, "risk_score_sum": symptom.risk_score or 0}
+    severity = SEVERITY_COLUMNS.get((symptom.severity or "").upper())
+    if severity:
+        columns[severity] = 1
+    if symptom.duration is not None:
+        columns["duration_count"] = 1
+        columns["duration_sum"] = symptom.duration
+        for bound, column in DURATION_BUCKETS:
+            if bound is None or symptom.duration <= bound:
+                columns[column] = 1
+                break
+    return columns
+
+
+def _upsert(connection, model, keys, columns, rows):
+    """Add each row's column values onto the existing row with the same keys, inserting missing ones."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    names = keys + columns
+    updates = ", ".join(f"{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}" for c in columns)
+    # Stay under SQLite's default limit of 999 bound parameters
+    batch_size = max(1, 999 // len(names))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            values = ", ".join(["(" + ", ".join(["%s"] * len(names)) + ")"] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(qn(n) for n in names)}) VALUES {values} "
+                f"ON CONFLICT ({', '.join(qn(k) for k in keys)}) DO UPDATE SET {updates}",
+                [value for row in batch for value in row],
+            )
+
+
+class Delta:
+    """Pending changes to the rollups, folded by (user, day)."""
+
+    def __init__(self):
+        self.rollups = defaultdict(Counter)  # (user_id, day) -> {column: delta}
+        self.terms = Counter()               # (user_id, day, term) -> delta
+
+    def _count(self, symptom, sign):
+        if symptom.user_id is None:
+            return
+        day = day_of(symptom.created_at)
+        counts = self.rollups[(symptom.user_id, day)]
+        for column, value in columns_for(symptom).items():
+            counts[column] += sign * value
+        for term in terms(symptom.description):
+            self.terms[(symptom.user_id, day, term)] += sign
+
+    def add(self, *symptoms):
+        for symptom in symptoms:
+            self._count(symptom, 1)
+        return self
+
+    def remove(self, *symptoms):
+        """Take records out, e.g. before they are deleted or changed (values are read now)."""
+        for symptom in symptoms:
+            self._count(symptom, -1)
+        return self
+
+    def apply(self, using=None):
+        connection = connections[using or router.db_for_write(DailyRollup)]
+        day = connection.ops.adapt_datefield_value
+        _upsert(
+            connection, DailyRollup, ["user_id", "day"], ROLLUP_COLUMNS,
+            [
+                (user_id, day(d), *(counts[c] for c in ROLLUP_COLUMNS))
+                for (user_id, d), counts in self.rollups.items()
+                if any(counts.values())
+            ],
+        )
+        _upsert(
+            connection, DailyTerm, ["user_id", "day", "term"], ["count"],
+            [(user_id, day(d), term, count) for (user_id, d, term), count in self.terms.items() if count],
+        )
+        self.rollups.clear()
+        self.terms.clear()
+
+
+def clear(user):
+    """Drop all of ``user``'s rollups (their whole history was deleted)."""
+    DailyRollup.objects.filter(user=user).delete()
+    DailyTerm.objects.filter(user=user).delete()
+
+
+def rebuild(user_ids):
+    """
+    Recompute the rollups of ``user_ids`` from their records in one
+    transaction. Records those users write while it runs may be counted
+    twice, so run it when they are quiet (or run it again).
+    """
+    with transaction.atomic():
+        DailyRollup.objects.filter(user_id__in=user_ids).delete()
+        DailyTerm.objects.filter(user_id__in=user_ids).delete()
+        delta = Delta()
+        for symptom in Symptom.objects.filter(user_id__in=user_ids).only(*SOURCE_FIELDS).iterator(chunk_size=2000):
+            delta.add(symptom)
+        delta.apply()
+
+
+# =========================
+# READ SIDE
+# =========================
+def summarize(rows):
+    """Dashboard figures for a sequence of DailyRollup rows."""
+    total = Counter()
+    for row in rows:
+        for column in ROLLUP_COLUMNS:
+            total[column] += getattr(row, column)
+    consultations, reported = total["consultations"], total["duration_count"]
+    return {
+        "consultations": consultations,
+        "severity": {name: total[column] for name, column in SEVERITY_COLUMNS.items()},
+        "avg_risk_score": round(total["risk_score_sum"] / consultations, 1) if consultations else None,
+        "duration": {
+            "reported": reported,
+            "avg_days": round(total["duration_sum"] / reported, 1) if reported else None,
+            "buckets": {column.removeprefix("duration_"): total[column] for _, column in DURATION_BUCKETS},
+        },
+    }
+
+
+def period_start(day, period):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def series(rows, start, end, period):
+    """``summarize`` per day or per week (Monday first) from ``start`` to ``end``, gaps included."""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[period_start(row.day, period)].append(row)
+    step = timedelta(days=7 if period == "week" else 1)
+    points, current = [], period_start(start, period)
+    while current <= end:
+        points.append({"start": current.isoformat(), **summarize(grouped.get(current, []))})
+        current += step
+    return points
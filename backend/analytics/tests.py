@@ -0,0 +1,146 @@
+from datetime import datetime, time, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from symptoms.models import Symptom
+from users.views import create_jwt
+from . import rollups
+from .models import DailyRollup, DailyTerm
+
+
+def at(day):
+    return timezone.make_aware(datetime.combine(day, time(12)))
+
+
+class RollupTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='Secret#1')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.user)}')
+
+    def log(self, **data):
+        response = self.client.post('/api/symptoms/', {'title': 'Check', **data}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def rollup(self):
+        return DailyRollup.objects.get(user=self.user, day=timezone.localdate())
+
+    def term_counts(self):
+        return dict(DailyTerm.objects.filter(user=self.user, count__gt=0).values_list('term', 'count'))
+
+    def snapshot(self):
+        return (
+            sorted(DailyRollup.objects.filter(user=self.user).values_list('day', *rollups.ROLLUP_COLUMNS)),
+            sorted(DailyTerm.objects.filter(user=self.user, count__gt=0).values_list('day', 'term', 'count')),
+        )
+
+
+class IncrementalRollupTests(RollupTestCase):
+    def test_create_adds_to_the_day(self):
+        self.log(severity='HIGH', risk_score=70, duration=5, description='Fever, headache and nausea')
+        self.log(severity='LOW', risk_score=10, description='fever')
+        row = self.rollup()
+        self.assertEqual((row.consultations, row.severity_high, row.severity_low), (2, 1, 1))
+        self.assertEqual((row.risk_score_sum, row.duration_count, row.duration_4_7), (80, 1, 1))
+        self.assertEqual(self.term_counts(), {'fever': 2, 'headache': 1, 'nausea': 1})
+
+    def test_patch_moves_the_record(self):
+        pk = self.log(severity='LOW', duration=2, description='cough')
+        self.client.patch(f'/api/symptoms/{pk}/', {'severity': 'HIGH', 'duration': 20, 'description': 'rash'}, format='json')
+        row = self.rollup()
+        self.assertEqual((row.consultations, row.severity_low, row.severity_high), (1, 0, 1))
+        self.assertEqual((row.duration_2_3, row.duration_15_30), (0, 1))
+        self.assertEqual(self.term_counts(), {'rash': 1})
+
+    def test_patch_without_aggregated_fields_writes_nothing(self):
+        pk = self.log(description='cough')
+        # The user is cached by now: get, savepoint, update, release
+        with self.assertNumQueries(4):
+            self.client.patch(f'/api/symptoms/{pk}/', {'title': 'Renamed'}, format='json')
+
+    def test_delete_and_clear_all(self):
+        pk = self.log(severity='MEDIUM', description='cough')
+        self.log(severity='MEDIUM', description='cough')
+        self.client.delete(f'/api/symptoms/{pk}/')
+        self.assertEqual((self.rollup().consultations, self.rollup().severity_medium), (1, 1))
+        self.assertEqual(self.term_counts(), {'cough': 1})
+
+        self.client.delete('/api/symptoms/clear-all/')
+        self.assertFalse(DailyRollup.objects.filter(user=self.user).exists())
+        self.assertFalse(DailyTerm.objects.filter(user=self.user).exists())
+
+    def test_rebuild_matches_incremental(self):
+        for severity in ('LOW', 'HIGH', 'HIGH'):
+            self.log(severity=severity, risk_score=40, duration=1, description='fever and chills')
+        incremental = self.snapshot()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_repairs_drift(self):
+        self.log(severity='LOW', description='fever')
+        self.log(severity='LOW', description='fever')
+        # A write that bypasses the rollups
+        Symptom.objects.filter(user=self.user).update(severity='MEDIUM')
+        call_command('rebuild_rollups', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual((self.rollup().severity_low, self.rollup().severity_medium), (0, 2))
+        self.assertEqual(self.term_counts(), {'fever': 2})
+
+
+class TermTests(TestCase):
+    def test_terms(self):
+        self.assertEqual(rollups.terms('Fever, headache and nausea.'), ['fever', 'headache', 'nausea'])
+        self.assertEqual(rollups.terms('In progress...'), [])
+        self.assertEqual(rollups.terms('pain with swelling; pain'), ['pain', 'swelling'])
+        self.assertEqual(rollups.terms('I have had a really bad pain for days'), [])
+
+
+class SummaryApiTests(RollupTestCase):
+    def setUp(self):
+        super().setUp()
+        self.monday = timezone.localdate() - timedelta(days=timezone.localdate().weekday() + 14)
+        for offset, severity, description in ((0, 'HIGH', 'fever'), (1, 'LOW', 'fever, cough'), (15, 'LOW', 'cough')):
+            pk = self.log(severity=severity, risk_score=30, duration=offset, description=description)
+            Symptom.objects.filter(pk=pk).update(created_at=at(self.monday + timedelta(days=offset)))
+        call_command('rebuild_rollups', stdout=StringIO())
+
+    def summary(self, **params):
+        return self.client.get('/api/analytics/summary/', params)
+
+    def test_weekly_series(self):
+        end = self.monday + timedelta(days=20)
+        data = self.summary(**{'from': self.monday.isoformat(), 'to': end.isoformat()}).data
+        self.assertEqual([p['consultations'] for p in data['series']], [2, 0, 1])
+        self.assertEqual(data['series'][0]['severity'], {'LOW': 1, 'MEDIUM': 0, 'HIGH': 1})
+        self.assertEqual(data['totals']['avg_risk_score'], 30)
+        self.assertEqual(data['totals']['duration']['buckets']['15_30'], 1)
+        self.assertEqual(data['top_symptoms'], [{'term': 'cough', 'count': 2}, {'term': 'fever', 'count': 2}])
+
+    def test_cost_does_not_grow_with_records(self):
+        Symptom.objects.bulk_create([Symptom(user=self.user, title='Old', description='fever') for _ in range(200)])
+        call_command('rebuild_rollups', stdout=StringIO())
+        # Daily rows and top terms (the user is already cached)
+        with self.assertNumQueries(2):
+            data = self.summary(period='day').data
+        self.assertEqual(len(data['series']), rollups.get_config('DEFAULT_DAYS'))
+        self.assertEqual(data['totals']['consultations'], 203)
+
+    def test_invalid_ranges(self):
+        self.assertEqual(self.summary(**{'from': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.summary(**{'from': '2026-02-30'}).status_code, 400)
+        self.assertEqual(self.summary(**{'from': '2026-05-02', 'to': '2026-05-01'}).status_code, 400)
+        self.assertEqual(self.summary(**{'from': '2020-01-01', 'to': '2026-01-01'}).status_code, 400)
+        self.assertEqual(self.summary(period='month').status_code, 400)
+
+    def test_other_users_are_not_counted(self):
+        other = User.objects.create_user(username='bob', email='bob@example.com', password='Secret#1')
+        Symptom.objects.create(user=other, title='x', description='fever')
+        call_command('rebuild_rollups', '--user', str(other.pk), stdout=StringIO())
+        self.assertEqual(self.summary(period='day').data['totals']['consultations'], 3)
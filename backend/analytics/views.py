@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import DailyRollup, DailyTerm
+from . import rollups
+
+PERIODS = ('day', 'week')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def summary(request):
+    """
+    Trends for the user's history between ``from`` and ``to`` (inclusive
+    local dates, default the last ``DEFAULT_DAYS``), grouped by ``period``
+    (``week`` or ``day``). Answered from the daily rollups, so the cost grows
+    with the number of days, not records.
+    """
+    today = timezone.localdate()
+    try:
+        end = parse_date(request.query_params['to']) if 'to' in request.query_params else today
+        start = (
+            parse_date(request.query_params['from']) if 'from' in request.query_params
+            else end - timedelta(days=rollups.get_config('DEFAULT_DAYS') - 1)
+        )
+    except ValueError:
+        start = end = None
+    if start is None or end is None:
+        return Response({'error': 'from and to must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end:
+        return Response({'error': 'from must not be after to'}, status=status.HTTP_400_BAD_REQUEST)
+    if (end - start).days >= rollups.get_config('MAX_DAYS'):
+        return Response({'error': f"Range is limited to {rollups.get_config('MAX_DAYS')} days"}, status=status.HTTP_400_BAD_REQUEST)
+    period = request.query_params.get('period', 'week')
+    if period not in PERIODS:
+        return Response({'error': f"period must be one of: {', '.join(PERIODS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = list(DailyRollup.objects.filter(user=request.user, day__range=(start, end)).order_by('day'))
+    top = (
+        DailyTerm.objects.filter(user=request.user, day__range=(start, end))
+        .values('term')
+        .annotate(total=Sum('count'))
+        .filter(total__gt=0)
+        .order_by('-total', 'term')[:rollups.get_config('TOP_TERMS')]
+    )
+    return Response({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'period': period,
+        'totals': rollups.summarize(rows),
+        'series': rollups.series(rows, start, end, period),
+        'top_symptoms': [{'term': t['term'], 'count': t['total']} for t in top],
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,29 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued LLM jobs (requests sent with Prefer: respond-async). Start as "
+        "many of these processes as the LLM quota allows; they share the queue "
+        "through the database. SIGTERM/SIGINT finish the current job, then exit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=1, help="jobs claimed per query")
+        parser.add_argument("--kind", action="append", dest="kinds", help="only run this job kind (repeatable)")
+        parser.add_argument("--sleep", type=float, default=None, help="seconds to wait when the queue is empty")
+        parser.add_argument("--drain", action="store_true", help="exit once no job is eligible")
+        parser.add_argument("--max-jobs", type=int, default=None, help="exit after this many jobs (for recycling)")
+
+    def handle(self, *args, **options):
+        worker = Worker(batch=options["batch"], kinds=options["kinds"], idle_sleep=options["sleep"])
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+
+        self.stdout.write(f"Worker {worker.name} waiting for jobs")
+        worker.run(drain=options["drain"], max_jobs=options["max_jobs"])
+        self.stdout.write(f"Worker {worker.name} stopped after {worker.processed} jobs")
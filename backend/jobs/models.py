@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, SUCCEEDED, FAILED)]
+    FINISHED = (SUCCEEDED, FAILED)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=50)  # key of jobs.tasks.TASKS
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+
+    # Outcome: ``result`` is what the synchronous endpoint would have
+    # returned; ``error`` is safe to show to the client
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    # Scheduling: a queued job is eligible once run_after has passed; a
+    # running job whose lease expired (worker died) is eligible again
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    lease_until = models.DateTimeField(null=True, blank=True)
+
+    webhook_url = models.URLField(max_length=500, blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The claim query: oldest eligible queued job first
+            models.Index(fields=['status', 'run_after', 'id'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
@@ -0,0 +1,107 @@
+"""
+Database-backed job queue.
+
+Jobs live in the ``jobs_job`` table, so there is nothing else to run. Workers
+(``manage.py run_jobs``) claim jobs in small batches:
+
+* On PostgreSQL the claim is ``SELECT ... FOR UPDATE SKIP LOCKED`` followed by
+  an UPDATE in the same transaction, so concurrent workers never block on or
+  double-claim a row.
+* Databases without SKIP LOCKED (SQLite) use a compare-and-set UPDATE on the
+  row as it was read; writes are serialized there, so only one worker's
+  UPDATE matches.
+
+A claim takes a lease. A worker that dies mid-job leaves the row RUNNING with
+an expired lease and the next claim picks it up again. ``attempts`` is
+bumped on every claim and doubles as a fencing token: a worker whose lease
+was taken over can no longer write the outcome.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+DEFAULTS = {
+    "MAX_ATTEMPTS": 3,       # claims per job, retries of transient LLM errors included
+    "RETRY_BACKOFF": 5.0,    # seconds before the first retry, doubled each time
+    "LEASE": 300,            # seconds a claimed job stays with its worker
+    "IDLE_SLEEP": 1.0,       # worker sleep when the queue is empty
+    "POLL_INTERVAL": 0.5,    # how often a long-poll re-reads the job
+    "MAX_WAIT": 30,          # longest long-poll, in seconds
+    "WEBHOOK_HOSTS": [],     # hosts results may be POSTed to; empty disables webhooks
+    "WEBHOOK_TIMEOUT": 5.0,
+    "WEBHOOK_SECRET": None,  # HMAC key for X-MiniMedi-Signature; defaults to SECRET_KEY
+}
+
+
+def get_config(name):
+    return getattr(settings, "JOBS", {}).get(name, DEFAULTS[name])
+
+
+def enqueue(user, kind, payload, webhook_url=''):
+    return Job.objects.create(user=user, kind=kind, payload=payload, webhook_url=webhook_url)
+
+
+def _eligible(now, kinds=None):
+    jobs = Job.objects.filter(
+        Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, lease_until__lt=now)
+    )
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.order_by('id')
+
+
+def claim(worker, limit=1, kinds=None):
+    """Claim up to ``limit`` eligible jobs for ``worker`` and return them, oldest first."""
+    now = timezone.now()
+    claimed = {
+        'status': Job.RUNNING,
+        'locked_by': worker,
+        'lease_until': now + timedelta(seconds=get_config("LEASE")),
+        'attempts': F('attempts') + 1,
+        'started_at': now,
+    }
+
+    if connections[Job.objects.db].features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_eligible(now, kinds).select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed)
+    else:
+        ids = []
+        for seen in _eligible(now, kinds).values('id', 'status', 'attempts')[:limit * 4]:
+            if Job.objects.filter(**seen).update(**claimed):
+                ids.append(seen['id'])
+                if len(ids) == limit:
+                    break
+
+    return list(Job.objects.select_related('user').filter(pk__in=ids).order_by('id'))
+
+
+def _settle(job, **fields):
+    """Write the outcome unless another worker has claimed the job since."""
+    updated = Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(
+        lease_until=None, updated_at=timezone.now(), **fields
+    )
+    for name, value in fields.items():
+        setattr(job, name, value)
+    return bool(updated)
+
+
+def succeed(job, result):
+    return _settle(job, status=Job.SUCCEEDED, result=result, status_code=200, finished_at=timezone.now())
+
+
+def fail(job, error, status_code):
+    return _settle(job, status=Job.FAILED, error=error, status_code=status_code, finished_at=timezone.now())
+
+
+def retry(job):
+    """Put the job back with exponential backoff. Returns False once attempts are used up."""
+    if job.attempts >= get_config("MAX_ATTEMPTS"):
+        return False
+    delay = get_config("RETRY_BACKOFF") * 2 ** (job.attempts - 1)
+    return _settle(job, status=Job.QUEUED, run_after=timezone.now() + timedelta(seconds=delay))
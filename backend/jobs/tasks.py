@@ -0,0 +1,36 @@
+"""
+What each job kind runs. A task takes ``(user, payload, job_id)`` and returns
+the body the synchronous endpoint would have answered with. It raises
+TaskError for failures that retrying won't fix and lets gateway.LLMError
+through so the worker can retry it. A job can run more than once (its lease
+ran out), so tasks must be idempotent per ``job_id``.
+"""
+from rest_framework.exceptions import APIException
+
+
+class TaskError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def ai_check(user, payload, job_id):
+    from aicheck.views import run_turn
+
+    try:
+        return run_turn(user, payload, job_id)
+    except APIException as e:
+        raise TaskError(str(e.detail), e.status_code)
+
+
+def symptom_check(user, payload, job_id):
+    from symptoms.analysis import analyze
+
+    return analyze(payload['description'])
+
+
+TASKS = {
+    'ai_check': ai_check,
+    'symptom_check': symptom_check,
+}
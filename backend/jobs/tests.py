@@ -0,0 +1,205 @@
+import hashlib
+import hmac
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from aicheck.models import Conversation
+from llm import gateway, resilience, throttling
+from llm.cache import get_response_cache
+from llm.fakeserver import FakeLLMServer
+from users.views import create_jwt
+from . import queue
+from .models import Job
+from .worker import Worker
+
+User = get_user_model()
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.received.append((self.headers["X-MiniMedi-Signature"], body))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.llm = FakeLLMServer(("127.0.0.1", 0), latency="fixed:0", ttft="fixed:0", tokens_per_second=0)
+        cls.hooks = ThreadingHTTPServer(("127.0.0.1", 0), WebhookReceiver)
+        for server in (cls.llm, cls.hooks):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            GROQ_API_KEY="test",
+            LLM_GATEWAY={"BASE_URL": f"http://127.0.0.1:{cls.llm.server_port}"},
+            LLM_RESILIENCE={"MAX_ATTEMPTS": 1, "FALLBACK_MODELS": {}},
+            LLM_THROTTLE={},
+            JOBS={"RETRY_BACKOFF": 0, "POLL_INTERVAL": 0.05, "WEBHOOK_HOSTS": ["127.0.0.1"]},
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        for server in (cls.llm, cls.hooks):
+            server.shutdown()
+            server.server_close()
+        gateway.reset()
+        super().tearDownClass()
+
+    def setUp(self):
+        # The worker drops connections that aren't in autocommit, which inside
+        # a test's transaction closes the real PostgreSQL connection
+        patcher = mock.patch("jobs.worker.close_old_connections")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        gateway.reset()
+        resilience.reset_breakers()
+        throttling.reset_backend()
+        get_response_cache().clear()
+        self.llm.error_rate = 0.0
+        WebhookReceiver.received = []
+        self.user = User.objects.create_user(username="patient", email="patient@example.com", password="x")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + create_jwt(self.user))
+
+    def enqueue_check(self, **data):
+        return self.client.post(
+            "/api/symptoms/check/", {"description": "headache and fever", **data},
+            format="json", HTTP_PREFER="respond-async",
+        )
+
+    def test_symptom_check_is_queued_and_run_by_worker(self):
+        calls = self.llm.requests
+        response = self.enqueue_check()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Location"], response.data["result_url"])
+        self.assertEqual(self.llm.requests, calls)
+
+        Worker(idle_sleep=0).run(drain=True)
+
+        job = self.client.get(response["Location"]).json()
+        self.assertEqual(job["status"], Job.SUCCEEDED)
+        self.assertEqual(job["result"]["severity"], "MEDIUM")
+        self.assertIn("Viral infection", job["result"]["suggestions"])
+
+    def test_ai_check_job_continues_the_conversation(self):
+        response = self.client.post("/api/ai-check/?async=1", {"message": "I have a headache"}, format="json")
+        self.assertEqual(response.status_code, 202)
+        conversation_id = response.data["conversation_id"]
+
+        Worker(idle_sleep=0).run(drain=True)
+
+        job = self.client.get(response["Location"]).json()
+        self.assertEqual(job["status"], Job.SUCCEEDED)
+        self.assertEqual(job["result"]["conversation_id"], conversation_id)
+
+    def test_reclaimed_ai_check_job_does_not_repeat_the_turn(self):
+        response = self.client.post("/api/ai-check/?async=1", {"message": "I have a headache"}, format="json")
+        Worker(idle_sleep=0).run(drain=True)
+        conversation = Conversation.objects.get(pk=response.data["conversation_id"])
+        calls = self.llm.requests
+
+        # As if the first worker stalled past its lease after storing the turn
+        job = Job.objects.get()
+        Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, result=None)
+        Worker(idle_sleep=0).run(drain=True)
+
+        conversation.refresh_from_db()
+        self.assertEqual([m["role"] for m in conversation.messages], ["assistant", "user", "assistant"])
+        self.assertEqual(self.llm.requests, calls)
+        job = self.client.get(response["Location"]).json()
+        self.assertEqual(job["status"], Job.SUCCEEDED)
+        self.assertEqual(job["result"]["response"], conversation.messages[-1]["content"])
+
+    def test_bad_conversation_fails_before_queueing(self):
+        response = self.client.post(
+            "/api/ai-check/?async=1", {"message": "hi", "conversation_id": 999}, format="json"
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Job.objects.exists())
+
+    def test_llm_errors_are_retried(self):
+        self.llm.error_rate = 1.0
+        job_url = self.enqueue_check()["Location"]
+        worker = Worker(idle_sleep=0)
+        worker.run_once()
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+        self.llm.error_rate = 0.0
+        worker.run(drain=True)
+        job = self.client.get(job_url).json()
+        self.assertEqual((job["status"], job["attempts"]), (Job.SUCCEEDED, 2))
+
+    def test_failure_after_last_attempt(self):
+        self.llm.error_rate = 1.0
+        job_url = self.enqueue_check()["Location"]
+        Worker(idle_sleep=0).run(drain=True)
+        job = self.client.get(job_url).json()
+        self.assertEqual((job["status"], job["status_code"]), (Job.FAILED, 503))
+        self.assertEqual(job["error"], gateway.UNAVAILABLE_MESSAGE)
+
+    def test_claims_do_not_overlap(self):
+        for _ in range(3):
+            self.enqueue_check()
+        first = queue.claim("a", limit=2)
+        second = queue.claim("b", limit=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({j.pk for j in first} & {j.pk for j in second})
+        self.assertEqual(queue.claim("c"), [])
+
+    def test_expired_lease_is_reclaimed_and_stale_worker_is_fenced(self):
+        self.enqueue_check()
+        [stale] = queue.claim("dead")
+        Job.objects.update(lease_until=timezone.now() - timedelta(seconds=1))
+        [fresh] = queue.claim("alive")
+        self.assertEqual(fresh.attempts, 2)
+
+        self.assertFalse(queue.succeed(stale, {"from": "dead"}))
+        self.assertTrue(queue.succeed(fresh, {"from": "alive"}))
+        self.assertEqual(Job.objects.get().result, {"from": "alive"})
+
+    def test_long_poll_returns_when_wait_expires(self):
+        job_url = self.enqueue_check()["Location"]
+        response = self.client.get(job_url, {"wait": 0.2})
+        self.assertEqual(response.json()["status"], Job.QUEUED)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_other_users_job_is_not_found(self):
+        job_url = self.enqueue_check()["Location"]
+        other = User.objects.create_user(username="other", email="other@example.com", password="x")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + create_jwt(other))
+        self.assertEqual(self.client.get(job_url).status_code, 404)
+
+    def test_webhook_receives_signed_result(self):
+        hook = f"http://127.0.0.1:{self.hooks.server_port}/done"
+        self.enqueue_check(webhook_url=hook)
+        Worker(idle_sleep=0).run(drain=True)
+
+        [(signature, body)] = WebhookReceiver.received
+        expected = "sha256=" + hmac.new(settings.SECRET_KEY.encode(), body, hashlib.sha256).hexdigest()
+        self.assertEqual(signature, expected)
+        self.assertEqual(json.loads(body)["status"], Job.SUCCEEDED)
+
+    def test_webhook_host_must_be_allowed(self):
+        response = self.enqueue_check(webhook_url="http://169.254.169.254/latest")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from rest_framework.response import Response
+
+from users.authentication import JWTAuthentication
+from . import queue, webhooks
+from .models import Job
+from .serializers import JobSerializer
+
+
+def requested_webhook(request):
+    """The validated ``webhook_url`` of an enqueue request, or ''. Raises ParseError."""
+    url = request.data.get('webhook_url') or ''
+    if url:
+        try:
+            webhooks.validate_url(url)
+        except ValueError as e:
+            raise ParseError(str(e))
+    return url
+
+
+def enqueue_job(user, kind, payload, webhook_url='', **extra):
+    """
+    Queue a job and answer ``202 Accepted`` with its id and result URL; the
+    opt-in async mode of the LLM endpoints (see llm.throttling.deferred).
+    """
+    job = queue.enqueue(user, kind, payload, webhook_url)
+    url = reverse('job-detail', args=[job.pk])
+    response = Response(
+        {'job_id': job.pk, 'status': job.status, 'result_url': url, **extra},
+        status=status.HTTP_202_ACCEPTED,
+    )
+    response['Location'] = url
+    return response
+
+
+async def job_detail(request, pk):
+    """
+    GET a job's status and, once finished, its result. ``?wait=N`` long-polls:
+    the response is held until the job finishes or N seconds (at most
+    JOBS["MAX_WAIT"]) pass. Async so a waiting client holds no worker thread.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({'error': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if auth is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+    user = auth[0]
+
+    try:
+        wait = min(max(float(request.GET.get('wait', 0)), 0), queue.get_config("MAX_WAIT"))
+    except ValueError:
+        return JsonResponse({'error': 'wait must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+
+    deadline = time.monotonic() + wait
+    while True:
+        job = await Job.objects.filter(pk=pk, user=user).afirst()
+        if job is None:
+            return JsonResponse({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.finished or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(min(queue.get_config("POLL_INTERVAL"), max(deadline - time.monotonic(), 0)))
+
+    response = JsonResponse(JobSerializer(job).data)
+    if not job.finished:
+        response['Retry-After'] = '1'
+    return response
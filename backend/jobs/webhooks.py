@@ -0,0 +1,56 @@
+"""
+Optional webhook delivery of job results.
+
+A client may pass ``webhook_url`` when enqueueing; once the job finishes the
+worker POSTs the same body the result endpoint returns, signed with
+``X-MiniMedi-Signature: sha256=<hex HMAC of the body>``. Only hosts listed in
+``JOBS["WEBHOOK_HOSTS"]`` are accepted so the worker can't be pointed at
+internal services. Delivery is best effort: polling stays the source of
+truth.
+"""
+import hashlib
+import hmac
+import json
+import logging
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .queue import get_config
+
+logger = logging.getLogger(__name__)
+
+
+def validate_url(url):
+    """Return ``url`` if webhooks may be sent to it, else raise ValueError."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('webhook_url must be an http(s) URL')
+    if parts.hostname.lower() not in {host.lower() for host in get_config("WEBHOOK_HOSTS")}:
+        raise ValueError('webhook_url host is not allowed')
+    return url
+
+
+def sign(body):
+    secret = get_config("WEBHOOK_SECRET") or settings.SECRET_KEY
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def deliver(job, data):
+    body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+    try:
+        # Re-checked here in case the allowlist changed since the job was queued
+        response = requests.post(
+            validate_url(job.webhook_url),
+            data=body,
+            headers={'Content-Type': 'application/json', 'X-MiniMedi-Signature': sign(body)},
+            timeout=get_config("WEBHOOK_TIMEOUT"),
+            allow_redirects=False,
+        )
+        response.raise_for_status()
+    except (ValueError, requests.RequestException) as e:
+        logger.warning("Webhook for job %s failed: %s", job.pk, e)
+        return False
+    return True
@@ -0,0 +1,78 @@
+import logging
+import os
+import socket
+import time
+
+from django.db import close_old_connections
+
+from llm import gateway
+from . import queue, webhooks
+from .serializers import JobSerializer
+from .tasks import TASKS, TaskError
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_job(job):
+    """Run one claimed job and record its outcome. Returns True once the job is finished."""
+    task = TASKS.get(job.kind)
+    if task is None:
+        return queue.fail(job, f"Unknown job kind {job.kind!r}", 500)
+    if job.attempts > queue.get_config("MAX_ATTEMPTS"):
+        # Reclaimed after its worker died too many times
+        return queue.fail(job, gateway.UNAVAILABLE_MESSAGE, 503)
+
+    try:
+        settled = queue.succeed(job, task(job.user, job.payload, job.pk))
+    except TaskError as e:
+        settled = queue.fail(job, e.message, e.status_code)
+    except gateway.LLMError as e:
+        if queue.retry(job):
+            return False
+        message = str(e) if isinstance(e, gateway.LLMBusy) else gateway.UNAVAILABLE_MESSAGE
+        settled = queue.fail(job, message, 503)
+    except Exception:
+        logger.exception("Job %s (%s) crashed", job.pk, job.kind)
+        settled = queue.fail(job, 'Internal error', 500)
+
+    if settled and job.webhook_url:
+        webhooks.deliver(job, JobSerializer(job).data)
+    return settled
+
+
+class Worker:
+    """Claim-and-run loop behind ``manage.py run_jobs``; ``stop()`` finishes the current batch first."""
+
+    def __init__(self, name=None, batch=1, kinds=None, idle_sleep=None):
+        self.name = name or worker_name()
+        self.batch = batch
+        self.kinds = kinds
+        self.idle_sleep = queue.get_config("IDLE_SLEEP") if idle_sleep is None else idle_sleep
+        self.stopping = False
+        self.processed = 0
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run_once(self):
+        """Claim and run one batch; returns how many jobs were claimed."""
+        close_old_connections()
+        jobs = queue.claim(self.name, self.batch, self.kinds)
+        for job in jobs:
+            run_job(job)
+            self.processed += 1
+        return len(jobs)
+
+    def run(self, drain=False, max_jobs=None):
+        while not self.stopping:
+            if max_jobs is not None and self.processed >= max_jobs:
+                break
+            if self.run_once():
+                continue
+            if drain:
+                break
+            time.sleep(self.idle_sleep)
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class LlmConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'llm'
+
+    def ready(self):
+        from . import prompts
+
+        # Read the prompt files once, before the first request
+        prompts.load()
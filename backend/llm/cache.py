@@ -0,0 +1,169 @@
+"""
+Response cache for repeatable LLM calls.
+
+Keys are built from the normalized user text (lower-cased, punctuation
+stripped, whitespace collapsed) plus the model and system prompt, so
+"Fever and headache for 2 days." and "fever and headache, for 2 days" share
+one entry. Word order is kept: "pain in chest, not head" and "pain in head,
+not chest" mean different things. Backends are pluggable through ``settings.LLM_CACHE``:
+
+* ``llm.cache.LRUCache`` - in-process, TTL + size bounded (default)
+* ``llm.cache.DjangoCache`` - any Django cache alias (locmem, file, database,
+  redis...) so several workers can share entries
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+DEFAULTS = {
+    "BACKEND": "llm.cache.LRUCache",
+    "TIMEOUT": 3600,
+    "MAX_ENTRIES": 1024,
+    "OPTIONS": {},
+}
+
+
+def normalize_text(text):
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def make_key(text, model, system_prompt):
+    raw = json.dumps([normalize_text(text), model, system_prompt])
+    return "llm:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+class BaseCache:
+    def __init__(self, timeout, max_entries, **options):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+        self._counter_lock = threading.Lock()
+
+    def get(self, key, record=True):
+        """The cached value or None; ``record=False`` leaves the hit/miss counters alone."""
+        value = self._get(key)
+        if record:
+            self._record(value is not None)
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def stats(self):
+        hits, misses = self._counts()
+        total = hits + misses
+        return {
+            "backend": type(self).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+    def _record(self, hit):
+        with self._counter_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def _counts(self):
+        return self._hits, self._misses
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+
+class LRUCache(BaseCache):
+    """Per-process cache; least recently used entries go first once full."""
+
+    def __init__(self, timeout, max_entries, **options):
+        super().__init__(timeout, max_entries, **options)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCache(BaseCache):
+    """
+    Shared cache on top of a Django cache alias (``OPTIONS["ALIAS"]``).
+    Eviction follows the alias' own MAX_ENTRIES/CULL settings; hit and miss
+    counters live in the cache too so they add up across workers.
+    """
+
+    def __init__(self, timeout, max_entries, ALIAS="default", **options):
+        super().__init__(timeout, max_entries, **options)
+        self.cache = caches[ALIAS]
+
+    def _get(self, key):
+        return self.cache.get(key)
+
+    def _set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def _record(self, hit):
+        name = "llm:stats:hits" if hit else "llm:stats:misses"
+        self.cache.add(name, 0, None)
+        try:
+            self.cache.incr(name)
+        except ValueError:
+            # Counter evicted between add() and incr(); start over
+            self.cache.set(name, 1, None)
+
+    def _counts(self):
+        counts = self.cache.get_many(["llm:stats:hits", "llm:stats:misses"])
+        return counts.get("llm:stats:hits", 0), counts.get("llm:stats:misses", 0)
+
+    def clear(self):
+        # Entries share the alias with other data, so only reset counters
+        self.cache.delete_many(["llm:stats:hits", "llm:stats:misses"])
+
+
+_response_cache = None
+_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache configured in settings."""
+    global _response_cache
+    if _response_cache is None:
+        with _lock:
+            if _response_cache is None:
+                config = {**DEFAULTS, **getattr(settings, "LLM_CACHE", {})}
+                backend = import_string(config["BACKEND"])
+                _response_cache = backend(config["TIMEOUT"], config["MAX_ENTRIES"], **config["OPTIONS"])
+    return _response_cache
@@ -0,0 +1,18 @@
+# Shown to users instead of the upstream error text
+UNAVAILABLE_MESSAGE = "The AI service is unavailable right now, please try again shortly."
+
+
+class LLMError(Exception):
+    """Raised when the upstream LLM call cannot be completed."""
+
+
+class LLMBusy(LLMError):
+    """Raised when no upstream slot frees up within ACQUIRE_TIMEOUT."""
+
+
+class LLMUnavailable(LLMError):
+    """No model in the fallback chain answered within the deadline."""
+
+
+class UpstreamRejected(LLMError):
+    """The upstream refused the request for a reason retrying won't fix."""
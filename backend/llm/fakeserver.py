@@ -0,0 +1,204 @@
+"""
+Local OpenAI-compatible chat server for development and load tests.
+
+Start it with ``python manage.py fake_llm`` and point MiniMedi at it with
+``GROQ_BASE_URL=http://127.0.0.1:8787``. Replies are canned but shaped like
+the real ones: the consultation flow asks for the missing details and then
+returns an analysis with a ``###DATA_START###`` block, the clinical prompt
+gets a list of causes and precautions (a JSON object in JSON mode), and
+summary requests get a summary.
+
+Latency and streaming speed are drawn from configurable distributions, and a
+share of requests can be failed on purpose to exercise retries and fallbacks.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aicheck.streaming import DATA_END, DATA_START
+
+_AGE = re.compile(r"\b(\d{1,3})\b")
+_NAME = re.compile(r"\b(?:my name is|i am|i'm|call me)\s+([A-Z][a-z]+)\b")
+
+
+def parse_distribution(spec, rng=random):
+    """
+    Turn ``"fixed:0.5"``, ``"uniform:0.2,1.5"``, ``"normal:0.8,0.2"``,
+    ``"lognormal:-0.5,0.6"`` or ``"exp:0.5"`` (mean) into a sampler
+    returning non-negative seconds.
+    """
+    kind, _, raw = spec.partition(":")
+    args = [float(x) for x in raw.split(",") if x]
+    samplers = {
+        "fixed": lambda: args[0],
+        "uniform": lambda: rng.uniform(*args),
+        "normal": lambda: rng.gauss(*args),
+        "lognormal": lambda: rng.lognormvariate(*args),
+        "exp": lambda: rng.expovariate(1 / args[0]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown distribution {kind!r}; use one of {', '.join(samplers)}")
+    sampler = samplers[kind]
+    return lambda: max(0.0, sampler())
+
+
+def canned_reply(messages, json_mode=False):
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user_turns = [m.get("content", "") for m in messages if m.get("role") == "user"]
+    last = user_turns[-1] if user_turns else ""
+
+    if "running summary" in system:
+        return "Patient reported " + "; ".join(t[:60] for t in user_turns[-3:]) + "."
+
+    if "clinical assistant" in system and json_mode:
+        return json.dumps({
+            "causes": ["Viral infection", "Dehydration", "Tension headache"],
+            "precautions": ["Rest and drink plenty of fluids", "See a doctor if symptoms persist beyond 3 days"],
+            "severity": "MEDIUM",
+            "risk_score": 35,
+        })
+
+    if "clinical assistant" in system:
+        return (
+            "- Possible cause: viral infection\n"
+            "- Possible cause: dehydration\n"
+            "- Possible cause: tension headache\n"
+            "- Precaution: rest and drink plenty of fluids\n"
+            "- Precaution: see a doctor if symptoms persist beyond 3 days"
+        )
+
+    if DATA_START not in system:
+        return f"Thanks for your message. Here is some general information about: {last[:80]}"
+
+    text = " ".join(user_turns)
+    match = _NAME.search(text)
+    name = match.group(1) if match else "there"
+    if len(user_turns) < 4:
+        questions = ["What is your name?", "How old are you, and what is your gender?", "How many days have you had these symptoms?"]
+        return f"Thanks, {name}. {questions[len(user_turns) - 1]}"
+
+    ages = [int(a) for a in _AGE.findall(text) if 0 < int(a) < 120]
+    record = {
+        "name": name,
+        "age": ages[0] if ages else 30,
+        "gender": "female" if "female" in text.lower() else "male",
+        "symptoms": user_turns[0][:120],
+        "duration": ages[-1] if len(ages) > 1 else 3,
+        "severity": "MEDIUM",
+        "risk_score": 40,
+        "complete": True,
+    }
+    return (
+        f"Thank you {name}! Based on what you shared, possible causes are: 1. Viral infection "
+        "2. Seasonal flu 3. Sinusitis 4. Dehydration 5. Stress. Precautions: rest, stay hydrated, "
+        "and monitor your temperature. I have saved this consultation to your history for your records."
+        f"{DATA_START}{json.dumps(record)}{DATA_END}"
+    )
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency="lognormal:-0.7,0.5", ttft="uniform:0.1,0.4",
+                 tokens_per_second=80.0, error_rate=0.0, error_status=503, seed=None):
+        super().__init__(address, FakeLLMHandler)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.latency = parse_distribution(latency, self.rng)
+        self.ttft = parse_distribution(ttft, self.rng)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+
+    def sample(self, sampler):
+        with self.rng_lock:
+            return sampler()
+
+    def should_fail(self):
+        with self.rng_lock:
+            self.requests += 1
+            return self.rng.random() < self.error_rate
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self._json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "Not found"}})
+            return
+        if self.server.should_fail():
+            self._json(self.server.error_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        model = body.get("model", "fake")
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        reply = canned_reply(body.get("messages", []), json_mode)
+        try:
+            if body.get("stream"):
+                self._stream(model, reply)
+            else:
+                time.sleep(self.server.sample(self.server.latency))
+                self._json(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": self._usage(body, reply),
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _stream(self, model, reply):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(self.server.sample(self.server.ttft))
+
+        delay = 1 / self.server.tokens_per_second if self.server.tokens_per_second > 0 else 0
+        for token in re.findall(r"\S+\s*|\s+", reply):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self._chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(delay)
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _usage(self, body, reply):
+        prompt = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        completion = len(reply) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def _json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
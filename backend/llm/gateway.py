@@ -0,0 +1,283 @@
+"""
+Shared gateway for all Groq chat completions.
+
+Every view talks to the LLM through this module instead of building its own
+client. Clients are created lazily and reuse one pooled HTTP connection
+(keep-alive, HTTP/2 when the ``h2`` package is installed), every call gets a
+timeout, and a process-wide semaphore bounds the number of in-flight upstream
+calls so a slow Groq cannot pile up every worker.
+
+WSGI views use the sync facade (``chat``); async views use ``achat`` and
+``astream``. Deadlines, retries, circuit breaking and model fallback are
+applied by ``llm.resilience``; the SDK's own retries are switched off.
+Pass ``prompt`` (an ``llm.prompts.Prompt``) to have the call counted in that
+prompt's token and latency stats. Every call is also counted, per model and
+endpoint, in the request metrics (``metrics.instrument``).
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+from groq import AsyncGroq, Groq
+
+from metrics import instrument
+
+from . import prompts, resilience
+from .exceptions import UNAVAILABLE_MESSAGE, LLMBusy, LLMError, LLMUnavailable, UpstreamRejected  # noqa: F401
+from .tokens import estimate_messages_tokens, estimate_tokens
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+
+DEFAULTS = {
+    "BASE_URL": None,
+    "TIMEOUT": 30.0,
+    "CONNECT_TIMEOUT": 5.0,
+    "MAX_RETRIES": 0,  # retries are handled by llm.resilience
+    "MAX_CONCURRENCY": 16,
+    "ACQUIRE_TIMEOUT": 10.0,
+    "MAX_CONNECTIONS": 20,
+    "MAX_KEEPALIVE_CONNECTIONS": 10,
+    "KEEPALIVE_EXPIRY": 30.0,
+}
+
+
+def get_config(name):
+    return getattr(settings, "LLM_GATEWAY", {}).get(name, DEFAULTS[name])
+
+
+def _http2_enabled():
+    return importlib.util.find_spec("h2") is not None
+
+
+def _http_options():
+    return {
+        "http2": _http2_enabled(),
+        "limits": httpx.Limits(
+            max_connections=get_config("MAX_CONNECTIONS"),
+            max_keepalive_connections=get_config("MAX_KEEPALIVE_CONNECTIONS"),
+            keepalive_expiry=get_config("KEEPALIVE_EXPIRY"),
+        ),
+        "timeout": _timeout(),
+    }
+
+
+def _timeout(total=None):
+    return httpx.Timeout(total or get_config("TIMEOUT"), connect=get_config("CONNECT_TIMEOUT"))
+
+
+def _client_options():
+    return {
+        "api_key": settings.GROQ_API_KEY,
+        "base_url": get_config("BASE_URL"),
+        "max_retries": get_config("MAX_RETRIES"),
+    }
+
+
+def _record(prompt, messages, model, started, usage=None, reply="", error=False):
+    """
+    Count one call of ``model`` in the request metrics and in ``prompt``'s
+    stats; real usage when Groq sent it, else estimates.
+    """
+    latency = time.monotonic() - started
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        if prompt is not None:
+            rest = messages[1:] if messages and messages[0].get("content") == prompt.text else messages
+            prompt_tokens = prompt.tokens + estimate_messages_tokens(rest)
+        else:
+            prompt_tokens = estimate_messages_tokens(messages)
+        completion_tokens = estimate_tokens(reply)
+    instrument.record_llm(model, latency, prompt_tokens, completion_tokens, error=error)
+    if prompt is not None:
+        prompts.record(prompt, latency, prompt_tokens, completion_tokens, error=error)
+
+
+# =========================
+# SYNC FACADE (WSGI)
+# =========================
+_lock = threading.Lock()
+_client = None
+_semaphore = None
+
+
+def get_client():
+    """Return the process-wide sync Groq client."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = Groq(http_client=httpx.Client(**_http_options()), **_client_options())
+    return _client
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        with _lock:
+            if _semaphore is None:
+                _semaphore = threading.BoundedSemaphore(get_config("MAX_CONCURRENCY"))
+    return _semaphore
+
+
+def chat(messages, model=DEFAULT_MODEL, timeout=None, prompt=None, return_model=False, **kwargs):
+    """
+    Run a chat completion and return the stripped reply text. ``timeout`` is
+    the deadline for the whole call, fallbacks included. With
+    ``return_model`` a ``(text, model that answered)`` pair is returned, so
+    callers can tell a fallback answer from the requested model's.
+    """
+    used = [model]
+    usage = []
+
+    def attempt(model, attempt_timeout):
+        used.append(model)
+        completion = get_client().chat.completions.create(
+            messages=messages,
+            model=model,
+            timeout=_timeout(attempt_timeout),
+            **kwargs,
+        )
+        usage.append(completion.usage)
+        return completion.choices[0].message.content.strip()
+
+    semaphore = _get_semaphore()
+    if not semaphore.acquire(timeout=get_config("ACQUIRE_TIMEOUT")):
+        raise LLMBusy("Too many concurrent AI requests, please retry shortly.")
+    started = time.monotonic()
+    try:
+        text = resilience.call(attempt, model, timeout)
+    except LLMError:
+        _record(prompt, messages, used[-1], started, error=True)
+        raise
+    finally:
+        semaphore.release()
+    _record(prompt, messages, used[-1], started, usage[-1] if usage else None, text)
+    return (text, used[-1]) if return_model else text
+
+
+def reset():
+    """Drop the shared clients, e.g. after LLM_GATEWAY settings change."""
+    global _client, _semaphore
+    with _lock:
+        _client = None
+        _semaphore = None
+    _loop_state.clear()
+
+
+# =========================
+# ASYNC CLIENT (ASGI)
+# =========================
+# httpx async pools are bound to the event loop they were opened on, so the
+# async client and its semaphore are kept per running loop. Under ASGI that is
+# one loop per worker; async code run from sync code (async_to_sync) gets a
+# short-lived loop per call, and the client is closed when it ends.
+_loop_state = weakref.WeakKeyDictionary()
+
+
+async def _close_with_loop(client):
+    # Parked at the yield: asyncio.run() finalizes async generators before it
+    # closes the loop, which runs the finally while the pool can still close
+    try:
+        yield
+    finally:
+        await client.close()
+
+
+async def _get_loop_state():
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        client = AsyncGroq(http_client=httpx.AsyncClient(**_http_options()), **_client_options())
+        state = _loop_state[loop] = {
+            "client": client,
+            "semaphore": asyncio.Semaphore(get_config("MAX_CONCURRENCY")),
+            "closer": _close_with_loop(client),
+        }
+        await anext(state["closer"])
+    return state
+
+
+async def get_async_client():
+    """Return the async Groq client for the running event loop."""
+    return (await _get_loop_state())["client"]
+
+
+async def _acquire(semaphore):
+    try:
+        await asyncio.wait_for(semaphore.acquire(), get_config("ACQUIRE_TIMEOUT"))
+    except asyncio.TimeoutError:
+        raise LLMBusy("Too many concurrent AI requests, please retry shortly.")
+
+
+async def achat(messages, model=DEFAULT_MODEL, timeout=None, prompt=None, return_model=False, **kwargs):
+    """Async counterpart of ``chat``."""
+    state = await _get_loop_state()
+    used = [model]
+    usage = []
+
+    async def attempt(model, attempt_timeout):
+        used.append(model)
+        completion = await state["client"].chat.completions.create(
+            messages=messages,
+            model=model,
+            timeout=_timeout(attempt_timeout),
+            **kwargs,
+        )
+        usage.append(completion.usage)
+        return completion.choices[0].message.content.strip()
+
+    await _acquire(state["semaphore"])
+    started = time.monotonic()
+    try:
+        text = await resilience.acall(attempt, model, timeout)
+    except LLMError:
+        _record(prompt, messages, used[-1], started, error=True)
+        raise
+    finally:
+        state["semaphore"].release()
+    _record(prompt, messages, used[-1], started, usage[-1] if usage else None, text)
+    return (text, used[-1]) if return_model else text
+
+
+async def astream(messages, model=DEFAULT_MODEL, timeout=None, prompt=None, **kwargs):
+    """
+    Yield reply text deltas as they arrive. The concurrency slot is held
+    until the stream is exhausted or closed. Opening the stream goes through
+    the retry/fallback policy; once text has been sent it cannot be retried.
+    """
+    state = await _get_loop_state()
+    used = [model]
+
+    async def attempt(model, attempt_timeout):
+        used.append(model)
+        return await state["client"].chat.completions.create(
+            messages=messages,
+            model=model,
+            timeout=_timeout(attempt_timeout),
+            stream=True,
+            **kwargs,
+        )
+
+    await _acquire(state["semaphore"])
+    started = time.monotonic()
+    reply = []
+    failed = False
+    try:
+        stream = await resilience.acall(attempt, model, timeout)
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                reply.append(delta)
+                yield delta
+    except Exception:
+        # A client going away (GeneratorExit/CancelledError) is not an error
+        failed = True
+        raise
+    finally:
+        state["semaphore"].release()
+        _record(prompt, messages, used[-1], started, reply="".join(reply), error=failed)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from llm.fakeserver import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local OpenAI-compatible chat server with canned MiniMedi replies. "
+        "Point the app at it with GROQ_BASE_URL=http://HOST:PORT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8787)
+        parser.add_argument(
+            "--latency", default="lognormal:-0.7,0.5",
+            help="seconds before a non-streamed reply: fixed:S | uniform:A,B | normal:MU,SD | lognormal:MU,SIGMA | exp:MEAN",
+        )
+        parser.add_argument("--ttft", default="uniform:0.1,0.4", help="seconds before the first streamed token (same syntax)")
+        parser.add_argument("--tokens-per-second", type=float, default=80.0, help="streaming speed; 0 = no delay")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+        parser.add_argument("--error-status", type=int, default=503)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(
+            (options["host"], options["port"]),
+            latency=options["latency"],
+            ttft=options["ttft"],
+            tokens_per_second=options["tokens_per_second"],
+            error_rate=options["error_rate"],
+            error_status=options["error_status"],
+            seed=options["seed"],
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Fake LLM listening on http://{host}:{port} (GROQ_BASE_URL=http://{host}:{port})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {server.requests} chat requests")
@@ -0,0 +1,122 @@
+import asyncio
+import math
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+PASSWORD = "LoadTest-Passw0rd!"
+
+PATIENT_TURNS = [
+    "Hi, I have had a headache and a mild fever",
+    "My name is Sam",
+    "I am 34 years old, male",
+    "For 3 days now",
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end load test against a running MiniMedi server (ideally backed by "
+        "manage.py fake_llm). Each virtual user signs up, logs in, then runs multi-turn "
+        "/api/ai-check/ consultations, logs a symptom and fetches its history. Reports "
+        "p50/p95/p99 latency and throughput per endpoint. Relax LLM_THROTTLE on the "
+        "server first or the run mostly measures 429s."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+        parser.add_argument("--iterations", type=int, default=3, help="consultations per user")
+        parser.add_argument("--turns", type=int, default=len(PATIENT_TURNS), help="chat turns per consultation")
+        parser.add_argument("--think", type=float, default=0.0, help="seconds between a user's requests")
+        parser.add_argument("--timeout", type=float, default=60.0)
+        parser.add_argument("--cleanup", action="store_true", help="delete the load-test users afterwards (same database)")
+
+    def handle(self, *args, **options):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+        started = time.perf_counter()
+        asyncio.run(self._run(options))
+        elapsed = time.perf_counter() - started
+
+        self._report(elapsed)
+        if options["cleanup"]:
+            deleted, _ = get_user_model().objects.filter(email__startswith=f"loadtest-{self.run_id}-").delete()
+            self.stdout.write(f"Removed {deleted} rows created by the run")
+
+    async def _run(self, options):
+        limits = httpx.Limits(max_connections=options["users"] * 2)
+        async with httpx.AsyncClient(base_url=options["base_url"], timeout=options["timeout"], limits=limits) as client:
+            await asyncio.gather(*(self._user(client, n, options) for n in range(options["users"])))
+
+    async def _request(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.samples[label].append(time.perf_counter() - started)
+            self.statuses[label][type(e).__name__] += 1
+            return None
+        self.samples[label].append(time.perf_counter() - started)
+        self.statuses[label][response.status_code] += 1
+        return response
+
+    async def _user(self, client, n, options):
+        email = f"loadtest-{self.run_id}-{n}@example.com"
+        signup = await self._request(client, "signup", "POST", "/api/users/signup/", json={
+            "email": email, "username": email, "password": PASSWORD, "name": f"Load {n}",
+        })
+        if signup is None or signup.status_code != 201:
+            return
+        login = await self._request(client, "login", "POST", "/api/users/login/", json={"email": email, "password": PASSWORD})
+        if login is None or login.status_code != 200:
+            return
+        headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+        for _ in range(options["iterations"]):
+            conversation_id = None
+            for turn in range(options["turns"]):
+                payload = {"message": PATIENT_TURNS[turn % len(PATIENT_TURNS)]}
+                if conversation_id:
+                    payload["conversation_id"] = conversation_id
+                response = await self._request(client, "ai-check", "POST", "/api/ai-check/", json=payload, headers=headers)
+                if response is not None and response.status_code == 200:
+                    conversation_id = response.json().get("conversation_id")
+                await asyncio.sleep(options["think"])
+
+            await self._request(client, "symptoms:log", "POST", "/api/symptoms/", headers=headers, json={
+                "title": "Load test", "patient_name": f"Load {n}", "age": 34, "gender": "male",
+                "duration": 3, "description": PATIENT_TURNS[0], "ai_analysis": "n/a",
+            })
+            await self._request(client, "symptoms:history", "GET", "/api/symptoms/", headers=headers, params={"limit": 20})
+            await asyncio.sleep(options["think"])
+
+    def _report(self, elapsed):
+        self.stdout.write(
+            f"{'endpoint':<18} {'requests':>8} {'errors':>7} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'req/s':>7}  statuses"
+        )
+        total = 0
+        for label, values in self.samples.items():
+            values = sorted(values)
+            total += len(values)
+            errors = sum(count for code, count in self.statuses[label].items() if not (isinstance(code, int) and code < 400))
+            statuses = ", ".join(f"{code}x{count}" for code, count in sorted(self.statuses[label].items(), key=str))
+            self.stdout.write(
+                f"{label:<18} {len(values):>8} {errors:>7} {percentile(values, 50) * 1000:>8.0f} "
+                f"{percentile(values, 95) * 1000:>8.0f} {percentile(values, 99) * 1000:>8.0f} "
+                f"{len(values) / elapsed:>7.1f}  {statuses}"
+            )
+        self.stdout.write(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
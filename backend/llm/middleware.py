@@ -0,0 +1,82 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.utils.decorators import sync_and_async_middleware
+
+from .throttling import release_slots
+
+
+class _ReleasingContent:
+    """
+    A response's streaming content that frees ``slots`` when it runs out or
+    is closed. Django closes it with the response, so a client that leaves
+    before the first chunk frees them too.
+    """
+
+    def __init__(self, content, slots):
+        self.content = content
+        self.slots = slots
+
+    def close(self):
+        slots, self.slots = self.slots, None
+        if slots:
+            release_slots(slots)
+
+
+class _ReleasingIterator(_ReleasingContent):
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.content)
+        except StopIteration:
+            self.close()
+            raise
+
+
+class _ReleasingAsyncIterator(_ReleasingContent):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await anext(self.content)
+        except StopAsyncIteration:
+            await sync_to_async(self.close)()
+            raise
+
+
+def _release_after(request, response):
+    """
+    Free the admission slots taken for this request. A streaming response
+    keeps its slots until its content is exhausted or closed, i.e. after
+    the last chunk. Returns a callable for non-streaming responses, None
+    otherwise.
+    """
+    slots = request.__dict__.pop("llm_slots", None)
+    if not slots:
+        return None
+    if response.streaming:
+        wrapper = _ReleasingAsyncIterator if response.is_async else _ReleasingIterator
+        response.streaming_content = wrapper(response.streaming_content, slots)
+        return None
+    return lambda: release_slots(slots)
+
+
+@sync_and_async_middleware
+def AdmissionSlotsMiddleware(get_response):
+    """Releases slots held by llm.throttling's concurrency throttles."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            release = _release_after(request, response)
+            if release:
+                await sync_to_async(release)()
+            return response
+    else:
+        def middleware(request):
+            response = get_response(request)
+            release = _release_after(request, response)
+            if release:
+                release()
+            return response
+    return middleware
@@ -0,0 +1,203 @@
+"""
+Registry of versioned system prompts.
+
+Each prompt lives in ``llm/prompts/<name>/<version>.txt`` and is read once
+(from ``LlmConfig.ready``) together with its estimated token count, so
+requests reuse the same string instead of rebuilding it. ``id`` is
+``"<name>@<version>"``; it is stored on the rows a prompt produced.
+
+Which version a request gets comes from ``settings.LLM_PROMPTS``:
+
+* ``ACTIVE`` pins a version per prompt name (default: the highest version)
+* ``EXPERIMENTS`` splits traffic, e.g. ``{"consultation": {"v1": 50, "v2": 50}}``.
+  The split is by a stable key (the user id), so a user keeps one variant.
+
+The gateway records per-prompt calls, errors, tokens and latency through
+``record``; ``stats`` reads them back. Counters live in a Django cache alias
+so they add up across workers when that alias is shared.
+"""
+import hashlib
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ..tokens import MESSAGE_OVERHEAD, estimate_tokens
+
+PROMPT_DIR = Path(__file__).resolve().parent
+
+DEFAULTS = {
+    "ACTIVE": {},
+    "EXPERIMENTS": {},
+    "STATS_ALIAS": "default",
+}
+
+# Upper bounds (ms) of the latency histogram; the reported p50/p95 are the
+# bound of the bucket the percentile falls in
+LATENCY_BUCKETS = [250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+COUNTERS = ["calls", "errors", "prompt_tokens", "completion_tokens", "latency_ms"]
+
+
+def get_config(name):
+    return getattr(settings, "LLM_PROMPTS", {}).get(name, DEFAULTS[name])
+
+
+class Prompt:
+    __slots__ = ("name", "version", "text", "tokens", "id")
+
+    def __init__(self, name, version, text):
+        self.name = name
+        self.version = version
+        self.text = text
+        # What the system message adds to every request
+        self.tokens = MESSAGE_OVERHEAD + estimate_tokens(text)
+        self.id = f"{name}@{version}"
+
+    def __repr__(self):
+        return f"<Prompt {self.id} ({self.tokens} tokens)>"
+
+    def message(self):
+        return {"role": "system", "content": self.text}
+
+
+def _version_key(version):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+
+_registry = None
+_lock = threading.Lock()
+
+
+def load(directory=PROMPT_DIR):
+    """(Re)read every prompt file; returns ``{name: {version: Prompt}}``."""
+    global _registry
+    registry = {}
+    for path in sorted(directory.glob("*/*.txt")):
+        name, version = path.parent.name, path.stem
+        registry.setdefault(name, {})[version] = Prompt(name, version, path.read_text(encoding="utf-8").rstrip("\n"))
+    with _lock:
+        _registry = registry
+    return registry
+
+
+def registry():
+    return _registry if _registry is not None else load()
+
+
+def get(name, version=None):
+    """The prompt ``name`` at ``version``, or the active version. Raises KeyError."""
+    versions = registry()[name]
+    if version is None:
+        version = get_config("ACTIVE").get(name) or max(versions, key=_version_key)
+    return versions[version]
+
+
+def select(name, key=None, stored=None):
+    """
+    The prompt to use for one request. ``stored`` is an id saved on an earlier
+    row (a conversation keeps its prompt while it still exists); otherwise an
+    experiment on ``name`` picks a variant by ``key``, else the active version.
+    """
+    if stored:
+        stored_name, _, version = stored.partition("@")
+        if stored_name == name and version in registry().get(name, {}):
+            return get(name, version)
+
+    weights = get_config("EXPERIMENTS").get(name)
+    if not weights or key is None:
+        return get(name)
+    point = int(hashlib.sha256(f"{name}:{key}".encode()).hexdigest()[:8], 16) % sum(weights.values())
+    for version, weight in sorted(weights.items()):
+        if point < weight:
+            return get(name, version)
+        point -= weight
+    return get(name)
+
+
+# =========================
+# STATS
+# =========================
+def _stats_cache():
+    return caches[get_config("STATS_ALIAS")]
+
+
+def _incr(cache, key, delta):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Counter evicted between add() and incr(); start over
+        cache.set(key, delta, None)
+
+
+def _bucket(latency_ms):
+    for bound in LATENCY_BUCKETS:
+        if latency_ms <= bound:
+            return str(bound)
+    return "inf"
+
+
+def record(prompt, latency, prompt_tokens, completion_tokens, error=False):
+    """Add one call of ``prompt`` (``latency`` in seconds) to its counters."""
+    cache = _stats_cache()
+    latency_ms = int(latency * 1000)
+    base = f"llm:prompt:{prompt.id}:"
+    for name, value in (
+        ("calls", 1),
+        ("errors", int(error)),
+        ("prompt_tokens", prompt_tokens),
+        ("completion_tokens", completion_tokens),
+        ("latency_ms", latency_ms),
+        (f"bucket:{_bucket(latency_ms)}", 1),
+    ):
+        if value:
+            _incr(cache, base + name, value)
+
+
+def _percentile(buckets, calls, pct):
+    if not calls:
+        return None
+    rank = pct / 100 * calls
+    seen = 0
+    for bound in LATENCY_BUCKETS + ["inf"]:
+        seen += buckets.get(str(bound), 0)
+        if seen >= rank:
+            return bound
+    return "inf"
+
+
+def stats():
+    """Per-prompt static size and recorded usage, keyed by prompt id."""
+    cache = _stats_cache()
+    prompts = [prompt for versions in registry().values() for prompt in versions.values()]
+    names = COUNTERS + [f"bucket:{b}" for b in LATENCY_BUCKETS + ["inf"]]
+    values = cache.get_many([f"llm:prompt:{p.id}:{n}" for p in prompts for n in names])
+
+    result = {}
+    for prompt in prompts:
+        counts = {n: values.get(f"llm:prompt:{prompt.id}:{n}", 0) for n in names}
+        buckets = {n.split(":", 1)[1]: v for n, v in counts.items() if n.startswith("bucket:")}
+        calls = counts["calls"]
+        result[prompt.id] = {
+            "system_tokens": prompt.tokens,
+            "active": get(prompt.name).version == prompt.version,
+            "weight": get_config("EXPERIMENTS").get(prompt.name, {}).get(prompt.version),
+            "calls": calls,
+            "errors": counts["errors"],
+            "prompt_tokens": counts["prompt_tokens"],
+            "completion_tokens": counts["completion_tokens"],
+            "avg_prompt_tokens": round(counts["prompt_tokens"] / calls, 1) if calls else None,
+            "avg_completion_tokens": round(counts["completion_tokens"] / calls, 1) if calls else None,
+            "avg_latency_ms": round(counts["latency_ms"] / calls) if calls else None,
+            "p50_latency_ms": _percentile(buckets, calls, 50),
+            "p95_latency_ms": _percentile(buckets, calls, 95),
+        }
+    return result
+
+
+def reset_stats():
+    cache = _stats_cache()
+    names = COUNTERS + [f"bucket:{b}" for b in LATENCY_BUCKETS + ["inf"]]
+    cache.delete_many([f"llm:prompt:{p.id}:{n}" for versions in registry().values() for p in versions.values() for n in names])
@@ -0,0 +1,224 @@
+"""
+Retry, deadline and circuit-breaker policy for upstream LLM calls.
+
+``call`` / ``acall`` run one logical request against a model chain (the
+requested model followed by its ``FALLBACK_MODELS``):
+
+* The whole call has a ``DEADLINE``; each attempt gets
+  ``min(ATTEMPT_TIMEOUT, time left)``.
+* Connection errors and ``RETRY_STATUSES`` are retried up to
+  ``MAX_ATTEMPTS`` times per model with full-jitter exponential backoff
+  (a larger upstream Retry-After wins). A timed-out attempt moves straight
+  on to the next, faster model instead of waiting on the slow one again;
+  the last model in the chain is retried as usual.
+* Every model has a circuit breaker. ``BREAKER_THRESHOLD`` consecutive
+  failures open it for ``BREAKER_RESET`` seconds, during which the model is
+  skipped without a network call; then a single trial call is let through.
+* Other upstream errors (bad request, auth) are not retried.
+
+When nothing in the chain succeeds, ``LLMUnavailable`` is raised.
+"""
+import asyncio
+import random
+import threading
+import time
+
+import groq
+from django.conf import settings
+
+from .exceptions import LLMUnavailable, UpstreamRejected
+
+DEFAULTS = {
+    "DEADLINE": 45.0,          # seconds for the whole call, retries and fallbacks included
+    "ATTEMPT_TIMEOUT": 20.0,   # seconds per upstream attempt
+    "MAX_ATTEMPTS": 3,         # per model
+    "BACKOFF_BASE": 0.5,
+    "BACKOFF_MAX": 8.0,
+    "RETRY_STATUSES": [408, 409, 429, 500, 502, 503, 504],
+    "BREAKER_THRESHOLD": 5,    # consecutive failures that open a model's circuit
+    "BREAKER_RESET": 30.0,     # seconds a circuit stays open before a trial call
+    "FALLBACK_MODELS": {},     # model -> [cheaper/faster models to try next]
+}
+
+
+def get_config(name):
+    return getattr(settings, "LLM_RESILIENCE", {}).get(name, DEFAULTS[name])
+
+
+# =========================
+# CIRCUIT BREAKER
+# =========================
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= get_config("BREAKER_RESET"):
+                # Let exactly one trial call through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= get_config("BREAKER_THRESHOLD"):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Reopen the circuit if a trial call ended without recording an outcome."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model):
+    with _breakers_lock:
+        return _breakers.setdefault(model, CircuitBreaker())
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def breaker_states():
+    with _breakers_lock:
+        return {model: breaker.state for model, breaker in _breakers.items()}
+
+
+# =========================
+# POLICY
+# =========================
+def model_chain(model):
+    return [model] + [m for m in get_config("FALLBACK_MODELS").get(model, []) if m != model]
+
+
+def _classify(exc):
+    """Return ``"timeout"``, ``"retry"`` or ``"fatal"`` for an upstream error."""
+    if isinstance(exc, groq.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, groq.APIConnectionError):
+        return "retry"
+    if isinstance(exc, groq.APIStatusError) and exc.status_code in get_config("RETRY_STATUSES"):
+        return "retry"
+    return "fatal"
+
+
+def _backoff(attempt, exc):
+    delay = random.uniform(0, min(get_config("BACKOFF_MAX"), get_config("BACKOFF_BASE") * 2 ** attempt))
+    response = getattr(exc, "response", None)
+    try:
+        retry_after = float(response.headers.get("retry-after")) if response is not None else 0.0
+    except (TypeError, ValueError):
+        retry_after = 0.0
+    return max(delay, retry_after)
+
+
+class _Attempts:
+    """Shared bookkeeping for the sync and async runners."""
+
+    def __init__(self, model, timeout=None):
+        self.chain = model_chain(model)
+        self.deadline = time.monotonic() + (timeout or get_config("DEADLINE"))
+        self.last_error = None
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def attempt_timeout(self):
+        return min(get_config("ATTEMPT_TIMEOUT"), self.remaining())
+
+    def failed(self, model, exc):
+        """Record a failed attempt; return its kind, raising for fatal errors."""
+        if not isinstance(exc, groq.APIError):
+            raise exc
+        kind = _classify(exc)
+        if kind == "fatal":
+            # The upstream answered, so the model itself is healthy
+            get_breaker(model).record_success()
+            raise UpstreamRejected(str(exc)) from exc
+        get_breaker(model).record_failure()
+        self.last_error = exc
+        return kind
+
+    def unavailable(self):
+        if self.last_error is None:
+            return LLMUnavailable("AI service is temporarily unavailable (circuit open).")
+        return LLMUnavailable(f"AI service did not respond in time: {self.last_error}")
+
+
+def call(fn, model, timeout=None):
+    """
+    Run ``fn(model, attempt_timeout)`` under the policy and return its result.
+    ``timeout`` overrides the overall DEADLINE.
+    """
+    attempts = _Attempts(model, timeout)
+    for candidate in attempts.chain:
+        breaker = get_breaker(candidate)
+        for attempt in range(get_config("MAX_ATTEMPTS")):
+            if attempts.remaining() <= 0 or not breaker.allow():
+                break
+            try:
+                result = fn(candidate, attempts.attempt_timeout())
+            except Exception as exc:
+                if attempts.failed(candidate, exc) == "timeout" and candidate != attempts.chain[-1]:
+                    break
+                delay = _backoff(attempt, exc)
+                if delay >= attempts.remaining():
+                    break
+                time.sleep(delay)
+                continue
+            else:
+                breaker.record_success()
+                return result
+            finally:
+                # A non-upstream error or a cancellation mustn't strand a trial call
+                breaker.release()
+    raise attempts.unavailable() from attempts.last_error
+
+
+async def acall(fn, model, timeout=None):
+    """Async counterpart of ``call``; ``fn`` is a coroutine function."""
+    attempts = _Attempts(model, timeout)
+    for candidate in attempts.chain:
+        breaker = get_breaker(candidate)
+        for attempt in range(get_config("MAX_ATTEMPTS")):
+            if attempts.remaining() <= 0 or not breaker.allow():
+                break
+            try:
+                result = await fn(candidate, attempts.attempt_timeout())
+            except Exception as exc:
+                if attempts.failed(candidate, exc) == "timeout" and candidate != attempts.chain[-1]:
+                    break
+                delay = _backoff(attempt, exc)
+                if delay >= attempts.remaining():
+                    break
+                await asyncio.sleep(delay)
+                continue
+            else:
+                breaker.record_success()
+                return result
+            finally:
+                # A non-upstream error or a cancellation mustn't strand a trial call
+                breaker.release()
+    raise attempts.unavailable() from attempts.last_error
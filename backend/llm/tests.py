@@ -0,0 +1,492 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import groq
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.urls import path
+from rest_framework.decorators import api_view, throttle_classes
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from users.views import create_jwt
+from . import cache, gateway, resilience, throttling
+
+User = get_user_model()
+
+
+class TestRateThrottle(throttling.UserTokenBucketThrottle):
+    scope = "test"
+
+
+THROTTLES = [TestRateThrottle, throttling.UserConcurrencyThrottle, throttling.UpstreamConcurrencyThrottle]
+
+
+@api_view(["POST"])
+@throttle_classes(THROTTLES)
+def answer(request):
+    if request.data.get("fail"):
+        return Response({"error": "Bad input"}, status=400)
+    return Response({"ok": True})
+
+
+@api_view(["POST"])
+@throttle_classes(THROTTLES)
+def stream(request):
+    return StreamingHttpResponse(iter([b"a", b"b"]))
+
+
+@api_view(["POST"])
+@throttle_classes(THROTTLES)
+def astream(request):
+    async def chunks():
+        yield b"a"
+        yield b"b"
+    return StreamingHttpResponse(chunks())
+
+
+urlpatterns = [
+    path("answer/", answer),
+    path("stream/", stream),
+    path("astream/", astream),
+]
+
+THROTTLE = {
+    "RATES": {},
+    "USER_MAX_IN_FLIGHT": 1,
+    "GLOBAL_MAX_IN_FLIGHT": 1,
+    "QUEUE_SIZE": 0,
+    "QUEUE_TIMEOUT": 0,
+    "RETRY_AFTER": 3,
+}
+
+
+class LocalBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = throttling.LocalBackend()
+
+    def test_token_bucket_allows_a_burst_then_refills(self):
+        with mock.patch("llm.throttling.time.monotonic", return_value=100.0):
+            self.assertEqual([self.backend.take_token("u", 1.0, 3) for _ in range(3)], [0, 0, 0])
+            self.assertAlmostEqual(self.backend.take_token("u", 1.0, 3), 1.0)
+            # Other keys have their own bucket
+            self.assertEqual(self.backend.take_token("v", 1.0, 3), 0)
+        with mock.patch("llm.throttling.time.monotonic", return_value=101.5):
+            self.assertEqual(self.backend.take_token("u", 1.0, 3), 0)
+            self.assertAlmostEqual(self.backend.take_token("u", 1.0, 3), 0.5)
+
+    def test_slots_are_limited_and_released(self):
+        first = self.backend.try_acquire("k", 2)
+        self.assertIsNotNone(self.backend.try_acquire("k", 2))
+        self.assertIsNone(self.backend.try_acquire("k", 2))
+        self.backend.release(first)
+        self.assertIsNotNone(self.backend.try_acquire("k", 2))
+
+    def test_queued_request_gets_a_released_slot(self):
+        held = self.backend.try_acquire("k", 1)
+        threading.Timer(0.1, self.backend.release, [held]).start()
+        started = time.monotonic()
+        self.assertIsNotNone(self.backend.acquire("k", 1, queue_size=1, timeout=5))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_queue_times_out_and_overflows(self):
+        self.backend.try_acquire("k", 1)
+        self.assertIsNone(self.backend.acquire("k", 1, queue_size=1, timeout=0.05))
+        # The queue ticket was given back
+        self.assertEqual(self.backend._slots.get("k:queue"), None)
+        self.assertIsNone(self.backend.acquire("k", 1, queue_size=0, timeout=5))
+
+
+class CacheBackendTests(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.backend = throttling.CacheBackend()
+
+    def test_slots_are_shared_through_the_cache(self):
+        handle = self.backend.try_acquire("k", 1)
+        self.assertIsNone(throttling.CacheBackend().try_acquire("k", 1))
+        self.backend.release(handle)
+        self.assertIsNotNone(throttling.CacheBackend().try_acquire("k", 1))
+
+    def test_token_bucket(self):
+        self.assertEqual([self.backend.take_token("u", 1 / 60, 2) for _ in range(2)], [0, 0])
+        self.assertGreater(self.backend.take_token("u", 1 / 60, 2), 0)
+
+
+@override_settings(ROOT_URLCONF="llm.tests", LLM_THROTTLE=THROTTLE)
+class AdmissionThrottleTests(TestCase):
+    def setUp(self):
+        throttling.reset_backend()
+        self.addCleanup(throttling.reset_backend)
+        self.user = User.objects.create_user(username="amy", email="amy@example.com", password="x")
+        self.other = User.objects.create_user(username="bob", email="bob@example.com", password="x")
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt(user)}")
+        return client
+
+    def close(self, response):
+        # As the test client does: request_finished would otherwise close the
+        # test transaction's connection
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+    def held_slots(self):
+        return throttling.get_backend()._slots
+
+    @override_settings(LLM_THROTTLE={**THROTTLE, "RATES": {"test": "1/min"}, "BURST": 2})
+    def test_empty_bucket_gets_429_with_retry_after(self):
+        self.assertEqual([self.client.post("/answer/").status_code for _ in range(2)], [200, 200])
+        response = self.client.post("/answer/")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 59)
+        # Another user's bucket is full
+        self.assertEqual(self.client_for(self.other).post("/answer/").status_code, 200)
+
+    def test_user_in_flight_limit(self):
+        streaming = self.client.post("/stream/")
+        response = self.client.post("/answer/")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertEqual(b"".join(streaming.streaming_content), b"ab")
+        self.assertEqual(self.client.post("/answer/").status_code, 200)
+
+    def test_busy_upstream_gets_503_with_retry_after(self):
+        streaming = self.client.post("/stream/")
+        response = self.client_for(self.other).post("/answer/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "3")
+        self.close(streaming)
+        self.assertEqual(self.client_for(self.other).post("/answer/").status_code, 200)
+
+    @override_settings(LLM_THROTTLE={**THROTTLE, "QUEUE_SIZE": 1, "QUEUE_TIMEOUT": 5})
+    def test_queued_request_runs_when_a_slot_frees(self):
+        streaming = self.client.post("/stream/")
+        threading.Timer(0.1, streaming.close).start()
+        self.assertEqual(self.client_for(self.other).post("/answer/").status_code, 200)
+
+    def test_slots_are_freed_after_an_error_response(self):
+        self.assertEqual(self.client.post("/answer/", {"fail": True}, format="json").status_code, 400)
+        self.assertEqual(self.held_slots(), {})
+        self.assertEqual(self.client.post("/answer/").status_code, 200)
+
+    def test_slots_are_freed_after_a_stream(self):
+        response = self.client.post("/stream/")
+        self.assertEqual(len(self.held_slots()), 2)
+        self.assertEqual(b"".join(response.streaming_content), b"ab")
+        self.assertEqual(self.held_slots(), {})
+
+    def test_slots_are_freed_when_a_stream_is_abandoned(self):
+        response = self.client.post("/stream/")
+        self.close(response)
+        self.assertEqual(self.held_slots(), {})
+
+    def test_slots_are_freed_after_an_async_stream(self):
+        client = AsyncClient()
+
+        async def consume():
+            response = await client.post("/astream/", headers={"Authorization": f"Bearer {create_jwt(self.user)}"})
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(async_to_sync(consume)(), b"ab")
+        self.assertEqual(self.held_slots(), {})
+
+
+class NormalizeTextTests(SimpleTestCase):
+    def test_case_punctuation_and_spacing_are_ignored(self):
+        self.assertEqual(cache.normalize_text("  Fever, and HEADACHE\tfor 2 days!"), "fever and headache for 2 days")
+        self.assertEqual(
+            cache.make_key("Fever and headache for 2 days.", "m", "p"),
+            cache.make_key("fever and headache, for 2 days", "m", "p"),
+        )
+
+    def test_word_order_is_kept(self):
+        self.assertNotEqual(
+            cache.make_key("pain in chest, not head", "m", "p"), cache.make_key("pain in head, not chest", "m", "p")
+        )
+
+    def test_model_and_prompt_are_part_of_the_key(self):
+        key = cache.make_key("fever", "m", "p")
+        self.assertNotEqual(key, cache.make_key("fever", "other", "p"))
+        self.assertNotEqual(key, cache.make_key("fever", "m", "other"))
+
+
+class LRUCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = cache.LRUCache(timeout=60, max_entries=2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", "1")
+        self.cache.set("b", "2")
+        self.cache.get("a")
+        self.cache.set("c", "3")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual((self.cache.get("a"), self.cache.get("c")), ("1", "3"))
+        # Setting an existing key refreshes it as well
+        self.cache.set("a", "4")
+        self.cache.set("d", "5")
+        self.assertIsNone(self.cache.get("c"))
+        self.assertEqual(self.cache.get("a"), "4")
+
+    def test_entries_expire(self):
+        with mock.patch("llm.cache.time.monotonic", return_value=100.0):
+            self.cache.set("a", "1")
+        with mock.patch("llm.cache.time.monotonic", return_value=159.0):
+            self.assertEqual(self.cache.get("a"), "1")
+        with mock.patch("llm.cache.time.monotonic", return_value=161.0):
+            self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache._data, {})
+
+    def test_hits_and_misses_are_counted(self):
+        self.cache.set("a", "1")
+        self.cache.get("a")
+        self.cache.get("a")
+        self.cache.get("b")
+        # Evicted entries count as misses
+        self.cache.set("b", "2")
+        self.cache.set("c", "3")
+        self.cache.get("a")
+        self.assertEqual(self.cache.stats(), {"backend": "LRUCache", "hits": 2, "misses": 2, "hit_rate": 0.5})
+
+    def test_unrecorded_reads_leave_the_counters_alone(self):
+        self.cache.set("a", "1")
+        self.assertEqual(self.cache.get("a", record=False), "1")
+        self.assertIsNone(self.cache.get("b", record=False))
+        self.assertEqual(self.cache.stats()["hits"] + self.cache.stats()["misses"], 0)
+
+
+class DjangoCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.cache = cache.DjangoCache(timeout=60, max_entries=None, ALIAS="default")
+
+    def test_entries_and_counters_are_shared_between_instances(self):
+        self.cache.set("a", "1")
+        other = cache.DjangoCache(timeout=60, max_entries=None)
+        self.assertEqual(other.get("a"), "1")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats(), {"backend": "DjangoCache", "hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_entries_expire_with_the_alias(self):
+        self.cache.set("a", "1")
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get("a"))
+
+    def test_counter_evicted_between_add_and_incr(self):
+        with mock.patch.object(caches["default"], "incr", side_effect=ValueError):
+            self.cache.get("a")
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_clear_resets_only_the_counters(self):
+        self.cache.set("a", "1")
+        self.cache.get("a")
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()["hits"], 0)
+        self.assertEqual(self.cache.get("a"), "1")
+
+    @override_settings(LLM_CACHE={"BACKEND": "llm.cache.DjangoCache", "TIMEOUT": 5, "OPTIONS": {"ALIAS": "default"}})
+    def test_backend_comes_from_settings(self):
+        with mock.patch.object(cache, "_response_cache", None):
+            response_cache = cache.get_response_cache()
+            self.assertIsInstance(response_cache, cache.DjangoCache)
+            self.assertEqual(response_cache.timeout, 5)
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+def stream_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class StubCompletions:
+    """``client.chat.completions`` of a sync client; calls wait for ``release``."""
+
+    def __init__(self):
+        self.timeouts = []
+        self.in_flight = 0
+        self.peak = 0
+        self.error = None
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def create(self, messages, model, timeout, **kwargs):
+        with self.lock:
+            self.timeouts.append(timeout)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            if self.error:
+                raise self.error
+            self.release.wait(5)
+            return completion(" reply ")
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def wait_for(self, in_flight):
+        deadline = time.monotonic() + 5
+        while self.in_flight < in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.in_flight
+
+
+class StubAsyncGroq:
+    """Stands in for AsyncGroq; completions wait for ``release``."""
+
+    def __init__(self, http_client, **options):
+        self.http_client = http_client
+        self.chat = SimpleNamespace(completions=self)
+        self.timeouts = []
+        self.in_flight = 0
+        self.release = asyncio.Event()
+        self.closed = False
+
+    async def create(self, messages, model, timeout, stream=False, **kwargs):
+        self.timeouts.append(timeout)
+        if stream:
+            return self.chunks()
+        self.in_flight += 1
+        try:
+            await self.release.wait()
+        finally:
+            self.in_flight -= 1
+        return completion(" reply ")
+
+    async def chunks(self):
+        for text in ("a", "b"):
+            yield stream_chunk(text)
+
+    async def close(self):
+        self.closed = True
+        await self.http_client.aclose()
+
+
+@override_settings(
+    LLM_GATEWAY={"MAX_CONCURRENCY": 2, "ACQUIRE_TIMEOUT": 0.2},
+    LLM_RESILIENCE={"MAX_ATTEMPTS": 1},
+)
+class GatewayTests(SimpleTestCase):
+    def setUp(self):
+        gateway.reset()
+        resilience.reset_breakers()
+        self.addCleanup(gateway.reset)
+        self.addCleanup(resilience.reset_breakers)
+        self.completions = StubCompletions()
+        client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        patcher = mock.patch.object(gateway, "get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(gateway, "AsyncGroq", StubAsyncGroq)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def chat_in_threads(self, count):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(gateway.chat(MESSAGES))) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        self.addCleanup(self.completions.release.set)
+        return threads, results
+
+    def test_extra_call_waits_for_a_slot(self):
+        with self.settings(LLM_GATEWAY={"MAX_CONCURRENCY": 2, "ACQUIRE_TIMEOUT": 5}):
+            threads, results = self.chat_in_threads(3)
+            self.assertEqual(self.completions.wait_for(2), 2)
+            time.sleep(0.1)
+            # The third call is parked on the semaphore, not upstream
+            self.assertEqual(len(self.completions.timeouts), 2)
+            self.completions.release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(results, ["reply"] * 3)
+        self.assertEqual(self.completions.peak, 2)
+
+    def test_extra_call_times_out_busy(self):
+        threads, _ = self.chat_in_threads(2)
+        self.completions.wait_for(2)
+        started = time.monotonic()
+        with self.assertRaisesMessage(gateway.LLMBusy, "Too many concurrent AI requests"):
+            gateway.chat(MESSAGES)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(len(self.completions.timeouts), 2)
+
+        self.completions.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(gateway.chat(MESSAGES), "reply")
+
+    def test_failed_call_gives_its_slot_back(self):
+        self.completions.error = groq.APITimeoutError(request=httpx.Request("POST", "http://groq.test"))
+        for _ in range(3):
+            with self.assertRaises(gateway.LLMUnavailable):
+                gateway.chat(MESSAGES)
+        self.completions.error = None
+        self.completions.release.set()
+        self.assertEqual(gateway.chat(MESSAGES), "reply")
+
+    def test_deadline_is_passed_to_the_attempt(self):
+        self.completions.release.set()
+        gateway.chat(MESSAGES, timeout=7)
+        timeout = self.completions.timeouts[-1]
+        self.assertTrue(6 < timeout.read <= 7)
+        self.assertEqual(timeout.connect, gateway.DEFAULTS["CONNECT_TIMEOUT"])
+        # Each attempt is capped at ATTEMPT_TIMEOUT
+        with self.settings(LLM_RESILIENCE={"ATTEMPT_TIMEOUT": 2}):
+            gateway.chat(MESSAGES, timeout=7)
+        self.assertEqual(self.completions.timeouts[-1].read, 2)
+
+    def test_async_extra_call_waits_or_times_out(self):
+        async def run():
+            client = await gateway.get_async_client()
+            tasks = [asyncio.create_task(gateway.achat(MESSAGES, timeout=7)) for _ in range(3)]
+            done, _ = await asyncio.wait(tasks, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            self.assertEqual(client.in_flight, 2)
+            busy = done.pop()
+            with self.assertRaisesMessage(gateway.LLMBusy, "Too many concurrent AI requests"):
+                await busy
+            client.release.set()
+            return client, await asyncio.gather(*(task for task in tasks if task is not busy))
+
+        client, replies = async_to_sync(run)()
+        self.assertEqual(replies, ["reply", "reply"])
+        self.assertTrue(all(6 < timeout.read <= 7 for timeout in client.timeouts))
+
+    @override_settings(LLM_GATEWAY={"MAX_CONCURRENCY": 1, "ACQUIRE_TIMEOUT": 0.1})
+    def test_stream_holds_its_slot_until_closed(self):
+        async def run():
+            stream = gateway.astream(MESSAGES)
+            first = await anext(stream)
+            with self.assertRaises(gateway.LLMBusy):
+                await gateway.achat(MESSAGES)
+            await stream.aclose()
+            (await gateway.get_async_client()).release.set()
+            return first, await gateway.achat(MESSAGES)
+
+        self.assertEqual(async_to_sync(run)(), ("a", "reply"))
+
+    def test_async_client_is_closed_with_its_event_loop(self):
+        first = async_to_sync(gateway.get_async_client)()
+        self.assertTrue(first.closed)
+        self.assertTrue(first.http_client.is_closed)
+        # The next loop gets a client of its own
+        second = async_to_sync(gateway.get_async_client)()
+        self.assertIsNot(second, first)
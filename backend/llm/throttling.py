@@ -0,0 +1,347 @@
+"""
+Admission control for the endpoints that call the LLM.
+
+Three DRF throttles, applied in this order:
+
+* ``UserTokenBucketThrottle`` - per-user token bucket (steady ``RATES[scope]``
+  plus ``BURST``); 429 with Retry-After when the bucket is empty.
+* ``UserConcurrencyThrottle`` - at most ``USER_MAX_IN_FLIGHT`` requests per
+  user at a time; 429.
+* ``UpstreamConcurrencyThrottle`` - at most ``GLOBAL_MAX_IN_FLIGHT`` requests
+  in flight overall. Up to ``QUEUE_SIZE`` more may wait ``QUEUE_TIMEOUT``
+  seconds for a slot; anything beyond that gets an immediate 503.
+
+Slots taken by the concurrency throttles are released by
+``llm.middleware.AdmissionSlotsMiddleware`` once the response has been sent
+(for streaming responses, when the stream closes).
+
+State lives in a pluggable backend (``settings.LLM_THROTTLE["BACKEND"]``):
+
+* ``llm.throttling.LocalBackend`` - in-process, for a single worker (default)
+* ``llm.throttling.CacheBackend`` - any Django cache alias
+  (``OPTIONS["ALIAS"]``), so limits hold across workers. It only needs
+  atomic ``add()``; a locmem or database cache works as a local stand-in.
+"""
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    "BACKEND": "llm.throttling.LocalBackend",
+    "OPTIONS": {},
+    "RATES": {},                 # scope -> "n/s|min|hour|day"; missing scope = no rate limit
+    "BURST": 5,                  # bucket size (requests allowed back to back)
+    "USER_MAX_IN_FLIGHT": 2,
+    "GLOBAL_MAX_IN_FLIGHT": 16,
+    "QUEUE_SIZE": 32,            # requests allowed to wait for a global slot
+    "QUEUE_TIMEOUT": 5.0,        # seconds a queued request waits before 503
+    "SLOT_TIMEOUT": 120,         # seconds before a slot held by a dead worker expires
+    "RETRY_AFTER": 2,            # Retry-After for concurrency rejections
+}
+
+_PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+
+
+def get_config(name):
+    return getattr(settings, "LLM_THROTTLE", {}).get(name, DEFAULTS[name])
+
+
+def parse_rate(rate):
+    """``"20/min"`` -> tokens per second."""
+    count, _, period = rate.partition("/")
+    return int(count) / _PERIODS[period]
+
+
+class UpstreamBusy(Throttled):
+    status_code = 503
+    default_detail = "The AI service is busy, please retry shortly."
+
+
+# =========================
+# BACKENDS
+# =========================
+class BaseBackend:
+    def take_token(self, key, rate, burst):
+        """Take one token; return 0 if allowed, else seconds until one is available."""
+        raise NotImplementedError
+
+    def try_acquire(self, key, limit):
+        """Take one of ``limit`` slots under ``key``; return a handle or None."""
+        raise NotImplementedError
+
+    def release(self, handle):
+        raise NotImplementedError
+
+    def wait_for_release(self, key, timeout):
+        """Block for up to ``timeout`` seconds or until a slot under ``key`` frees up."""
+        raise NotImplementedError
+
+    def acquire(self, key, limit, queue_size, timeout):
+        """
+        Take a slot, queueing for up to ``timeout`` seconds if none is free.
+        Returns None straight away when the queue itself is full.
+        """
+        handle = self.try_acquire(key, limit)
+        if handle is not None or queue_size <= 0 or timeout <= 0:
+            return handle
+
+        ticket = self.try_acquire(f"{key}:queue", queue_size)
+        if ticket is None:
+            return None
+        try:
+            deadline = time.monotonic() + timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                self.wait_for_release(key, remaining)
+                handle = self.try_acquire(key, limit)
+                if handle is not None:
+                    return handle
+            return None
+        finally:
+            self.release(ticket)
+
+
+class LocalBackend(BaseBackend):
+    """Per-process state; waiting requests are woken as soon as a slot frees."""
+
+    max_buckets = 10_000
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._buckets = OrderedDict()
+        self._slots = {}
+
+    def take_token(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def try_acquire(self, key, limit):
+        with self._lock:
+            holders = self._slots.get(key, set())
+            if len(holders) >= limit:
+                return None
+            handle = (key, object())
+            holders.add(handle[1])
+            self._slots[key] = holders
+            return handle
+
+    def release(self, handle):
+        key, token = handle
+        with self._lock:
+            holders = self._slots.get(key)
+            if holders is not None:
+                holders.discard(token)
+                if not holders:
+                    del self._slots[key]
+            self._released.notify_all()
+
+    def wait_for_release(self, key, timeout):
+        with self._lock:
+            self._released.wait(timeout)
+
+
+class CacheBackend(BaseBackend):
+    """
+    Shared state in a Django cache. Each slot is its own key taken with
+    ``add()``, so a crashed worker's slot simply expires after SLOT_TIMEOUT.
+    Token buckets are updated under a short per-key lock.
+    """
+
+    poll_interval = 0.05
+    lock_timeout = 0.2
+
+    def __init__(self, ALIAS="default", PREFIX="llm:throttle", **options):
+        self.cache = caches[ALIAS]
+        self.prefix = PREFIX
+
+    def take_token(self, key, rate, burst):
+        bucket_key = f"{self.prefix}:bucket:{key}"
+        lock_key = f"{bucket_key}:lock"
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.cache.add(lock_key, 1, 1):
+            if time.monotonic() > deadline:
+                # Another request of the same user holds the bucket
+                return self.poll_interval
+            time.sleep(self.poll_interval / 5)
+        try:
+            now = time.time()
+            tokens, last = self.cache.get(bucket_key) or (burst, now)
+            tokens = min(burst, tokens + max(0, now - last) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            # A bucket left alone long enough is full again, so it may expire
+            self.cache.set(bucket_key, (tokens, now), int(burst / rate) + 1)
+            return wait
+        finally:
+            self.cache.delete(lock_key)
+
+    def _slot_keys(self, key, limit):
+        start = random.randrange(limit)
+        for i in range(limit):
+            yield f"{self.prefix}:slot:{key}:{(start + i) % limit}"
+
+    def try_acquire(self, key, limit):
+        if limit <= 0:
+            return None
+        token = uuid.uuid4().hex
+        for slot_key in self._slot_keys(key, limit):
+            if self.cache.add(slot_key, token, get_config("SLOT_TIMEOUT")):
+                return (slot_key, token)
+        return None
+
+    def release(self, handle):
+        slot_key, token = handle
+        # Don't free a slot that expired and was taken by someone else
+        if self.cache.get(slot_key) == token:
+            self.cache.delete(slot_key)
+
+    def wait_for_release(self, key, timeout):
+        time.sleep(min(self.poll_interval, timeout))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide throttle backend configured in settings."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(get_config("BACKEND"))(**get_config("OPTIONS"))
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def hold_slot(request, handle):
+    """Remember a slot so AdmissionSlotsMiddleware releases it after the response."""
+    django_request = getattr(request, "_request", request)
+    django_request.__dict__.setdefault("llm_slots", []).append(handle)
+
+
+def release_slots(slots):
+    backend = get_backend()
+    for handle in slots:
+        backend.release(handle)
+
+
+# =========================
+# THROTTLES
+# =========================
+class AdmissionThrottle(BaseThrottle):
+    """
+    DRF asks every throttle even after one has refused the request; once a
+    request is refused the later throttles let it through untouched so it
+    does not take (or queue for) a slot it will never use.
+    """
+
+    def allow_request(self, request, view):
+        if getattr(request, "_admission_refused", False):
+            return True
+        if self.admit(request, view):
+            return True
+        request._admission_refused = True
+        return False
+
+    def admit(self, request, view):
+        raise NotImplementedError
+
+    def user_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"anon:{self.get_ident(request)}"
+
+
+class UserTokenBucketThrottle(AdmissionThrottle):
+    """Per-user token bucket; subclasses set ``scope`` to pick a rate from RATES."""
+
+    scope = None
+
+    def admit(self, request, view):
+        rate = get_config("RATES").get(self.scope)
+        if not rate:
+            return True
+        self._wait = get_backend().take_token(f"{self.scope}:{self.user_key(request)}", parse_rate(rate), get_config("BURST"))
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+def deferred(request):
+    """
+    True when the client asked for a queued job (``Prefer: respond-async`` or
+    ``?async=1``) instead of a live LLM call; see the jobs app.
+    """
+    if "respond-async" in request.headers.get("Prefer", "").lower():
+        return True
+    return request.GET.get("async", "").lower() in ("1", "true", "yes")
+
+
+class UserConcurrencyThrottle(AdmissionThrottle):
+    def admit(self, request, view):
+        if deferred(request):
+            return True
+        handle = get_backend().try_acquire(f"inflight:{self.user_key(request)}", get_config("USER_MAX_IN_FLIGHT"))
+        if handle is None:
+            return False
+        hold_slot(request, handle)
+        return True
+
+    def wait(self):
+        return get_config("RETRY_AFTER")
+
+
+class UpstreamConcurrencyThrottle(AdmissionThrottle):
+    def admit(self, request, view):
+        if deferred(request):
+            # Enqueueing doesn't touch the upstream; the worker calls it later
+            return True
+        handle = get_backend().acquire(
+            "upstream",
+            get_config("GLOBAL_MAX_IN_FLIGHT"),
+            get_config("QUEUE_SIZE"),
+            get_config("QUEUE_TIMEOUT"),
+        )
+        if handle is None:
+            raise UpstreamBusy(wait=get_config("RETRY_AFTER"))
+        hold_slot(request, handle)
+        return True
+
+
+def check_throttles(request, throttles, view=None):
+    """
+    Run ``throttles`` outside an APIView (the async streaming view), raising
+    ``Throttled`` the same way APIView.check_throttles does.
+    """
+    durations = []
+    for throttle_class in throttles:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            durations.append(throttle.wait())
+    if durations:
+        raise Throttled(wait=max((d for d in durations if d is not None), default=None))
@@ -0,0 +1,30 @@
+"""
+Fast local token estimates, so budget checks never need a network call.
+
+The estimate tracks the Llama 3 tokenizer closely enough for budgeting:
+common words are one token, long words are split every ~6 characters,
+punctuation is one token per mark and non-ASCII characters (emoji,
+accents) usually cost one token each.
+"""
+import re
+
+_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+# Per-message overhead of the chat template (role header + separators)
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    count = 0
+    for piece in _PIECES.findall(text):
+        if piece.isascii() and piece.isalpha():
+            count += 1 + (len(piece) - 1) // 6
+        else:
+            count += 1
+    return count
+
+
+def estimate_messages_tokens(messages):
+    return sum(MESSAGE_OVERHEAD + estimate_tokens(m.get("content", "")) for m in messages)
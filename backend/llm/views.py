@@ -0,0 +1,16 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+
+from . import prompts
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def prompt_stats(request):
+    """Per-prompt size, calls, tokens and latency; DELETE resets the counters."""
+    if request.method == 'DELETE':
+        prompts.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(prompts.stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # Queries are counted for the request they run in (see metrics.instrument)
+    from .instrument import time_query
+
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class MetricsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'metrics'
+
+    def ready(self):
+        connection_created.connect(install_query_timer)
@@ -0,0 +1,166 @@
+"""
+Per-request instrumentation.
+
+``metrics.middleware.RequestMetricsMiddleware`` opens a ``RequestStats`` for
+every request and keeps it in a context variable, which follows the request
+into ``sync_to_async`` threads. While it is open:
+
+* every database query is counted and timed (``time_query`` is installed as
+  an execute wrapper on each connection, see ``MetricsConfig``)
+* ``phase(name)`` blocks add their time to the request; authentication,
+  request parsing and LLM calls are timed this way. Phases overlap: ``auth``
+  includes the query that loads the user.
+* ``record_llm`` counts an LLM call, its tokens and model against the route
+
+When the response is done (after the last chunk for streaming responses)
+the totals go into the Prometheus metrics below, labelled by URL route, e.g.
+``api/symptoms/<int:pk>/``. Outside a request (the jobs worker, management
+commands) queries aren't counted and LLM calls are labelled ``route="-"``.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import registry
+
+DEFAULTS = {
+    "ENABLED": True,
+    "PROFILE_DIR": None,         # where slow-request profiles go; None = off
+    "PROFILE_SAMPLE_RATE": 0.0,  # share of requests run under the profiler
+    "PROFILE_SLOW_MS": 500,      # profiles of faster views are thrown away
+    "PROFILE_KEEP": 50,          # newest dumps kept in PROFILE_DIR
+    "PROFILER": "cprofile",      # or "pyinstrument" (must be installed)
+}
+
+UNMATCHED = "unmatched"  # no URL pattern: 404s, static files
+BACKGROUND = "-"         # LLM calls made outside a request
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+REQUESTS = registry.counter(
+    "minimedi_http_requests_total", "HTTP requests served.", ["route", "method", "status"],
+)
+DURATION = registry.histogram(
+    "minimedi_http_request_duration_seconds",
+    "Time from the request entering Django to its response (to the last chunk when streamed).",
+    ["route", "method"],
+)
+DB_QUERIES = registry.histogram(
+    "minimedi_http_request_db_queries", "Database queries run per request.", ["route"], QUERY_BUCKETS,
+)
+DB_TIME = registry.histogram(
+    "minimedi_http_request_db_seconds", "Time per request spent in database queries.", ["route"],
+)
+PHASE_TIME = registry.counter(
+    "minimedi_http_request_phase_seconds_total",
+    "Time spent authenticating, parsing request bodies and waiting for the LLM, summed over requests.",
+    ["route", "phase"],
+)
+LLM_DURATION = registry.histogram(
+    "minimedi_llm_call_duration_seconds",
+    "LLM call latency, retries and fallbacks included.",
+    ["route", "model", "outcome"],
+    LLM_BUCKETS,
+)
+LLM_TOKENS = registry.counter(
+    "minimedi_llm_tokens_total",
+    "LLM tokens as reported by the API (estimated when it didn't say).",
+    ["route", "model", "direction"],
+)
+
+
+def get_config(name):
+    return getattr(settings, "METRICS", {}).get(name, DEFAULTS[name])
+
+
+class RequestStats:
+    __slots__ = ("request", "started", "queries", "db_time", "phases")
+
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.phases = {}
+
+    def route(self):
+        match = getattr(self.request, "resolver_match", None)
+        return match.route if match is not None else UNMATCHED
+
+
+_current = ContextVar("metrics_request", default=None)
+
+
+def current():
+    """The open ``RequestStats``, or None outside a request."""
+    return _current.get()
+
+
+def begin(request):
+    stats = RequestStats(request)
+    _current.set(stats)
+    return stats
+
+
+def end(stats, response):
+    """Record ``stats`` once ``response`` is done; returns the response."""
+    if response.streaming:
+        response._resource_closers.append(lambda: _finish(stats, response))
+    else:
+        _finish(stats, response)
+    return response
+
+
+def _finish(stats, response):
+    elapsed = time.perf_counter() - stats.started
+    route, method = stats.route(), stats.request.method
+    REQUESTS.inc((route, method, str(response.status_code)))
+    DURATION.observe((route, method), elapsed)
+    DB_QUERIES.observe((route,), stats.queries)
+    DB_TIME.observe((route,), stats.db_time)
+    for name, seconds in stats.phases.items():
+        PHASE_TIME.inc((route, name), seconds)
+    if _current.get() is stats:
+        _current.set(None)
+
+
+def time_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the current request's ``name`` phase."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.phases[name] = stats.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def record_llm(model, latency, prompt_tokens, completion_tokens, error=False):
+    """Count one LLM call (``latency`` in seconds) against the current route."""
+    stats = _current.get()
+    route = stats.route() if stats is not None else BACKGROUND
+    if stats is not None:
+        stats.phases["llm"] = stats.phases.get("llm", 0.0) + latency
+    LLM_DURATION.observe((route, model, "error" if error else "ok"), latency)
+    if prompt_tokens:
+        LLM_TOKENS.inc((route, model, "in"), prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.inc((route, model, "out"), completion_tokens)
@@ -0,0 +1,118 @@
+import statistics
+import time
+import timeit
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.client import Client
+
+from metrics import instrument, registry
+from symptoms.models import Symptom
+from users.views import create_jwt
+
+# Microseconds the metrics may add to a request; see METRICS in settings
+BUDGET_US = 50
+
+
+def _noop_execute(sql, params, many, context):
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Cost of the request metrics. Times the instrumentation alone (open a request, "
+        "time its queries and phases, record it), then serves in-process requests with "
+        "METRICS enabled and disabled, alternating one by one, and compares the medians. "
+        "Exits with an error when the instrumentation is over --budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="requests per path and mode")
+        parser.add_argument("--queries", type=int, default=5, help="queries per request for the direct timing")
+        parser.add_argument("--budget", type=float, default=BUDGET_US, help="allowed cost in microseconds per request")
+
+    def handle(self, *args, **options):
+        cost = self._instrumentation_cost(options["queries"])
+        noop = timeit.timeit(lambda: instrument.time_query(_noop_execute, "", (), False, {}), number=100_000) * 10
+        self.stdout.write(f"instrumentation, {options['queries']} queries: {cost:.1f}us per request")
+        self.stdout.write(f"query timer outside a request: {noop:.2f}us per query")
+
+        user = User.objects.create_user(username=f"bench-metrics-{uuid.uuid4().hex[:8]}")
+        try:
+            Symptom.objects.bulk_create([Symptom(user=user, title=f"Benchmark {i}", description="fever") for i in range(20)])
+            pk = Symptom.objects.filter(user=user).values_list("pk", flat=True).first()
+            self._end_to_end(user, pk, options["requests"])
+        finally:
+            Symptom.objects.filter(user=user).bulk_delete()
+            user.delete()
+            registry.reset()
+
+        self.stdout.write(f"budget {options['budget']:.0f}us per request")
+        if cost > options["budget"]:
+            raise CommandError("Request metrics are over their overhead budget")
+
+    def _instrumentation_cost(self, queries):
+        """Microseconds per request spent in metrics code, DB and view excluded."""
+        request = RequestFactory().get("/api/symptoms/")
+        response = HttpResponse()
+
+        def one_request():
+            stats = instrument.begin(request)
+            with instrument.phase("auth"):
+                instrument.time_query(_noop_execute, "", (), False, {})
+            with instrument.phase("parse"):
+                pass
+            for _ in range(queries - 1):
+                instrument.time_query(_noop_execute, "", (), False, {})
+            instrument.end(stats, response)
+
+        try:
+            return min(timeit.repeat(one_request, number=10_000, repeat=5)) * 100
+        finally:
+            registry.reset()
+
+    def _end_to_end(self, user, pk, count):
+        clients = {enabled: self._client(user, enabled) for enabled in (True, False)}
+        paths = [
+            ("history list", "/api/symptoms/", "api/symptoms/"),
+            ("record detail", f"/api/symptoms/{pk}/", "api/symptoms/<int:pk>/"),
+            ("404, no view", "/no-such-page/", instrument.UNMATCHED),
+        ]
+        self.stdout.write(f"\n{'path':<16} {'off us/req':>11} {'on us/req':>10} {'difference':>11} {'queries':>8}")
+        for name, path, route in paths:
+            timings = {True: [], False: []}
+            # One by one, taking turns at going first, so drift in machine
+            # speed and cache warmth hit both modes alike
+            for i in range(count):
+                for enabled in (i % 2 == 0, i % 2 == 1):
+                    timings[enabled].append(self._timed_get(clients[enabled], path, enabled))
+            registry.reset()
+            clients[True].get(path)
+            off, on = (statistics.median(timings[enabled]) * 1e6 for enabled in (False, True))
+            self.stdout.write(
+                f"{name:<16} {off:>11.1f} {on:>10.1f} {on - off:>+9.1f}us {instrument.DB_QUERIES.sum((route,)):>8}"
+            )
+
+    def _client(self, user, enabled):
+        client = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {create_jwt(user)}")
+        # The middleware chain is built on the first request, with these settings;
+        # the first request also caches the user
+        with override_settings(METRICS={"ENABLED": enabled}):
+            client.get("/api/symptoms/")
+        return client
+
+    def _timed_get(self, client, path, enabled):
+        # Disabled means no query timer either
+        if not enabled:
+            connection.execute_wrappers.remove(instrument.time_query)
+        try:
+            started = time.perf_counter()
+            client.get(path)
+            return time.perf_counter() - started
+        finally:
+            if not enabled:
+                connection.execute_wrappers.append(instrument.time_query)
@@ -0,0 +1,49 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+
+from . import instrument, profiling
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, DB queries and phase timings of every request (see
+    metrics.instrument). Put it first so the latency covers the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrument.get_config("ENABLED"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = instrument.begin(request)
+        return instrument.end(stats, self.get_response(request))
+
+    async def __acall__(self, request):
+        stats = instrument.begin(request)
+        return instrument.end(stats, await self.get_response(request))
+
+
+class SlowRequestProfilerMiddleware(MiddlewareMixin):
+    """
+    Runs a sample of views under a profiler and keeps the slow ones (see
+    metrics.profiling). Put it last: the view is called from process_view, so
+    the process_view hooks of middleware after it would be skipped.
+    """
+
+    def __init__(self, get_response):
+        if not profiling.enabled():
+            raise MiddlewareNotUsed
+        profiling.check()
+        super().__init__(get_response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        return profiling.profile_view(request, view_func, view_args, view_kwargs)
@@ -0,0 +1,23 @@
+from rest_framework import parsers
+
+from .instrument import phase
+
+
+class TimedParserMixin:
+    """Counts body parsing as the request's ``parse`` phase."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        with phase("parse"):
+            return super().parse(stream, media_type, parser_context)
+
+
+class JSONParser(TimedParserMixin, parsers.JSONParser):
+    pass
+
+
+class FormParser(TimedParserMixin, parsers.FormParser):
+    pass
+
+
+class MultiPartParser(TimedParserMixin, parsers.MultiPartParser):
+    pass
@@ -0,0 +1,126 @@
+"""
+Profiles of slow requests.
+
+A share (``PROFILE_SAMPLE_RATE``) of requests to sync views is run under the
+profiler; when the view took at least ``PROFILE_SLOW_MS`` the profile is
+written to ``PROFILE_DIR``, otherwise it is thrown away. Only one request per
+process is profiled at a time, which bounds the cost and keeps profiles from
+mixing. Async views (the streaming chat) are not profiled: the event loop
+interleaves them with other requests.
+
+cProfile dumps (``.prof``) open with ``python -m pstats`` or snakeviz;
+pyinstrument dumps are ``.html``.
+"""
+import importlib.util
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.core.exceptions import ImproperlyConfigured
+
+from .instrument import get_config
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+_busy = threading.Lock()
+
+
+def enabled():
+    return bool(get_config("PROFILE_DIR")) and get_config("PROFILE_SAMPLE_RATE") > 0
+
+
+def check():
+    profiler = get_config("PROFILER")
+    if profiler not in PROFILERS:
+        raise ImproperlyConfigured(f"METRICS['PROFILER'] must be one of {', '.join(PROFILERS)}")
+    if profiler == "pyinstrument" and importlib.util.find_spec("pyinstrument") is None:
+        raise ImproperlyConfigured("METRICS['PROFILER'] is 'pyinstrument' but it isn't installed")
+
+
+class _CProfile:
+    suffix = "prof"
+
+    def __init__(self):
+        import cProfile
+
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class _Pyinstrument:
+    suffix = "html"
+
+    def __init__(self):
+        from pyinstrument import Profiler
+
+        self.profile = Profiler()
+
+    def start(self):
+        self.profile.start()
+
+    def stop(self):
+        self.profile.stop()
+
+    def dump(self, path):
+        Path(path).write_text(self.profile.output_html(), encoding="utf-8")
+
+
+def profile_view(request, view_func, view_args, view_kwargs):
+    """
+    Run ``view_func`` under the profiler if this request is sampled and
+    return its response; None (run the view normally) otherwise.
+    """
+    if iscoroutinefunction(view_func) or random.random() >= get_config("PROFILE_SAMPLE_RATE"):
+        return None
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        profiler = _Pyinstrument() if get_config("PROFILER") == "pyinstrument" else _CProfile()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = view_func(request, *view_args, **view_kwargs)
+        finally:
+            profiler.stop()
+        elapsed = time.perf_counter() - started
+        if elapsed * 1000 >= get_config("PROFILE_SLOW_MS"):
+            save(profiler, request, elapsed)
+        return response
+    finally:
+        _busy.release()
+
+
+def save(profiler, request, elapsed):
+    directory = Path(get_config("PROFILE_DIR"))
+    directory.mkdir(parents=True, exist_ok=True)
+    match = getattr(request, "resolver_match", None)
+    route = re.sub(r"[^A-Za-z0-9]+", "_", match.route if match else request.path).strip("_") or "root"
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+    path = directory / f"{stamp}-{int(elapsed * 1000)}ms-{request.method}-{route}.{profiler.suffix}"
+    profiler.dump(path)
+    _prune(directory)
+    return path
+
+
+def _prune(directory):
+    keep = get_config("PROFILE_KEEP")
+    if not keep:
+        return
+    dumps = sorted(
+        (p for p in directory.iterdir() if p.suffix in (".prof", ".html")),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for path in dumps[:-keep]:
+        path.unlink(missing_ok=True)
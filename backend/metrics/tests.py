@@ -0,0 +1,148 @@
+import pstats
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from symptoms.models import Symptom
+from users.views import create_jwt
+from . import instrument, registry
+
+HISTORY = ('api/symptoms/', 'GET')
+
+
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', email='alice@example.com', password='Secret#1')
+        cls.admin = User.objects.create_user(username='root', email='root@example.com', password='Secret#1', is_staff=True)
+        Symptom.objects.bulk_create([Symptom(user=cls.user, title=f'Check {i}', description='fever') for i in range(3)])
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.user)}')
+
+
+class RequestMetricsTests(MetricsTestCase):
+    def test_latency_and_queries_per_route(self):
+        # One auth lookup and the page
+        with self.assertNumQueries(2):
+            self.client.get('/api/symptoms/')
+        self.client.get('/api/symptoms/')
+
+        self.assertEqual(instrument.REQUESTS.value(HISTORY + ('200',)), 2)
+        self.assertEqual(instrument.DURATION.count(HISTORY), 2)
+        # The second request finds the user in the cache
+        self.assertEqual(instrument.DB_QUERIES.sum(('api/symptoms/',)), 3)
+        self.assertGreater(instrument.DB_TIME.sum(('api/symptoms/',)), 0)
+        self.assertGreater(instrument.PHASE_TIME.value(('api/symptoms/', 'auth')), 0)
+
+    def test_route_label_keeps_cardinality_low(self):
+        for symptom in Symptom.objects.all():
+            self.client.get(f'/api/symptoms/{symptom.pk}/')
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(instrument.REQUESTS.value(('api/symptoms/<int:pk>/', 'GET', '200')), 3)
+        self.assertEqual(instrument.REQUESTS.value((instrument.UNMATCHED, 'GET', '404')), 1)
+
+    def test_body_parsing_is_timed(self):
+        self.client.post('/api/symptoms/', {'title': 'Cough'}, format='json')
+        self.assertGreater(instrument.PHASE_TIME.value(('api/symptoms/', 'parse')), 0)
+
+    def test_streamed_response_is_recorded_after_the_last_chunk(self):
+        response = self.client.get('/api/symptoms/export/ndjson/')
+        route = ('api/symptoms/export/<str:fmt>/', 'GET')
+        self.assertEqual(instrument.DURATION.count(route), 0)
+
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+        self.assertEqual(instrument.DURATION.count(route), 1)
+        # Auth plus the rows read while streaming
+        self.assertGreaterEqual(instrument.DB_QUERIES.sum(('api/symptoms/export/<str:fmt>/',)), 2)
+
+    def test_queries_outside_requests_are_not_counted(self):
+        Symptom.objects.count()
+        self.assertIsNone(instrument.current())
+        self.assertEqual(registry.render().count('minimedi_http_request_db_queries_count'), 0)
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_disabled(self):
+        APIClient().get('/api/symptoms/')
+        self.assertEqual(instrument.DURATION.count(HISTORY), 0)
+
+
+class PrometheusEndpointTests(MetricsTestCase):
+    def test_admin_only(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 401)
+
+    def test_text_format(self):
+        self.client.get('/api/symptoms/')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.admin)}')
+        response = self.client.get('/api/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], registry.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE minimedi_http_request_duration_seconds histogram', body)
+        self.assertIn('minimedi_http_requests_total{route="api/symptoms/",method="GET",status="200"} 1', body)
+        self.assertIn('minimedi_http_request_db_queries_bucket{route="api/symptoms/",le="2"} 1', body)
+        self.assertIn('minimedi_http_request_duration_seconds_count{route="api/symptoms/",method="GET"} 1', body)
+
+
+class RegistryTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = registry.Histogram('test_seconds', 'Test.', ['path'], buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('/a"b',), value)
+
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{path="/a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{path="/a\\"b",le="1"} 3',
+            'test_seconds_bucket{path="/a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{path="/a\\"b"} 3.65',
+            'test_seconds_count{path="/a\\"b"} 4',
+        ])
+
+    def test_registering_twice_returns_the_same_metric(self):
+        self.assertIs(registry.counter('minimedi_http_requests_total', 'x', ['route', 'method', 'status']), instrument.REQUESTS)
+        with self.assertRaises(ValueError):
+            registry.histogram('minimedi_http_requests_total', 'x', ['route'])
+
+
+class SlowRequestProfilerTests(MetricsTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def profile(self, **config):
+        config = {'PROFILE_DIR': str(self.directory), 'PROFILE_SAMPLE_RATE': 1.0, 'PROFILE_SLOW_MS': 0, **config}
+        with override_settings(METRICS=config):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.user)}')
+            response = client.get('/api/symptoms/')
+        self.assertEqual(response.status_code, 200)
+        return sorted(self.directory.iterdir())
+
+    def test_slow_request_is_dumped(self):
+        [dump] = self.profile()
+        self.assertTrue(dump.name.endswith('-GET-api_symptoms.prof'))
+        stats = pstats.Stats(str(dump))
+        self.assertTrue(any(name == 'log_symptom' for _, _, name in stats.stats))
+
+    def test_fast_request_is_discarded(self):
+        self.assertEqual(self.profile(PROFILE_SLOW_MS=60_000), [])
+
+    def test_keeps_the_newest_dumps(self):
+        for _ in range(3):
+            dumps = self.profile(PROFILE_KEEP=2)
+        self.assertEqual(len(dumps), 2)
+
+    def test_off_without_a_directory(self):
+        self.assertEqual(self.profile(PROFILE_DIR=None), [])
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import prometheus
+
+urlpatterns = [
+    path('', prometheus),
+]
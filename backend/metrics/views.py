@@ -0,0 +1,12 @@
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+from . import registry
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def prometheus(request):
+    """This process's request, database and LLM metrics in the Prometheus text format."""
+    return HttpResponse(registry.render(), content_type=registry.CONTENT_TYPE)
@@ -3,6 +3,14 @@ ASGI config for minimedi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is what production serves (``start.sh``, the Render start command):
+
+    gunicorn minimedi.asgi:application -k uvicorn.workers.UvicornWorker
+
+Under a WSGI worker the async streaming chat endpoint (/api/ai-check/stream/)
+would be collected in full before the first byte is sent; under ASGI one
+worker holds many open streams and sends every token as it arrives.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -3,6 +3,8 @@ from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
 
+from users.hashers import hasher_list
+
 # =========================
 # BASE CONFIG
 # =========================
@@ -34,6 +36,137 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 
+# =========================
+# LLM GATEWAY
+# =========================
+LLM_GATEWAY = {
+    "BASE_URL": os.getenv("GROQ_BASE_URL") or None,  # None = Groq default
+    "TIMEOUT": float(os.getenv("LLM_TIMEOUT", "30")),  # seconds per call
+    "CONNECT_TIMEOUT": 5.0,
+    "MAX_RETRIES": 0,  # retries are handled by LLM_RESILIENCE
+    "MAX_CONCURRENCY": int(os.getenv("LLM_MAX_CONCURRENCY", "16")),  # in-flight calls per process
+    "ACQUIRE_TIMEOUT": 10.0,  # wait for a free slot before failing with 503
+    "MAX_CONNECTIONS": 20,
+    "MAX_KEEPALIVE_CONNECTIONS": 10,
+    "KEEPALIVE_EXPIRY": 30.0,
+}
+
+# Deadlines, retries, circuit breakers and model fallback (see llm.resilience)
+LLM_RESILIENCE = {
+    "DEADLINE": float(os.getenv("LLM_DEADLINE", "45")),  # seconds per call, fallbacks included
+    "ATTEMPT_TIMEOUT": float(os.getenv("LLM_ATTEMPT_TIMEOUT", "20")),
+    "MAX_ATTEMPTS": 3,  # per model
+    "BACKOFF_BASE": 0.5,
+    "BACKOFF_MAX": 8.0,
+    "BREAKER_THRESHOLD": 5,  # consecutive failures before a model is skipped
+    "BREAKER_RESET": 30.0,   # seconds before a skipped model is tried again
+    "FALLBACK_MODELS": {
+        "llama-3.3-70b-versatile": ["llama-3.1-8b-instant"],
+    },
+}
+
+# Response cache for repeat symptom checks. Use "llm.cache.DjangoCache" with
+# OPTIONS {"ALIAS": "<cache alias>"} to share entries between workers.
+LLM_CACHE = {
+    "BACKEND": os.getenv("LLM_CACHE_BACKEND", "llm.cache.LRUCache"),
+    "TIMEOUT": int(os.getenv("LLM_CACHE_TTL", "3600")),  # seconds
+    "MAX_ENTRIES": 1024,
+    "OPTIONS": {},
+}
+
+# Admission control for the AI endpoints (see llm.throttling). Switch BACKEND
+# to "llm.throttling.CacheBackend" with OPTIONS {"ALIAS": "<cache alias>"} to
+# enforce the limits across workers.
+LLM_THROTTLE = {
+    "BACKEND": os.getenv("LLM_THROTTLE_BACKEND", "llm.throttling.LocalBackend"),
+    "OPTIONS": {},
+    "RATES": {"ai_check": "20/min", "symptom_check": "30/min", "symptom_batch": "10/hour"},  # per user
+    "BURST": 5,
+    "USER_MAX_IN_FLIGHT": 2,
+    "GLOBAL_MAX_IN_FLIGHT": int(os.getenv("LLM_GLOBAL_MAX_IN_FLIGHT", "16")),
+    "QUEUE_SIZE": 32,      # requests allowed to wait for a global slot
+    "QUEUE_TIMEOUT": 5.0,  # seconds before a queued request gets 503
+    "SLOT_TIMEOUT": 120,   # seconds a slot of a crashed worker stays taken
+    "RETRY_AFTER": 2,
+}
+
+# System prompts live in llm/prompts/<name>/<version>.txt. Pin versions with
+# ACTIVE; split traffic for an A/B test with e.g.
+# EXPERIMENTS = {"consultation": {"v1": 50, "v2": 50}}
+LLM_PROMPTS = {
+    "ACTIVE": {"consultation": os.getenv("CONSULTATION_PROMPT_VERSION", "v1")},
+    "EXPERIMENTS": {},
+}
+
+# Symptom checks ask for JSON mode and validate it (see symptoms.analysis).
+# A check's severity is kept in the default cache (Redis when REDIS_URL is
+# set) so logging the symptom on another worker still picks it up.
+SYMPTOM_ANALYSIS = {
+    "STRUCTURED": os.getenv("SYMPTOM_STRUCTURED_OUTPUT", "true").lower() == "true",
+    "REPROMPT": True,
+    "ASSESSMENT_CACHE_ALIAS": "default",
+    "ASSESSMENT_TIMEOUT": 24 * 3600,
+}
+
+# POST /api/symptoms/check/batch/ (see symptoms.batch)
+SYMPTOM_BATCH = {
+    "MAX_ITEMS": 500,
+    "CONCURRENCY": int(os.getenv("SYMPTOM_BATCH_CONCURRENCY", "8")),
+    "WRITE_BATCH": 50,
+}
+
+# Symptom description/ai_analysis are stored compressed (symptoms.compression).
+# After shipping a new dictionary, point DICTIONARY at it and run
+# manage.py compress_symptom_text
+SYMPTOM_COMPRESSION = {
+    "DICTIONARY": 1,
+    "LEVEL": 6,
+}
+
+# History downloads (symptoms.export)
+SYMPTOM_EXPORT = {
+    "CHUNK_SIZE": 2000,
+    "GZIP_LEVEL": 6,
+}
+
+# Queued LLM jobs (Prefer: respond-async), run by manage.py run_jobs
+JOBS = {
+    "MAX_ATTEMPTS": 3,
+    "LEASE": 300,
+    "MAX_WAIT": 30,
+    "WEBHOOK_HOSTS": [h.strip() for h in os.getenv("JOBS_WEBHOOK_HOSTS", "").split(",") if h.strip()],
+}
+
+# Per-user daily trend rollups (analytics.rollups)
+ANALYTICS = {
+    "TOP_TERMS": 10,
+    "DEFAULT_DAYS": 84,
+    "MAX_DAYS": 731,
+}
+
+# Request/DB/LLM metrics on GET /api/metrics/ (admin only, Prometheus text
+# format, per process; see metrics.instrument). Overhead budget: 50us per
+# request (manage.py bench_metrics; measured ~13us, about 1-2% of a history
+# list request). Set PROFILE_DIR and PROFILE_SAMPLE_RATE to keep profiles
+# of slow requests (metrics.profiling); a profiled request runs ~2x slower.
+METRICS = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "True") == "True",
+    "PROFILE_DIR": os.getenv("PROFILE_DIR") or None,
+    "PROFILE_SAMPLE_RATE": float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    "PROFILE_SLOW_MS": int(os.getenv("PROFILE_SLOW_MS", "500")),
+    "PROFILE_KEEP": 50,
+    "PROFILER": os.getenv("PROFILER", "cprofile"),  # or "pyinstrument"
+}
+
+# Long consultations: once the estimated prompt passes TOKEN_BUDGET, older
+# turns are folded into a running summary (see aicheck.compaction)
+CONVERSATION_COMPACTION = {
+    "TOKEN_BUDGET": int(os.getenv("CHAT_TOKEN_BUDGET", "1500")),
+    "KEEP_RECENT": 6,  # newest messages always sent verbatim
+    "SUMMARY_MODEL": "llama-3.1-8b-instant",
+    "SUMMARY_MAX_TOKENS": 250,
+}
+
 # =========================
 # INSTALLED APPS
 # =========================
@@ -43,6 +176,10 @@ INSTALLED_APPS = [
     "users",
     "aicheck",
     "symptoms",
+    "llm",
+    "jobs",
+    "analytics",
+    "metrics",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -58,6 +195,7 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 # MIDDLEWARE
 # =========================
 MIDDLEWARE = [
+    "metrics.middleware.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -68,6 +206,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "llm.middleware.AdmissionSlotsMiddleware",
+    "metrics.middleware.SlowRequestProfilerMiddleware",
 ]
 
 
@@ -75,6 +215,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "minimedi.urls"
 WSGI_APPLICATION = "minimedi.wsgi.application"
+# What start.sh serves in production; the streaming views need it
+ASGI_APPLICATION = "minimedi.asgi.application"
 
 
 # TEMPLATES
@@ -107,7 +249,7 @@ DATABASES = {
         'HOST': os.getenv("DB_HOST"),
         'PORT': os.getenv("DB_PORT"),
         'OPTIONS': {
-            'sslmode': 'require',  # REQUIRED for Neon
+            'sslmode': os.getenv("DB_SSLMODE", 'require'),  # REQUIRED for Neon; CI's local server has no TLS
         },
     }
 }
@@ -115,6 +257,22 @@ DATABASES = {
 
 # PASSWORD VALIDATION
 
+# Password hashing profile: pbkdf2 (default), scrypt or argon2 (needs
+# argon2-cffi). Parameters are tunable per deployment; stored hashes are
+# upgraded on the next successful login. Benchmark with manage.py bench_login.
+PASSWORD_HASH_PROFILE = os.getenv("PASSWORD_HASH_PROFILE", "pbkdf2")
+PASSWORD_HASHING = {
+    "PBKDF2": {"iterations": int(os.getenv("PBKDF2_ITERATIONS", 1_000_000))},
+    "SCRYPT": {"work_factor": int(os.getenv("SCRYPT_WORK_FACTOR", 2**14)), "block_size": 8, "parallelism": 1},
+    "ARGON2": {
+        "time_cost": int(os.getenv("ARGON2_TIME_COST", 2)),
+        "memory_cost": int(os.getenv("ARGON2_MEMORY_COST", 102400)),  # KiB
+        "parallelism": int(os.getenv("ARGON2_PARALLELISM", 8)),
+    },
+}
+# Preferred hasher first; the rest still verify older hashes
+PASSWORD_HASHERS = hasher_list(PASSWORD_HASH_PROFILE)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
@@ -148,6 +306,21 @@ CORS_ALLOWED_ORIGINS = [
     "https://minimedi.onrender.com",
 ]
 
+# =========================
+# CACHES
+# =========================
+# Per process unless REDIS_URL is set (needs the redis package). The JWT user
+# cache and profile versions (users.authentication) are invalidated on
+# write; only a shared cache makes that reach every worker at once. Symptom
+# check assessments (symptoms.analysis) are kept here too.
+CACHES = {
+    "default": (
+        {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": os.getenv("REDIS_URL")}
+        if os.getenv("REDIS_URL")
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    ),
+}
+
 # =========================
 # DJANGO REST FRAMEWORK
 # =========================
@@ -158,6 +331,36 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    # DRF's defaults, timed as the "parse" phase of the request metrics
+    "DEFAULT_PARSER_CLASSES": [
+        "metrics.parsers.JSONParser",
+        "metrics.parsers.FormParser",
+        "metrics.parsers.MultiPartParser",
+    ],
+}
+
+# JWTAuthentication caches (see users.authentication). Saving or deleting a
+# user drops its entry only in caches the saving process can reach: with the
+# per-process "default" cache, other workers keep accepting a deleted or
+# deactivated user for up to USER_CACHE_TIMEOUT seconds, and old profile
+# claims/ETags for up to PROFILE_VERSION_TIMEOUT. Set REDIS_URL (see
+# CACHES) to make that immediate. LAZY_USER skips the lookup altogether, so a
+# deleted user's token is then accepted until it expires.
+JWT_AUTH = {
+    "TOKEN_CACHE_SIZE": 1024,  # verified tokens remembered per process
+    "USER_CACHE_TIMEOUT": 30,  # seconds a loaded user is trusted, on any worker
+    "USER_CACHE_ALIAS": "default",
+    # Serve request.user from token claims; other fields load on first access
+    "LAZY_USER": os.getenv("JWT_LAZY_USER", "False") == "True",
+    # ProfileView ETags: a profile edit reaches other workers within this
+    "PROFILE_VERSION_TIMEOUT": 60,
+}
+
+# Google sign-in (see users.google). ID tokens need GOOGLE_CLIENT_ID.
+GOOGLE_AUTH = {
+    "CERTS_REFRESH": 3600,          # seconds the JWKS key set is reused
+    "USERINFO_CACHE_TIMEOUT": 300,  # seconds an access token's identity is reused
+    "TIMEOUT": (3.05, 5),           # (connect, read) seconds for calls to Google
 }
 
 # =========================
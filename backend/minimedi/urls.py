@@ -22,5 +22,9 @@ urlpatterns = [
     path("api/users/", include("users.urls")),
     path('api/symptoms/', include('symptoms.urls')),
     path('api/ai-check/', include('aicheck.urls')),
+    path('api/jobs/', include('jobs.urls')),
+    path('api/llm/', include('llm.urls')),
+    path('api/analytics/', include('analytics.urls')),
+    path('api/metrics/', include('metrics.urls')),
 
 ]
\ No newline at end of file
@@ -0,0 +1,11 @@
+#!/usr/bin/env bash
+# Render start command. Serves the ASGI app so the streaming endpoints
+# (SSE chat, NDJSON batch checks, exports) send chunks as they are produced
+# instead of buffering them under a WSGI worker.
+set -o errexit
+
+exec gunicorn minimedi.asgi:application \
+    -k uvicorn.workers.UvicornWorker \
+    --workers "${WEB_CONCURRENCY:-2}" \
+    --bind "0.0.0.0:${PORT:-8000}" \
+    --timeout "${GUNICORN_TIMEOUT:-120}"
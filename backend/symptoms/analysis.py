@@ -0,0 +1,211 @@
+"""
+Prompt and parsing shared by the single, batch and queued symptom checks.
+
+With ``SYMPTOM_ANALYSIS["STRUCTURED"]`` (the default) the model is asked for
+JSON mode with a fixed shape::
+
+    {"causes": [...], "precautions": [...], "severity": "LOW|MEDIUM|HIGH", "risk_score": 0-100}
+
+The reply is parsed and validated once. Only when that fails is it repaired
+locally (code fences or prose around the object) and, failing that, the model
+is reprompted once with the validation errors. If the retry is still invalid
+the check falls back to the old line split, without severity.
+
+Results look like ``{"suggestions": [...], "causes": [...], "precautions":
+[...], "severity": ..., "risk_score": ...}``; ``suggestions`` (causes then
+precautions) is kept for existing clients.
+
+The severity and risk score of every structured check are also kept in a
+Django cache (``ASSESSMENT_CACHE_ALIAS``) so that logging the same
+description afterwards can fill them in, whichever worker ran the check.
+"""
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from llm import gateway, prompts
+from llm.cache import get_response_cache, make_key
+from .serializers import ClinicalAnalysisSerializer
+
+DEFAULTS = {
+    "STRUCTURED": True,  # JSON mode with causes/precautions/severity/risk_score
+    "REPROMPT": True,    # ask again once when the JSON fails validation
+    "ASSESSMENT_CACHE_ALIAS": "default",  # must be shared by the workers
+    "ASSESSMENT_TIMEOUT": 24 * 3600,      # how long after a check logging it picks up the assessment
+}
+
+JSON_MODE = {"response_format": {"type": "json_object"}}
+
+
+def get_config(name):
+    return getattr(settings, "SYMPTOM_ANALYSIS", {}).get(name, DEFAULTS[name])
+
+
+def current_prompt():
+    """The registry prompt for the configured mode (``clinical_json`` or the plain ``clinical`` list)."""
+    return prompts.get("clinical_json" if get_config("STRUCTURED") else "clinical")
+
+
+def clinical_messages(description):
+    return [
+        current_prompt().message(),
+        {
+            "role": "user",
+            "content": description,
+        }
+    ]
+
+
+def cache_key(description):
+    # Also the dedupe key: inputs that normalize the same share one analysis.
+    # Only answers from DEFAULT_MODEL are stored under it (see _settle).
+    return make_key(description, gateway.DEFAULT_MODEL, current_prompt().text)
+
+
+def suggestions_from(text):
+    return [line.strip('- ').strip() for line in text.split('\n') if line.strip()]
+
+
+def _extract_object(text):
+    """The outermost ``{...}`` in ``text``, dropping code fences and prose around it."""
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError('no JSON object in reply')
+    return json.loads(text[start:end + 1])
+
+
+def validate(text):
+    """Return ``(analysis, None)`` for a valid reply, else ``(None, reason)``."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        try:
+            data = _extract_object(text)
+        except ValueError as e:
+            return None, str(e)
+    serializer = ClinicalAnalysisSerializer(data=data)
+    if not serializer.is_valid():
+        return None, json.dumps(serializer.errors)
+    return dict(serializer.validated_data), None
+
+
+def _reprompt(messages, text, error):
+    return messages + [
+        {"role": "assistant", "content": text},
+        {"role": "user", "content": f"That reply did not match the required JSON shape ({error}). Reply with only the corrected JSON object."},
+    ]
+
+
+def result_from(analysis):
+    return {'suggestions': analysis['causes'] + analysis['precautions'], **analysis}
+
+
+def from_cache(value):
+    """Result from a cached value: validated JSON, or raw text from the list prompt."""
+    if value.startswith('{'):
+        return result_from(json.loads(value))
+    return {'suggestions': suggestions_from(value)}
+
+
+def _settle(text, analysis, model):
+    """``(result, value to cache or None)`` once the LLM calls are done."""
+    if analysis is None:
+        # Not cached, so the next check gets another chance at valid JSON
+        return {'suggestions': suggestions_from(text)}, None
+    if model != gateway.DEFAULT_MODEL:
+        # A fallback model answered; don't let it stand in for the primary
+        # model's answer until the cache entry expires
+        return result_from(analysis), None
+    return result_from(analysis), json.dumps(analysis)
+
+
+def complete(description):
+    """Ask the LLM (no cache); returns ``(result, value to cache or None)``."""
+    prompt = current_prompt()
+    messages = clinical_messages(description)
+    if not get_config("STRUCTURED"):
+        text, model = gateway.chat(messages, prompt=prompt, return_model=True)
+        return {'suggestions': suggestions_from(text)}, text if model == gateway.DEFAULT_MODEL else None
+
+    text, model = gateway.chat(messages, prompt=prompt, return_model=True, **JSON_MODE)
+    analysis, error = validate(text)
+    if analysis is None and get_config("REPROMPT"):
+        text, model = gateway.chat(_reprompt(messages, text, error), prompt=prompt, return_model=True, **JSON_MODE)
+        analysis, error = validate(text)
+    return _settle(text, analysis, model)
+
+
+async def acomplete(description):
+    """Async counterpart of ``complete``."""
+    prompt = current_prompt()
+    messages = clinical_messages(description)
+    if not get_config("STRUCTURED"):
+        text, model = await gateway.achat(messages, prompt=prompt, return_model=True)
+        return {'suggestions': suggestions_from(text)}, text if model == gateway.DEFAULT_MODEL else None
+
+    text, model = await gateway.achat(messages, prompt=prompt, return_model=True, **JSON_MODE)
+    analysis, error = validate(text)
+    if analysis is None and get_config("REPROMPT"):
+        text, model = await gateway.achat(_reprompt(messages, text, error), prompt=prompt, return_model=True, **JSON_MODE)
+        analysis, error = validate(text)
+    return _settle(text, analysis, model)
+
+
+def analyze(description):
+    """Result for ``description``, from the response cache or the LLM."""
+    cache = get_response_cache()
+    key = cache_key(description)
+    value = cache.get(key)
+    if value is not None:
+        result = from_cache(value)
+    else:
+        # Use Groq for free AI analysis
+        result, value = complete(description)
+        if value is not None:
+            cache.set(key, value)
+    remember_assessment(key, result)
+    return result
+
+
+def _assessment_key(key):
+    return f"assessment:{key}"
+
+
+def remember_assessment(key, result):
+    """Keep the severity of a structured ``result`` for ``cached_assessment``."""
+    if 'severity' not in result:
+        return
+    assessment = {'severity': result['severity'], 'risk_score': result['risk_score'], 'prompt_version': current_prompt().id}
+    caches[get_config("ASSESSMENT_CACHE_ALIAS")].set(_assessment_key(key), assessment, get_config("ASSESSMENT_TIMEOUT"))
+
+
+def cached_assessment(description):
+    """
+    ``{"severity", "risk_score", "prompt_version"}`` from an earlier
+    structured check of ``description``, or {}. Never calls the LLM.
+    """
+    if not description or not get_config("STRUCTURED"):
+        return {}
+    key = cache_key(description)
+    assessment = caches[get_config("ASSESSMENT_CACHE_ALIAS")].get(_assessment_key(key))
+    if assessment is not None:
+        return assessment
+    # Checked before the assessment was remembered, or evicted there. Not a
+    # lookup on behalf of an LLM call, so it mustn't count in the hit rate
+    value = get_response_cache().get(key, record=False)
+    if value is None:
+        return {}
+    result = from_cache(value)
+    if 'severity' not in result:
+        return {}
+    return {'severity': result['severity'], 'risk_score': result['risk_score'], 'prompt_version': current_prompt().id}
+
+
+def analysis_text(result):
+    """Readable text for ``Symptom.ai_analysis``."""
+    if 'causes' not in result:
+        return '\n'.join(f"- {line}" for line in result['suggestions'])
+    causes = '\n'.join(f"- {line}" for line in result['causes'])
+    precautions = '\n'.join(f"- {line}" for line in result['precautions'])
+    return f"Possible causes:\n{causes}\n\nPrecautions:\n{precautions}"
@@ -1,6 +1,33 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def register_functions(sender, connection, **kwargs):
+    # symptom_text(column) decompresses a CompressedTextField value in SQL;
+    # the FTS triggers use it (see search.py)
+    if connection.vendor == 'sqlite':
+        from .compression import decompress
+        connection.connection.create_function('symptom_text', 1, decompress, deterministic=True)
+
+
+def install_search(sender, using, **kwargs):
+    # Altering a table on SQLite rebuilds it and drops the FTS triggers; on
+    # PostgreSQL, data migrations may have queued rows the trigger couldn't read
+    from django.db import connections
+    from .search import TABLE, install, reindex_pending
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names():
+        install(connection)
+    elif connection.vendor == 'postgresql':
+        reindex_pending(connection)
 
 
 class SymptomsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'symptoms'
+
+    def ready(self):
+        connection_created.connect(register_functions)
+        post_migrate.connect(install_search, sender=self)
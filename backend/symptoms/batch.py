@@ -0,0 +1,207 @@
+"""
+Batch symptom checks.
+
+Identical descriptions (after the same normalization the response cache
+uses) are analyzed once; cached analyses are answered straight away and the
+rest are fanned out to the LLM with at most ``CONCURRENCY`` calls in flight.
+Every item becomes its own Symptom row, written with ``bulk_create`` every
+``WRITE_BATCH`` completed items.
+
+``stream_results`` is a plain generator for WSGI: the calls run on a pool of
+``CONCURRENCY`` threads sharing the process's sync client. Under ASGI, where
+a sync iterator would be read whole before sending, ``astream_results`` makes
+them on the event loop's async client instead.
+
+The response is NDJSON, one line per event as it happens::
+
+    {"type": "result", "index": 3, "suggestions": [...], "severity": "LOW", ...}
+    {"type": "error", "index": 4, "error": "..."}
+    {"type": "saved", "ids": {"3": 812, ...}}
+    {"type": "done", "items": 10, "unique": 7, "cached": 2, "failed": 1, "saved": 9}
+"""
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from analytics import rollups
+from llm import gateway
+from llm.cache import get_response_cache
+from .analysis import acomplete, analysis_text, cache_key, complete, current_prompt, from_cache
+from .models import Symptom
+
+DEFAULTS = {
+    "MAX_ITEMS": 500,
+    "CONCURRENCY": 8,    # LLM calls in flight per batch
+    "WRITE_BATCH": 50,   # rows per bulk_create
+}
+
+
+def get_config(name):
+    return getattr(settings, "SYMPTOM_BATCH", {}).get(name, DEFAULTS[name])
+
+
+def group_items(items):
+    """Return ``{key: {"description": ..., "indexes": [...]}}`` in first-seen order."""
+    groups = {}
+    for index, item in enumerate(items):
+        group = groups.setdefault(cache_key(item['description']), {'description': item['description'], 'indexes': []})
+        group['indexes'].append(index)
+    return groups
+
+
+def lookup_cached(groups):
+    """Results already in the response cache, by group key."""
+    cache = get_response_cache()
+    return {key: from_cache(value) for key in groups if (value := cache.get(key)) is not None}
+
+
+def _line(data):
+    return json.dumps(data) + "\n"
+
+
+def _write_rows(rows):
+    with transaction.atomic():
+        Symptom.objects.bulk_create([row for _, row in rows])
+        rollups.Delta().add(*(row for _, row in rows)).apply()
+    return {str(index): row.pk for index, row in rows}
+
+
+def _store_cache(entries):
+    cache = get_response_cache()
+    for key, text in entries:
+        cache.set(key, text)
+
+
+class _Batch:
+    """Lines, rows and cache entries of one batch, shared by both streams."""
+
+    def __init__(self, user, items, groups, cached, save):
+        self.user = user
+        self.items = items
+        self.groups = groups
+        self.save = save
+        self.pending_rows = []
+        self.cache_entries = []
+        self.stats = {"items": len(items), "unique": len(groups), "cached": len(cached), "failed": 0, "saved": 0}
+        self.prompt_version = current_prompt().id
+
+    def finished(self, key, result, value=None):
+        """Lines for every item sharing ``key``; queues their rows and ``value`` for the cache."""
+        if value is not None:
+            self.cache_entries.append((key, value))
+        lines = []
+        for index in self.groups[key]['indexes']:
+            if result is None:
+                self.stats["failed"] += 1
+                lines.append(_line({"type": "error", "index": index, "error": gateway.UNAVAILABLE_MESSAGE}))
+                continue
+            lines.append(_line({"type": "result", "index": index, **result}))
+            if self.save:
+                item = self.items[index]
+                self.pending_rows.append((index, Symptom(
+                    user=self.user,
+                    title=item['title'],
+                    patient_name=item.get('patient_name'),
+                    age=item.get('age'),
+                    gender=item.get('gender'),
+                    duration=item.get('duration'),
+                    description=item['description'],
+                    ai_analysis=analysis_text(result),
+                    severity=result.get('severity', 'LOW'),
+                    risk_score=result.get('risk_score', 0),
+                    prompt_version=self.prompt_version,
+                )))
+        return lines
+
+    def flush(self, force=False):
+        """
+        Store cache entries and write rows once WRITE_BATCH have piled up (or
+        with ``force``); returns the ``saved`` line when rows were written.
+        """
+        limit = get_config("WRITE_BATCH")
+        if self.cache_entries and (force or len(self.cache_entries) >= limit):
+            entries, self.cache_entries = self.cache_entries, []
+            _store_cache(entries)
+        if self.pending_rows and (force or len(self.pending_rows) >= limit):
+            rows, self.pending_rows = self.pending_rows, []
+            ids = _write_rows(rows)
+            self.stats["saved"] += len(ids)
+            return _line({"type": "saved", "ids": ids})
+        return None
+
+    def done(self):
+        return _line({"type": "done", **self.stats})
+
+
+def stream_results(user, items, groups, cached, save=True):
+    """Generator of NDJSON lines for one batch."""
+    batch = _Batch(user, items, groups, cached, save)
+
+    def analyze(key):
+        try:
+            return complete(groups[key]['description'])
+        except gateway.LLMError:
+            return None, None
+
+    for key, result in cached.items():
+        yield from batch.finished(key, result)
+
+    pool = ThreadPoolExecutor(get_config("CONCURRENCY"), thread_name_prefix="symptom-batch")
+    # Each call runs in a copy of this context, so it's counted against the request
+    futures = {
+        pool.submit(contextvars.copy_context().run, analyze, key): key for key in groups if key not in cached
+    }
+    try:
+        for future in as_completed(futures):
+            yield from batch.finished(futures[future], *future.result())
+            if saved := batch.flush():
+                yield saved
+        if saved := batch.flush(force=True):
+            yield saved
+    finally:
+        # Client went away: stop calling the LLM, but keep what was delivered
+        pool.shutdown(wait=False, cancel_futures=True)
+        batch.flush(force=True)
+
+    yield batch.done()
+
+
+async def astream_results(user, items, groups, cached, save=True):
+    """Async counterpart of ``stream_results``."""
+    batch = _Batch(user, items, groups, cached, save)
+    semaphore = asyncio.Semaphore(get_config("CONCURRENCY"))
+    flush = sync_to_async(batch.flush)
+
+    async def analyze(key):
+        async with semaphore:
+            try:
+                return key, *await acomplete(groups[key]['description'])
+            except gateway.LLMError:
+                return key, None, None
+
+    for key, result in cached.items():
+        for line in batch.finished(key, result):
+            yield line
+
+    tasks = [asyncio.ensure_future(analyze(key)) for key in groups if key not in cached]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            key, result, value = await next_done
+            for line in batch.finished(key, result, value):
+                yield line
+            if saved := await flush():
+                yield saved
+        if saved := await flush(force=True):
+            yield saved
+    finally:
+        # Client went away: stop calling the LLM, but keep what was delivered
+        for task in tasks:
+            task.cancel()
+        await flush(force=True)
+
+    yield batch.done()
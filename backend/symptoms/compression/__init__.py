@@ -0,0 +1,118 @@
+"""
+Compression of large text columns (``CompressedTextField``).
+
+Stored values are ``b"\\x00" + codec + payload``:
+
+* codec ``0``: the UTF-8 text as is (short values compression wouldn't shrink)
+* codec ``n`` (1-255): raw DEFLATE using preset dictionary ``n``
+
+A preset dictionary is text the compressor treats as already seen, so the
+boilerplate every analysis repeats (headings, disclaimers, the DATA block)
+costs a few bytes even in short records. Dictionaries live in
+``dictionaries/<n>.txt``, are never edited once rows use them, and new ones
+come from ``manage.py train_compression_dictionary``. ``settings.
+SYMPTOM_COMPRESSION["DICTIONARY"]`` picks the one used for new writes;
+every shipped dictionary can still be read.
+
+A value without the leading NUL (which UTF-8 text in a text column can't
+contain) is a row written before compression and is read as plain UTF-8
+until ``manage.py compress_symptom_text`` converts it.
+"""
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+DICTIONARY_DIR = Path(__file__).resolve().parent / "dictionaries"
+
+DEFAULTS = {
+    "DICTIONARY": 1,  # dictionary id for new writes; 0 stores without compressing
+    "LEVEL": 6,
+    "MIN_SIZE": 48,   # bytes; shorter values are stored as is
+}
+
+MAGIC = b"\x00"
+STORED = 0
+MAX_DICTIONARY_SIZE = 32 * 1024  # DEFLATE's window; anything earlier is never referenced
+
+
+def get_config(name):
+    return getattr(settings, "SYMPTOM_COMPRESSION", {}).get(name, DEFAULTS[name])
+
+
+@lru_cache(maxsize=None)
+def dictionary(dictionary_id):
+    """The preset dictionary ``dictionary_id``. Raises LookupError if it isn't shipped."""
+    path = DICTIONARY_DIR / f"{dictionary_id}.txt"
+    if not path.exists():
+        raise LookupError(f"Compression dictionary {dictionary_id} is missing")
+    return path.read_bytes()[-MAX_DICTIONARY_SIZE:]
+
+
+def dictionary_ids():
+    return sorted(int(path.stem) for path in DICTIONARY_DIR.glob("*.txt") if path.stem.isdigit())
+
+
+def deflate(data, zdict=None):
+    """Raw DEFLATE of ``data`` (no zlib header or checksum: the column needs neither)."""
+    options = {"zdict": zdict} if zdict else {}
+    compressor = zlib.compressobj(get_config("LEVEL"), zlib.DEFLATED, -zlib.MAX_WBITS, **options)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress(text, dictionary_id=None):
+    """Encode ``text`` for storage."""
+    data = text.encode("utf-8")
+    if dictionary_id is None:
+        dictionary_id = get_config("DICTIONARY")
+    if dictionary_id and len(data) >= get_config("MIN_SIZE"):
+        packed = deflate(data, dictionary(dictionary_id))
+        if len(packed) < len(data):
+            return MAGIC + bytes([dictionary_id]) + packed
+    return MAGIC + bytes([STORED]) + data
+
+
+def codec(value):
+    """Codec byte of a stored value, or None for a legacy plain-text value."""
+    value = bytes(value[:2])
+    if len(value) == 2 and value[:1] == MAGIC:
+        return value[1]
+    return None
+
+
+def decompress(value):
+    """Text of a stored value (``bytes``/``memoryview``, or ``str`` for legacy rows)."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    dictionary_id = codec(value)
+    if dictionary_id is None:
+        return value.decode("utf-8")
+    if dictionary_id == STORED:
+        return value[2:].decode("utf-8")
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=dictionary(dictionary_id))
+    return (decompressor.decompress(value[2:]) + decompressor.flush()).decode("utf-8")
+
+
+def train(samples, size=16 * 1024, min_share=0.02):
+    """
+    A preset dictionary from sample texts: the lines that recur in at least
+    ``min_share`` of the samples, most common last (DEFLATE reaches recent
+    bytes most cheaply), cut to ``size`` bytes.
+    """
+    lines = Counter()
+    for sample in samples:
+        lines.update({line.strip() for line in sample.splitlines() if len(line.strip()) >= 8})
+    threshold = max(2, int(len(samples) * min_share))
+    common = [line for line, count in lines.most_common() if count >= threshold]
+
+    chosen, used = [], 0
+    for line in common:
+        cost = len(line.encode("utf-8")) + 1
+        if used + cost > size:
+            break
+        chosen.append(line)
+        used += cost
+    return "\n".join(reversed(chosen)) + "\n"
@@ -0,0 +1,143 @@
+"""
+Streaming export of a user's symptom history as CSV or NDJSON.
+
+Rows are read with ``QuerySet.iterator(chunk_size=CHUNK_SIZE)`` (a
+server-side cursor on PostgreSQL, chunked fetches elsewhere) as plain value
+tuples, formatted line by line and sent in blocks of about ``FLUSH_BYTES``,
+so memory stays flat however long the history is. With gzip the blocks are
+compressed on the fly, each ending on a sync flush so the client can
+decompress as it receives.
+
+``stream`` is a plain iterator for WSGI, where Django hands it to the server
+chunk by chunk. Under ASGI a sync iterator would be read into memory first,
+so ``astream`` steps the same pipeline a block at a time in the database
+thread instead.
+"""
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import serializers
+
+from .compression import decompress
+from .models import Symptom
+from .serializers import SymptomSerializer
+
+DEFAULTS = {
+    "CHUNK_SIZE": 2000,         # rows fetched per database round trip
+    "FLUSH_BYTES": 64 * 1024,   # size of the blocks handed to the server
+    "GZIP_LEVEL": 6,
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Spreadsheet apps run cells starting with these as formulas
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+_datetime = serializers.DateTimeField()
+
+
+def get_config(name):
+    return getattr(settings, "SYMPTOM_EXPORT", {}).get(name, DEFAULTS[name])
+
+
+def _rows(user, fields):
+    """Value tuples of ``fields`` for the user's records, oldest first."""
+    return (
+        Symptom.objects.filter(user=user).order_by("created_at", "id").values_list(*fields)
+        .iterator(chunk_size=get_config("CHUNK_SIZE"))
+    )
+
+
+def _converters(fields):
+    # Datetimes are rendered as the API renders them (local time, ISO 8601);
+    # values_list() hands over compressed text as stored
+    converters = {"created_at": _datetime.to_representation, "description": decompress, "ai_analysis": decompress}
+    return [converters.get(f) for f in fields]
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    converters = _converters(fields)
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(fields)
+    for row in rows:
+        yield line([
+            _csv_cell(convert(value) if convert and value is not None else value)
+            for convert, value in zip(converters, row)
+        ])
+
+
+def ndjson_lines(rows, fields):
+    converters = _converters(fields)
+    for row in rows:
+        yield json.dumps({
+            field: convert(value) if convert and value is not None else value
+            for field, convert, value in zip(fields, converters, row)
+        }) + "\n"
+
+
+def _blocks(lines):
+    """Join lines into encoded blocks of about FLUSH_BYTES."""
+    limit, pending, size = get_config("FLUSH_BYTES"), [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= limit:
+            yield "".join(pending).encode()
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending).encode()
+
+
+def _gzip(blocks):
+    compressor = zlib.compressobj(get_config("GZIP_LEVEL"), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in blocks:
+        data = compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(user, fmt, fields=None, gzip=False):
+    """Iterator of the export's bytes."""
+    fields = list(fields or SymptomSerializer.Meta.fields)
+    rows = _rows(user, fields)
+    try:
+        lines = csv_lines(rows, fields) if fmt == "csv" else ndjson_lines(rows, fields)
+        blocks = _blocks(lines)
+        yield from _gzip(blocks) if gzip else blocks
+    finally:
+        # Closes the (server-side) cursor when the client goes away early
+        rows.close()
+
+
+async def astream(user, fmt, fields=None, gzip=False):
+    """Async iterator of the same bytes as ``stream``."""
+    blocks = stream(user, fmt, fields, gzip)
+    # Every step runs in the one database thread, as the cursor requires
+    next_block = sync_to_async(lambda: next(blocks, None))
+    try:
+        while (block := await next_block()) is not None:
+            yield block
+    finally:
+        await sync_to_async(blocks.close)()
@@ -0,0 +1,102 @@
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from . import compression
+
+
+class Compressed(bytes):
+    """A stored value as loaded from the database, not yet decompressed."""
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """Decompresses on first access and keeps both forms on the instance."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, Compressed):
+            text = compression.decompress(value)
+            instance.__dict__[self.field.attname] = text
+            # Saved again unchanged, the stored bytes are reused as they are
+            instance.__dict__.setdefault('_compressed_originals', {})[self.field.attname] = (text, value)
+            value = text
+        return value
+
+    def __set__(self, instance, value):
+        # A data descriptor, so reads go through __get__ even once loaded
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """
+    A TextField stored compressed in a binary column (see
+    ``symptoms.compression``). Text is decompressed when the attribute is
+    first read, so rows loaded only for other fields never pay for it.
+
+    ``values()``/``values_list()`` don't go through the attribute and return
+    ``Compressed`` bytes; pass them to ``compression.decompress``. Text
+    lookups (``icontains`` etc.) don't work on the stored bytes.
+    """
+    descriptor_class = CompressedTextDescriptor
+
+    def db_type(self, connection):
+        return models.BinaryField().db_type(connection)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            # NULL, or a legacy text value (SQLite keeps the storage class)
+            return value
+        value = bytes(value)
+        if compression.codec(value) is None:
+            return value.decode('utf-8')
+        return Compressed(value)
+
+    def to_python(self, value):
+        if isinstance(value, Compressed):
+            return compression.decompress(value)
+        return super().to_python(value)
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        original = model_instance.__dict__.get('_compressed_originals', {}).get(self.attname)
+        if original is not None and original[0] == value:
+            return original[1]
+        return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        if not isinstance(value, Compressed):
+            value = compression.compress(str(value))
+        return connection.Database.Binary(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+class SearchTextField(models.JSONField):
+    """
+    ``{field: plain text}`` for the compressed fields a write changes, handed
+    to the PostgreSQL search trigger in the same statement (see
+    ``symptoms.search``). The trigger indexes the text and clears the
+    column, so it is NULL at rest; other databases never store it.
+    """
+
+    def pre_save(self, model_instance, add):
+        text = {}
+        for field in model_instance._meta.concrete_fields:
+            if not isinstance(field, CompressedTextField) or field.attname not in model_instance.__dict__:
+                continue
+            value = model_instance.__dict__[field.attname]
+            original = model_instance.__dict__.get('_compressed_originals', {}).get(field.attname)
+            if not add and (isinstance(value, Compressed) or (original is not None and original[0] == value)):
+                # Written back as stored, so the index entry still holds
+                continue
+            text[field.attname] = getattr(model_instance, field.attname)
+        return text or None
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if connection.vendor != 'postgresql':
+            return None
+        return super().get_db_prep_value(value, connection, prepared)
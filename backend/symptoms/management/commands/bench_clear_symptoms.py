@@ -0,0 +1,58 @@
+import time
+import tracemalloc
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models.signals import post_delete
+
+from symptoms.models import Symptom
+
+
+def _noop_receiver(sender, **kwargs):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time clear-all for 1k/10k/100k symptom rows: the chunked bulk_delete() path versus "
+        "Django's collector (forced by attaching a post_delete receiver). Uses a throwaway user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f"bench-clear-{uuid.uuid4().hex[:8]}")
+        try:
+            self.stdout.write(f"{'rows':>8} {'path':>10} {'deleted':>8} {'seconds':>9} {'peak_mb':>9}")
+            for rows in options["rows"]:
+                self._run(user, rows, "bulk", lambda: Symptom.objects.filter(user=user).bulk_delete(options["chunk_size"]))
+                self._run(user, rows, "collector", lambda: self._collector_delete(user))
+        finally:
+            Symptom.objects.filter(user=user).bulk_delete()
+            user.delete()
+
+    def _collector_delete(self, user):
+        post_delete.connect(_noop_receiver, sender=Symptom)
+        try:
+            return Symptom.objects.filter(user=user).delete()[0]
+        finally:
+            post_delete.disconnect(_noop_receiver, sender=Symptom)
+
+    def _run(self, user, rows, label, clear):
+        Symptom.objects.bulk_create(
+            (
+                Symptom(user=user, title="Benchmark", description="fever, headache " * 20, ai_analysis="rest " * 200)
+                for _ in range(rows)
+            ),
+            batch_size=2000,
+        )
+        tracemalloc.start()
+        started = time.perf_counter()
+        deleted = clear()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{rows:>8} {label:>10} {deleted:>8} {elapsed:>9.3f} {peak / 2**20:>9.2f}")
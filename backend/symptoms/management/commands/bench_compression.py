@@ -0,0 +1,117 @@
+import random
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from symptoms import compression
+from symptoms.fields import Compressed
+from symptoms.models import Symptom
+from symptoms.serializers import LIST_FIELDS
+
+CAUSES = [
+    "Viral infection", "Common cold", "Influenza (flu)", "Seasonal allergies", "Dehydration",
+    "Tension headache", "Migraine", "Gastroenteritis", "Sinusitis", "Stress or anxiety",
+]
+PRECAUTIONS = [
+    "Rest and drink plenty of fluids", "See a doctor if symptoms persist beyond 3 days",
+    "Monitor your temperature twice a day", "Avoid strenuous activity", "Eat light, bland meals",
+]
+SYMPTOMS = ["fever", "headache", "cough", "sore throat", "nausea", "fatigue", "body ache", "dizziness", "runny nose"]
+NAMES = ["Asha", "Ravi", "Meera", "John", "Fatima", "Arjun", "Li", "Sara"]
+
+
+def sample_record(rng):
+    """A description and analysis shaped like the ones the consultation flow stores."""
+    name, symptoms = rng.choice(NAMES), rng.sample(SYMPTOMS, rng.randint(1, 4))
+    causes, precautions = rng.sample(CAUSES, 5), rng.sample(PRECAUTIONS, 3)
+    turns = [
+        f"I'm sorry to hear you're not feeling well, {name}. Could you tell me your age, gender and how many days you have had these symptoms?",
+        f"Thank you, {name}. Based on the information you've provided ({', '.join(symptoms)} for {rng.randint(1, 14)} days), here is a detailed analysis.\n\n"
+        "**Possible Causes:**\n" + "\n".join(f"{i}. **{c}**: may explain the {rng.choice(symptoms)}." for i, c in enumerate(causes, 1))
+        + "\n\n**Precautions:**\n" + "\n".join(f"{i}. **{p}**" for i, p in enumerate(precautions, 1))
+        + "\n\nIt's important to consult a healthcare professional for an accurate diagnosis, especially if your symptoms worsen or persist."
+        f"\n\nThank you {name}! I have saved this consultation to your history for your records.",
+    ]
+    return ", ".join(symptoms), "\n\n".join(turns)
+
+
+class Command(BaseCommand):
+    help = (
+        "Storage ratio and read-path cost of the compressed symptom text columns. Writes N "
+        "consultation-shaped records twice for a throwaway user, compressed with the current "
+        "dictionary and stored uncompressed, then compares bytes on disk and load times."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=3, help="read timings keep the best of this many runs")
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        records = [sample_record(rng) for _ in range(options["rows"])]
+        user = User.objects.create_user(username=f"bench-compress-{uuid.uuid4().hex[:8]}")
+        dictionary_id = compression.get_config("DICTIONARY")
+        try:
+            ids = {}
+            for label, target in (("plain", 0), ("compressed", dictionary_id)):
+                for start in range(0, len(records), 2000):
+                    Symptom.objects.bulk_create([
+                        Symptom(
+                            user=user, title=label,
+                            description=Compressed(compression.compress(description, target)),
+                            ai_analysis=Compressed(compression.compress(analysis, target)),
+                        )
+                        for description, analysis in records[start:start + 2000]
+                    ])
+                ids[label] = list(Symptom.objects.filter(user=user, title=label).values_list("pk", flat=True))
+
+            raw = sum(len(d.encode()) + len(a.encode()) for d, a in records)
+            no_dictionary = sum(
+                len(compression.deflate(d.encode())) + len(compression.deflate(a.encode())) + 4 for d, a in records
+            )
+            self.stdout.write(f"{len(records)} records, {raw / len(records):.0f} bytes of text each on average")
+            self.stdout.write(f"  zlib, no dictionary        {raw / no_dictionary:.2f}x")
+            for label in ("plain", "compressed"):
+                stored = self._stored_bytes(ids[label])
+                self.stdout.write(f"  {label + ' (stored bytes)':<26} {raw / stored:.2f}x  ({stored / 2**20:.2f} MB)")
+
+            self.stdout.write(f"\n{'read path':<30} {'plain us/row':>13} {'compressed':>11} {'overhead':>9}")
+            paths = [
+                ("history list (.only)", lambda pks: [s.title for s in Symptom.objects.filter(pk__in=pks).only(*LIST_FIELDS)]),
+                ("rows loaded, text unread", lambda pks: [s.title for s in Symptom.objects.filter(pk__in=pks)]),
+                ("rows loaded, text read", lambda pks: [(s.description, s.ai_analysis) for s in Symptom.objects.filter(pk__in=pks)]),
+            ]
+            for name, read in paths:
+                plain = self._best(read, ids["plain"], options["repeat"])
+                packed = self._best(read, ids["compressed"], options["repeat"])
+                per_row = 1e6 / len(records)
+                self.stdout.write(f"{name:<30} {plain * per_row:>13.1f} {packed * per_row:>11.1f} {packed / plain - 1:>+9.0%}")
+        finally:
+            Symptom.objects.filter(user=user).bulk_delete()
+            user.delete()
+
+    def _stored_bytes(self, pks):
+        size = "octet_length" if connection.vendor == "postgresql" else "length"
+        total = 0
+        with connection.cursor() as cursor:
+            for start in range(0, len(pks), 500):
+                chunk = pks[start:start + 500]
+                cursor.execute(
+                    f"SELECT SUM(COALESCE({size}(description), 0) + COALESCE({size}(ai_analysis), 0)) "
+                    f"FROM {Symptom._meta.db_table} WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                    chunk,
+                )
+                total += cursor.fetchone()[0] or 0
+        return total
+
+    def _best(self, read, pks, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for start in range(0, len(pks), 500):
+                read(pks[start:start + 500])
+            timings.append(time.perf_counter() - started)
+        return min(timings)
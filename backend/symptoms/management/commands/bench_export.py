@@ -0,0 +1,99 @@
+import asyncio
+import json
+import resource
+import sys
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from symptoms import export
+from symptoms.models import Symptom
+from symptoms.serializers import SymptomSerializer
+from users.views import create_jwt
+
+
+def _peak_rss_mb():
+    # ru_maxrss is the process peak: KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+class Command(BaseCommand):
+    help = (
+        "Export N symptom rows of a throwaway user through the export endpoint, under the WSGI "
+        "and the ASGI handler, as CSV/NDJSON (plain and gzip), and report throughput and the "
+        "process's peak RSS after each path. "
+        "With --compare, also build the whole export in memory with SymptomSerializer(many=True)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--compare", action="store_true", help="also time the buffered serializer path (run last)")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        user = User.objects.create_user(username=f"bench-export-{uuid.uuid4().hex[:8]}")
+        try:
+            # bulk_create would list() a generator, so insert batch by batch
+            # to keep the starting peak low
+            for start in range(0, rows, 2000):
+                Symptom.objects.bulk_create([
+                    Symptom(
+                        user=user, title=f"Benchmark {i}", patient_name="Bench", age=40, gender="Other",
+                        severity="MEDIUM", risk_score=i % 100, duration=i % 30,
+                        description=f"fever, headache, sore throat ({i}) " * 4,
+                        ai_analysis="Possible causes:\n- Viral infection\n\nPrecautions:\n- Rest " * 10,
+                    )
+                    for i in range(start, min(start + 2000, rows))
+                ])
+            self.stdout.write(f"{rows} rows, peak RSS before exporting {_peak_rss_mb():.1f} MB")
+            self.stdout.write(f"{'path':>16} {'seconds':>8} {'rows/s':>9} {'MB out':>8} {'MB/s':>7} {'peak_rss_mb':>12}")
+            headers = {"Authorization": f"Bearer {create_jwt(user)}"}
+            for fmt in export.CONTENT_TYPES:
+                for gzip in (False, True):
+                    path = f"/api/symptoms/export/{fmt}/"
+                    if gzip:
+                        headers["Accept-Encoding"] = "gzip"
+                    else:
+                        headers.pop("Accept-Encoding", None)
+                    label = f"{fmt}{'+gzip' if gzip else ''}"
+                    self._run(f"{label} wsgi", rows, lambda: self._wsgi(path, headers))
+                    self._run(f"{label} asgi", rows, lambda: asyncio.run(self._asgi(path, headers)))
+            if options["compare"]:
+                # Last, since the peak it leaves behind would hide the others
+                self._run("buffered", rows, lambda: self._buffered(user))
+        finally:
+            Symptom.objects.filter(user=user).bulk_delete()
+            user.delete()
+
+    # The test clients' host; the async one always sends it
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    def _wsgi(self, path, headers):
+        response = Client().get(path, headers=headers)
+        assert response.status_code == 200 and not response.is_async, response
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    async def _asgi(self, path, headers):
+        response = await AsyncClient().get(path, headers=headers)
+        assert response.status_code == 200 and response.is_async, response
+        size = 0
+        async for chunk in response.streaming_content:
+            size += len(chunk)
+        return size
+
+    def _buffered(self, user):
+        data = SymptomSerializer(Symptom.objects.filter(user=user).order_by("created_at", "id"), many=True).data
+        return len(json.dumps(data).encode())
+
+    def _run(self, label, rows, export_all):
+        started = time.perf_counter()
+        size = export_all()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:>16} {elapsed:>8.2f} {rows / elapsed:>9.0f} {size / 2**20:>8.1f} "
+            f"{size / 2**20 / elapsed:>7.1f} {_peak_rss_mb():>12.1f}"
+        )
@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from symptoms import compression
+from symptoms.fields import Compressed
+from symptoms.models import Symptom
+
+FIELDS = ["description", "ai_analysis"]
+
+
+def _stored_size(value):
+    if value is None:
+        return 0
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert symptom description/ai_analysis values to the current compression "
+        "dictionary (SYMPTOM_COMPRESSION['DICTIONARY']) in primary-key chunks, one short "
+        "transaction each. Run after the 0010 migration to compress existing rows; with "
+        "--dictionary 0 it stores everything uncompressed again (before migrating back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dictionary", type=int, default=None, help="target dictionary id (0 = store uncompressed)")
+        parser.add_argument("--dry-run", action="store_true", help="report the sizes without writing")
+
+    def handle(self, *args, **options):
+        target = compression.get_config("DICTIONARY") if options["dictionary"] is None else options["dictionary"]
+        if target and target not in compression.dictionary_ids():
+            raise CommandError(f"Dictionary {target} is not shipped")
+
+        started = time.perf_counter()
+        last, seen, changed, before, after = 0, 0, 0, 0, 0
+        while True:
+            with transaction.atomic():
+                # Locked so a concurrent PATCH can't be overwritten with older text
+                rows = list(
+                    Symptom.objects.select_for_update()
+                    .filter(pk__gt=last).order_by("pk")
+                    .values_list("pk", *FIELDS)[:options["batch_size"]]
+                )
+                if not rows:
+                    break
+                updates = {}
+                for pk, *values in rows:
+                    encoded = [self._encode(value, target) for value in values]
+                    before += sum(_stored_size(v) for v in values)
+                    after += sum(_stored_size(v) for v in encoded)
+                    if encoded != list(values):
+                        updates[pk] = encoded
+                if updates and not options["dry_run"]:
+                    self._write(updates)
+            seen, changed, last = seen + len(rows), changed + len(updates), rows[-1][0]
+            self.stdout.write(f"{seen} rows scanned, {changed} re-encoded")
+
+        ratio = before / after if after else 1
+        self.stdout.write(
+            f"{'Would re-encode' if options['dry_run'] else 'Re-encoded'} {changed} of {seen} rows "
+            f"in {time.perf_counter() - started:.1f}s: {before / 2**20:.2f} MB -> {after / 2**20:.2f} MB ({ratio:.2f}x)"
+        )
+
+    def _write(self, updates):
+        # One UPDATE per chunk. Not bulk_update(): it reads the values back
+        # through the model attribute, which would decompress them again
+        columns = {}
+        for index, name in enumerate(FIELDS):
+            field = Symptom._meta.get_field(name)
+            columns[name] = Case(
+                *(When(pk=pk, then=Value(values[index], output_field=field)) for pk, values in updates.items()),
+                output_field=field,
+            )
+        # The plain text too, for the PostgreSQL search trigger
+        search_text = Symptom._meta.get_field("search_text")
+        columns["search_text"] = Case(
+            *(
+                When(pk=pk, then=Value(dict(zip(FIELDS, map(compression.decompress, values))), output_field=search_text))
+                for pk, values in updates.items()
+            ),
+            output_field=search_text,
+        )
+        Symptom.objects.filter(pk__in=list(updates)).update(**columns)
+
+    def _encode(self, value, target):
+        """The value as stored with ``target``; unchanged if it already is."""
+        if value is None or (isinstance(value, Compressed) and compression.codec(value) == target):
+            return value
+        return Compressed(compression.compress(compression.decompress(value), target))
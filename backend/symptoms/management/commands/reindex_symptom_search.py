@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from symptoms import search
+from symptoms.models import Symptom
+
+
+class Command(BaseCommand):
+    help = (
+        "Index the symptoms the PostgreSQL search trigger queued because they were written "
+        "without their plain text (raw SQL, data migrations). Migrate does this too; run it "
+        "after such writes outside a migration. --all refills the whole index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="refill every row, not just the queued ones")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="rows per statement")
+
+    def handle(self, *args, **options):
+        connection = connections[Symptom.objects.db]
+        if connection.vendor != "postgresql":
+            raise CommandError("Only the PostgreSQL index is maintained outside the database")
+
+        started = time.perf_counter()
+        if options["all"]:
+            search.reindex(connection, options["chunk_size"])
+            self.stdout.write(f"Reindexed every symptom in {time.perf_counter() - started:.1f}s")
+        else:
+            done = search.reindex_pending(connection, options["chunk_size"])
+            self.stdout.write(f"Indexed {done} queued symptoms in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,60 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from symptoms import compression
+from symptoms.models import Symptom
+
+
+class Command(BaseCommand):
+    help = (
+        "Train a new preset compression dictionary from a sample of symptom texts and write "
+        "it as the next symptoms/compression/dictionaries/<id>.txt. Compares it with the "
+        "current one on held-out rows. Ship the file, set SYMPTOM_COMPRESSION['DICTIONARY'] "
+        "to the new id and run compress_symptom_text."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=5000, help="rows to sample")
+        parser.add_argument("--size", type=int, default=16 * 1024, help="dictionary size in bytes")
+        parser.add_argument("--dry-run", action="store_true", help="only report, don't write the file")
+
+    def handle(self, *args, **options):
+        texts = [
+            text
+            for symptom in Symptom.objects.only("description", "ai_analysis").order_by("-pk")[:options["sample"]]
+            for text in (symptom.description, symptom.ai_analysis)
+            if text
+        ]
+        if len(texts) < 10:
+            raise CommandError("Not enough symptom text to train on")
+        random.Random(0).shuffle(texts)
+        held_out, training = texts[:len(texts) // 5], texts[len(texts) // 5:]
+
+        trained = compression.train(training, size=options["size"])
+        new_id = max(compression.dictionary_ids(), default=0) + 1
+        if new_id > 255:
+            raise CommandError("All 255 dictionary ids are taken")
+
+        data = trained.encode("utf-8")[-compression.MAX_DICTIONARY_SIZE:]
+        current = compression.get_config("DICTIONARY")
+        candidates = [("no dictionary", None)]
+        if current:
+            candidates.append((f"dictionary {current} (current)", compression.dictionary(current)))
+        candidates.append((f"trained, {len(data)} bytes", data))
+
+        raw = sum(len(t.encode("utf-8")) for t in held_out)
+        self.stdout.write(f"{len(training)} training / {len(held_out)} held-out texts ({raw} bytes)")
+        for label, zdict in candidates:
+            stored = sum(self._stored_size(t, zdict) for t in held_out)
+            self.stdout.write(f"  {label:<28} {raw / stored:.2f}x")
+
+        if not options["dry_run"]:
+            path = compression.DICTIONARY_DIR / f"{new_id}.txt"
+            path.write_text(trained, encoding="utf-8")
+            self.stdout.write(f"Wrote {path}")
+
+    def _stored_size(self, text, zdict):
+        # As compression.compress() would store it: header, then the smaller encoding
+        data = text.encode("utf-8")
+        return 2 + min(len(data), len(compression.deflate(data, zdict)))
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aicheck', '0003_conversation_compaction'),
+        ('symptoms', '0005_symptom_patient_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='symptom',
+            name='conversation',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='symptom', to='aicheck.conversation'),
+        ),
+    ]
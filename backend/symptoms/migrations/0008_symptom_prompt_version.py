@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('symptoms', '0007_symptom_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='symptom',
+            name='prompt_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from symptoms import search
+    search.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from symptoms import search
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text search index (see symptoms/search.py). On PostgreSQL filling the
+    new column updates every row and building the GIN index scans the table;
+    run it in a quiet window on large installs.
+    """
+
+    dependencies = [
+        ('symptoms', '0008_symptom_prompt_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
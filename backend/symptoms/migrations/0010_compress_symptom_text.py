@@ -0,0 +1,73 @@
+from django.db import migrations
+
+import symptoms.fields
+
+TABLE = 'symptoms_symptom'
+COLUMNS = ['description', 'ai_analysis']
+
+
+def drop_search(apps, schema_editor):
+    # The PostgreSQL search column was generated from these columns, and the
+    # SQLite FTS table read them directly; search.install() recreates both
+    # in a form that reads decompressed text
+    from symptoms import search
+    search.uninstall(schema_editor.connection)
+
+
+def install_search(apps, schema_editor):
+    from symptoms import search
+    search.install(schema_editor.connection)
+
+
+def alter_columns(apps, schema_editor, forward=True):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        # Existing text becomes its UTF-8 bytes, read as legacy plain text
+        # until manage.py compress_symptom_text converts it. Going back only
+        # works once the rows are stored uncompressed (--dictionary 0).
+        for column in COLUMNS:
+            if forward:
+                using = f"convert_to({column}, 'UTF8')"
+                schema_editor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN {column} TYPE bytea USING {using}")
+            else:
+                using = f"convert_from(CASE WHEN get_byte({column}, 0) = 0 THEN substring({column} from 3) ELSE {column} END, 'UTF8')"
+                schema_editor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN {column} TYPE text USING {using}")
+        return
+
+    # SQLite columns take any storage class, so the type is left alone (the
+    # next table rebuild picks up BLOB); on the way back, decompress in place
+    if connection.vendor == 'sqlite' and not forward:
+        schema_editor.execute(f"UPDATE {TABLE} SET {', '.join(f'{c} = symptom_text({c})' for c in COLUMNS)}")
+
+
+def restore_columns(apps, schema_editor):
+    alter_columns(apps, schema_editor, forward=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('symptoms', '0009_symptom_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search, install_search),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='symptom',
+                    name='description',
+                    field=symptoms.fields.CompressedTextField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='symptom',
+                    name='ai_analysis',
+                    field=symptoms.fields.CompressedTextField(blank=True, null=True),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(alter_columns, restore_columns),
+            ],
+        ),
+        migrations.RunPython(install_search, drop_search),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+import symptoms.fields
+from django.db import migrations
+
+
+def install_trigger(apps, schema_editor):
+    from symptoms import search
+    search.install(schema_editor.connection)
+
+
+def drop_trigger(apps, schema_editor):
+    from symptoms import search
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in search.PG_UNINSTALL_TRIGGER:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    """
+    PostgreSQL keeps search_vector up to date with a trigger from here on,
+    fed the plain text of compressed fields through search_text (see
+    symptoms/search.py). Adding the nullable column doesn't rewrite the table.
+    """
+
+    dependencies = [
+        ('symptoms', '0010_compress_symptom_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='symptom',
+            name='search_text',
+            field=symptoms.fields.SearchTextField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(install_trigger, drop_trigger),
+    ]
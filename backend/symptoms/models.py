@@ -1,8 +1,53 @@
 from django.db import models
+from django.db.models.deletion import Collector
 from django.contrib.auth.models import User
 
+from .fields import CompressedTextField, SearchTextField
+
+# Text the search index can only get from the application (see search.py)
+COMPRESSED_FIELDS = ('description', 'ai_analysis')
+
+
+class SymptomQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Plain values for the compressed fields also go to the search trigger
+        text = {f: kwargs[f] for f in COMPRESSED_FIELDS if f in kwargs and (kwargs[f] is None or isinstance(kwargs[f], str))}
+        if text and 'search_text' not in kwargs:
+            kwargs['search_text'] = text
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        changed = [f for f in COMPRESSED_FIELDS if f in fields]
+        if changed and 'search_text' not in fields:
+            for obj in objs:
+                obj.search_text = {f: getattr(obj, f) for f in changed}
+            fields = [*fields, 'search_text']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def bulk_delete(self, chunk_size=5000):
+        """
+        Delete the matching rows with set-based DELETEs of at most
+        ``chunk_size`` rows and return the number deleted. Rows are never
+        loaded into memory. Falls back to the regular collector when signals
+        or cascades need the instances.
+        """
+        if not Collector(using=self.db, origin=self).can_fast_delete(self):
+            return self.delete()[0]
+
+        deleted = 0
+        while True:
+            # One statement per chunk; under autocommit each is its own
+            # short transaction, so locks are never held for the whole set
+            chunk = self.model._base_manager.using(self.db).filter(pk__in=self.values('pk')[:chunk_size])
+            count, _ = chunk.delete()
+            deleted += count
+            if count < chunk_size:
+                return deleted
+
+
 class Symptom(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='symptoms', null=True, blank=True)
+    # Indexed through the (user, created_at, id) composite index in Meta
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='symptoms', null=True, blank=True, db_index=False)
     patient_name = models.CharField(max_length=100, null=True, blank=True)
     title = models.CharField(max_length=200)
     
@@ -13,11 +58,32 @@ class Symptom(models.Model):
     risk_score = models.IntegerField(default=0) # 0 to 100
     duration = models.IntegerField(null=True, blank=True) # in days
     
-    # Detailed analysis
-    description = models.TextField(blank=True, null=True) # User's symptoms
-    ai_analysis = models.TextField(blank=True, null=True) # AI's suggestions and precautions
+    # Detailed analysis, stored compressed and decompressed on first access
+    description = CompressedTextField(blank=True, null=True) # User's symptoms
+    ai_analysis = CompressedTextField(blank=True, null=True) # AI's suggestions and precautions
+    # Write-only: their plain text for the PostgreSQL search trigger, NULL at rest
+    search_text = SearchTextField(null=True, blank=True, editable=False)
     
+    # Set when the record was produced by an AI consultation
+    conversation = models.OneToOneField('aicheck.Conversation', on_delete=models.SET_NULL, related_name='symptom', null=True, blank=True)
+    # llm.prompts id ("clinical_json@v1") of the prompt that produced ai_analysis
+    prompt_version = models.CharField(max_length=64, blank=True, default='')
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SymptomQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Every per-user query filters on user and orders newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='symptom_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.title}" if self.user else self.title
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(COMPRESSED_FIELDS) & set(update_fields):
+            kwargs['update_fields'] = [*update_fields, 'search_text']
+        super().save(*args, **kwargs)
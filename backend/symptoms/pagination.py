@@ -0,0 +1,96 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on ``(created_at, id)``, newest first.
+
+    Each page is one indexed range scan (``WHERE (created_at, id) < cursor
+    ORDER BY created_at DESC, id DESC LIMIT n``), so the cost of a page does
+    not grow with the number of records before it.
+    """
+    default_limit = 20
+    max_limit = 100
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        position = self.decode_cursor(request.query_params.get('cursor'))
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        # Fetch one extra row to know whether there is a next page
+        page = list(queryset.order_by(*self.ordering)[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+        page = page[:self.limit]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'results': data, 'next_cursor': self.next_cursor})
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ParseError('limit must be an integer')
+        return max(1, min(limit, self.max_limit))
+
+    @staticmethod
+    def encode_cursor(obj):
+        raw = json.dumps([obj.created_at.isoformat(), obj.pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if not cursor:
+            return None
+        try:
+            created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError
+            return created_at, int(pk)
+        except (ValueError, TypeError):
+            raise ParseError('Invalid cursor')
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Keyset pagination over search results on ``(rank, id)``, best match first.
+    ``symptoms.search`` applies the cursor inside its ranked query.
+    """
+
+    def paginate_search(self, user, text, request):
+        from .search import search
+
+        self.limit = self.get_limit(request)
+        position = self.decode_cursor(request.query_params.get('cursor'))
+        page = search(user, text, after=position, limit=self.limit + 1)
+        self.has_next = len(page) > self.limit
+        page = page[:self.limit]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    @staticmethod
+    def encode_cursor(obj):
+        raw = json.dumps([obj.search_rank, obj.pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if not cursor:
+            return None
+        try:
+            rank, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return float(rank), int(pk)
+        except (ValueError, TypeError):
+            raise ParseError('Invalid cursor')
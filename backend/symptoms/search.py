@@ -0,0 +1,434 @@
+"""
+Full-text search over a user's symptom history.
+
+Matches are ranked across ``title`` and ``patient_name`` (weight A),
+``description`` (B) and ``ai_analysis`` (C). ``description`` and
+``ai_analysis`` are stored compressed (symptoms.fields), so the index is fed
+their decompressed text:
+
+* PostgreSQL: a ``search_vector tsvector`` column with a GIN index, queried
+  with ``websearch_to_tsquery`` and ranked with ``ts_rank``, and kept up to
+  date by a ``BEFORE INSERT OR UPDATE`` trigger. The database can't read the
+  compressed columns, so writes that change them also send their plain text
+  in the ``search_text`` column (``Symptom.save()``, ``bulk_create()``,
+  ``update()`` and ``bulk_update()`` do it); the trigger indexes it and
+  clears it. Title and patient name come from the row itself, and so does
+  compressed text in the legacy or uncompressed formats. A write that
+  stores dictionary-compressed text without ``search_text`` (raw SQL, a
+  historical model in a data migration) keeps the row's old entry and
+  queues the row in ``symptoms_symptom_search_pending``; ``reindex_pending``
+  catches up after every migrate and from ``manage.py
+  reindex_symptom_search``. ``reindex`` refills every row.
+* SQLite (local/dev): an FTS5 table with its own copy of the text, kept in
+  sync by triggers that decompress through the ``symptom_text()`` SQL
+  function registered on every connection (see apps.py).
+
+A page is a ranked-ids query plus the rows and their highlights for just
+those ids, so the cost of ``ts_headline``/``snippet`` doesn't grow with the
+number of matches. Highlights are HTML-escaped with matches wrapped in
+``<mark>``.
+"""
+import html
+import re
+
+from django.db import connections, transaction
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .compression import decompress
+from .models import Symptom
+from .serializers import LIST_FIELDS
+
+TABLE = Symptom._meta.db_table
+FTS_TABLE = f"{TABLE}_fts"
+PENDING_TABLE = f"{TABLE}_search_pending"
+FIELDS = ['title', 'patient_name', 'description', 'ai_analysis']
+COMPRESSED_FIELDS = ['description', 'ai_analysis']
+
+# Match markers used inside the database; swapped for <mark> after escaping
+START, STOP = '\x02', '\x03'
+
+_WORDS = re.compile(r"\w+")
+
+
+def _mark(fragment, escaped=False):
+    if not fragment or START not in fragment:
+        return None
+    if not escaped:
+        fragment = html.escape(fragment)
+    return fragment.replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+# =========================
+# POSTGRESQL
+# =========================
+PG_CONFIG = 'english'
+
+
+WEIGHTS = {'title': 'A', 'patient_name': 'A', 'description': 'B', 'ai_analysis': 'C'}
+
+
+def pg_vector(source):
+    """The weighted tsvector of the FIELDS columns of ``source`` (a table or VALUES alias)."""
+    return " || ".join(
+        f"setweight(to_tsvector('{PG_CONFIG}', coalesce({source}.{field}, '')), '{weight}')"
+        for field, weight in WEIGHTS.items()
+    )
+
+
+def _pg_compressed_part(field):
+    # A compressed field's share of the vector: from the text sent along,
+    # else (unchanged) from the old vector by its weight, else from the
+    # column when it isn't dictionary-compressed. Otherwise the old part is
+    # kept and the row is left for reindex_pending().
+    weight = WEIGHTS[field]
+    old_part = f"ts_filter(coalesce(OLD.search_vector, ''::tsvector), '{{{weight.lower()}}}')"
+    return f"""
+    IF plain ? '{field}' THEN
+        vector := vector || setweight(to_tsvector('{PG_CONFIG}', coalesce(plain->>'{field}', '')), '{weight}');
+    ELSIF NEW.{field} IS NULL THEN
+        NULL;
+    ELSIF TG_OP = 'UPDATE' AND NEW.{field} IS NOT DISTINCT FROM OLD.{field} THEN
+        vector := vector || {old_part};
+    ELSE
+        stored_text := symptom_text(NEW.{field});
+        IF stored_text IS NOT NULL THEN
+            vector := vector || setweight(to_tsvector('{PG_CONFIG}', stored_text), '{weight}');
+        ELSE
+            IF TG_OP = 'UPDATE' THEN
+                vector := vector || {old_part};
+            END IF;
+            INSERT INTO {PENDING_TABLE} (id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+        END IF;
+    END IF;"""
+
+# The text of a stored value, for the legacy and uncompressed (codec 0)
+# formats of symptoms.compression; NULL for dictionary-compressed values
+PG_TEXT_FUNCTION = """
+CREATE OR REPLACE FUNCTION symptom_text(value bytea) RETURNS text LANGUAGE sql IMMUTABLE STRICT AS $$
+    SELECT CASE
+        WHEN length(value) = 0 OR get_byte(value, 0) <> 0 THEN convert_from(value, 'UTF8')
+        WHEN length(value) >= 2 AND get_byte(value, 1) = 0 THEN convert_from(substring(value FROM 3), 'UTF8')
+    END
+$$"""
+
+PG_TRIGGER_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION {TABLE}_search() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    plain jsonb;
+    stored_text text;
+    vector tsvector;
+BEGIN
+    plain := NEW.search_text;
+    NEW.search_text := NULL;
+    IF TG_OP = 'UPDATE' AND plain IS NULL
+       AND NEW.title IS NOT DISTINCT FROM OLD.title
+       AND NEW.patient_name IS NOT DISTINCT FROM OLD.patient_name
+       AND NEW.description IS NOT DISTINCT FROM OLD.description
+       AND NEW.ai_analysis IS NOT DISTINCT FROM OLD.ai_analysis THEN
+        -- Nothing indexed changed (or reindex() is setting the vector)
+        RETURN NEW;
+    END IF;
+    vector := setweight(to_tsvector('{PG_CONFIG}', coalesce(NEW.title, '')), 'A')
+        || setweight(to_tsvector('{PG_CONFIG}', coalesce(NEW.patient_name, '')), 'A');
+    {''.join(_pg_compressed_part(field) for field in COMPRESSED_FIELDS)}
+    NEW.search_vector := vector;
+    RETURN NEW;
+END
+$$"""
+
+PG_INSTALL = [
+    f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    f"CREATE INDEX IF NOT EXISTS symptom_search_idx ON {TABLE} USING gin (search_vector)",
+]
+# Needs the search_text column (migration 0011)
+PG_INSTALL_TRIGGER = [
+    f"CREATE TABLE IF NOT EXISTS {PENDING_TABLE} (id bigint PRIMARY KEY)",
+    PG_TEXT_FUNCTION,
+    PG_TRIGGER_FUNCTION,
+    f"DROP TRIGGER IF EXISTS {TABLE}_search ON {TABLE}",
+    f"CREATE TRIGGER {TABLE}_search BEFORE INSERT OR UPDATE ON {TABLE} FOR EACH ROW EXECUTE FUNCTION {TABLE}_search()",
+]
+PG_UNINSTALL_TRIGGER = [
+    f"DROP TRIGGER IF EXISTS {TABLE}_search ON {TABLE}",
+    f"DROP FUNCTION IF EXISTS {TABLE}_search()",
+    "DROP FUNCTION IF EXISTS symptom_text(bytea)",
+    f"DROP TABLE IF EXISTS {PENDING_TABLE}",
+]
+PG_UNINSTALL = PG_UNINSTALL_TRIGGER + [
+    "DROP INDEX IF EXISTS symptom_search_idx",
+    f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+PG_QUERY = f"websearch_to_tsquery('{PG_CONFIG}', %s)"
+# float8 so the rank survives the JSON round trip through the cursor exactly
+PG_RANK = f"ts_rank(search_vector, {PG_QUERY})::float8"
+PG_HEADLINE_OPTIONS = {
+    'title': f"StartSel={START}, StopSel={STOP}, HighlightAll=true",
+    'patient_name': f"StartSel={START}, StopSel={STOP}, HighlightAll=true",
+    'description': f"StartSel={START}, StopSel={STOP}, MaxFragments=2, MaxWords=20, MinWords=5",
+    'ai_analysis': f"StartSel={START}, StopSel={STOP}, MaxFragments=2, MaxWords=20, MinWords=5",
+}
+
+
+class PostgresSearch:
+    # ts_headline needs the text, which only the application can decompress
+    text_fields = FIELDS
+
+    def ranked_ids(self, user, text, after, limit):
+        rank = RawSQL(PG_RANK, [text], output_field=FloatField())
+        matches = Symptom.objects.filter(
+            RawSQL(f"search_vector @@ {PG_QUERY}", [text], output_field=BooleanField()),
+            user=user,
+        ).annotate(rank=rank)
+        if after is not None:
+            after_rank, after_id = after
+            matches = matches.filter(
+                RawSQL(f"({PG_RANK}, id) < (%s, %s)", [text, after_rank, after_id], output_field=BooleanField())
+            )
+        return list(matches.order_by('-rank', '-id').values_list('id', 'rank')[:limit])
+
+    def highlights(self, text, symptoms):
+        if not symptoms:
+            return {}
+        # Escaped going in: the parser drops anything that looks like a tag,
+        # but keeps entities as they are
+        rows = [
+            (pk, *(html.escape(v) if v else v for v in (getattr(symptom, f) for f in FIELDS)))
+            for pk, symptom in symptoms.items()
+        ]
+        headlines = ", ".join(
+            f"ts_headline('{PG_CONFIG}', coalesce(v.{field}, ''), {PG_QUERY}, %s)" for field in FIELDS
+        )
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        params = [value for field in FIELDS for value in (text, PG_HEADLINE_OPTIONS[field])]
+        params += [value for row in rows for value in row]
+        with connections[Symptom.objects.db].cursor() as cursor:
+            cursor.execute(
+                f"SELECT v.id, {headlines} FROM (VALUES {values}) AS v(id, {', '.join(FIELDS)})",
+                params,
+            )
+            return {
+                row[0]: {field: _mark(value, escaped=True) for field, value in zip(FIELDS, row[1:])}
+                for row in cursor.fetchall()
+            }
+
+
+def pg_index(connection, rows):
+    """Set search_vector for ``rows`` of ``(id, *FIELDS)`` plain text."""
+    if not rows:
+        return
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {TABLE} SET search_vector = {pg_vector('v')} "
+            f"FROM (VALUES {values}) AS v(id, {', '.join(FIELDS)}) WHERE {TABLE}.id = v.id",
+            [value for row in rows for value in row],
+        )
+
+
+# =========================
+# SQLITE (FTS5)
+# =========================
+_columns = ", ".join(FIELDS)
+
+# Column values as the FTS table should see them
+_new_text = ", ".join(f"symptom_text(new.{f})" if f in COMPRESSED_FIELDS else f"new.{f}" for f in FIELDS)
+_source_text = ", ".join(f"symptom_text({f})" if f in COMPRESSED_FIELDS else f for f in FIELDS)
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_columns}, tokenize='porter unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_text}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns} ON {TABLE} BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_text}); END",
+]
+SQLITE_REBUILD = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns}) SELECT id, {_source_text} FROM {TABLE}",
+]
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# Column weights in FIELDS order; bm25 is lower-is-better, so it is negated
+SQLITE_RANK = f"-bm25({FTS_TABLE}, 10.0, 5.0, 5.0, 2.0)"
+
+
+def sqlite_match(text):
+    """Quote every word so user input can't break FTS5 query syntax; words are ANDed."""
+    return " ".join(f'"{word}"' for word in _WORDS.findall(text))
+
+
+class SqliteSearch:
+    # The FTS table has its own copy of the text
+    text_fields = ()
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def ranked_ids(self, user, text, after, limit):
+        match = sqlite_match(text)
+        if not match:
+            return []
+        sql = (
+            f"SELECT s.id, {SQLITE_RANK} AS rank FROM {FTS_TABLE} JOIN {TABLE} s ON s.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND s.user_id = %s"
+        )
+        params = [match, user.pk]
+        if after is not None:
+            sql += f" AND ({SQLITE_RANK} < %s OR ({SQLITE_RANK} = %s AND s.id < %s))"
+            params += [after[0], after[0], after[1]]
+        sql += " ORDER BY rank DESC, s.id DESC LIMIT %s"
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+    def highlights(self, text, symptoms):
+        if not symptoms:
+            return {}
+        ids = list(symptoms)
+        columns = ", ".join(
+            f"highlight({FTS_TABLE}, {i}, '{START}', '{STOP}')" if field in ('title', 'patient_name')
+            else f"snippet({FTS_TABLE}, {i}, '{START}', '{STOP}', ' … ', 24)"
+            for i, field in enumerate(FIELDS)
+        )
+        placeholders = ", ".join(["%s"] * len(ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, {columns} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})",
+                [sqlite_match(text), *ids],
+            )
+            return {row[0]: {field: _mark(value) for field, value in zip(FIELDS, row[1:])} for row in cursor.fetchall()}
+
+
+# =========================
+# ENTRY POINTS
+# =========================
+def get_backend(using=None):
+    connection = connections[using or Symptom.objects.db]
+    if connection.vendor == 'postgresql':
+        return PostgresSearch()
+    if connection.vendor == 'sqlite':
+        return SqliteSearch(connection)
+    raise NotImplementedError(f"Symptom search is not available on {connection.vendor}")
+
+
+def install(connection):
+    """
+    Create the search column, index and trigger (PostgreSQL; the trigger once
+    the search_text column exists) or FTS table and triggers (SQLite) if
+    missing, and fill them when they were. Idempotent. On SQLite
+    it also runs after every migrate, since Django rebuilds a table to alter
+    it and that drops its triggers.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_name = %s AND column_name IN ('search_vector', 'search_text')",
+                [TABLE],
+            )
+            columns = {row[0] for row in cursor.fetchall()}
+            statements = PG_INSTALL + (PG_INSTALL_TRIGGER if 'search_text' in columns else [])
+            for statement in statements:
+                cursor.execute(statement)
+        if 'search_vector' not in columns:
+            reindex(connection)
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                [f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"],
+            )
+            complete = cursor.fetchone()[0] == 3
+            for statement in SQLITE_INSTALL:
+                cursor.execute(statement)
+            if not complete:
+                for statement in SQLITE_REBUILD:
+                    cursor.execute(statement)
+
+
+def uninstall(connection):
+    statements = {'postgresql': PG_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def reindex(connection, chunk_size=1000):
+    """Refill the whole PostgreSQL index, ``chunk_size`` rows per statement."""
+    if connection.vendor != 'postgresql':
+        return
+    last = 0
+    while True:
+        # Raw SQL so it also works from migrations, whatever the model looks like by then
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, {', '.join(FIELDS)} FROM {TABLE} WHERE id > %s ORDER BY id LIMIT %s",
+                [last, chunk_size],
+            )
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        pg_index(connection, _plain(rows))
+        last = rows[-1][0]
+
+
+def reindex_pending(connection, chunk_size=1000):
+    """
+    Index the rows the PostgreSQL trigger queued because it couldn't read
+    their text; returns how many were queued.
+    """
+    if connection.vendor != 'postgresql' or PENDING_TABLE not in connection.introspection.table_names():
+        return 0
+    done = 0
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {PENDING_TABLE} WHERE id IN "
+                f"(SELECT id FROM {PENDING_TABLE} ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED) RETURNING id",
+                [chunk_size],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return done
+            # Locked so a concurrent write can't be indexed with this older text
+            cursor.execute(f"SELECT id, {', '.join(FIELDS)} FROM {TABLE} WHERE id = ANY(%s) FOR UPDATE", [ids])
+            pg_index(connection, _plain(cursor.fetchall()))
+        done += len(ids)
+
+
+def _plain(rows):
+    return [
+        (pk, *(decompress(v) if f in COMPRESSED_FIELDS else v for f, v in zip(FIELDS, values)))
+        for pk, *values in rows
+    ]
+
+
+def search(user, text, after=None, limit=20):
+    """
+    ``user``'s symptoms matching ``text``, best first, after the ``(rank, id)``
+    cursor. Each returned Symptom carries ``search_rank`` and ``highlights``
+    (``{field: html or None}``).
+    """
+    backend = get_backend()
+    ranked = backend.ranked_ids(user, text, after, limit)
+    if not ranked:
+        return []
+    ids = [pk for pk, _ in ranked]
+    rows = Symptom.objects.only(*LIST_FIELDS, *backend.text_fields).in_bulk(ids)
+    highlights = backend.highlights(text, rows)
+    page = []
+    for pk, rank in ranked:
+        symptom = rows[pk]
+        symptom.search_rank = rank
+        symptom.highlights = {k: v for k, v in highlights.get(pk, {}).items() if v}
+        page.append(symptom)
+    return page
@@ -2,6 +2,63 @@ from rest_framework import serializers
 from .models import Symptom
 
 class SymptomSerializer(serializers.ModelSerializer):
+    """
+    Pass ``fields=[...]`` to serialize only a subset of the fields (used by
+    the history list to skip the large text columns).
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Symptom
-        fields = ['id', 'patient_name', 'title', 'age', 'gender', 'severity', 'risk_score', 'duration', 'description', 'ai_analysis', 'created_at']
\ No newline at end of file
+        fields = ['id', 'patient_name', 'title', 'age', 'gender', 'severity', 'risk_score', 'duration', 'description', 'ai_analysis', 'prompt_version', 'created_at']
+        read_only_fields = ['prompt_version']
+
+# Large text columns left out of history listings unless asked for via ?fields=
+HEAVY_FIELDS = ['description', 'ai_analysis']
+LIST_FIELDS = [f for f in SymptomSerializer.Meta.fields if f not in HEAVY_FIELDS]
+
+
+class BatchItemSerializer(serializers.Serializer):
+    """One intake in a batch check; a bare string is taken as the description."""
+    description = serializers.CharField(max_length=5000)
+    title = serializers.CharField(max_length=200, required=False, default='Batch Analysis')
+    patient_name = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    age = serializers.IntegerField(required=False, allow_null=True, min_value=0, max_value=150)
+    gender = serializers.CharField(max_length=50, required=False, allow_blank=True, allow_null=True)
+    duration = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = {'description': data}
+        return super().to_internal_value(data)
+
+class ClinicalAnalysisSerializer(serializers.Serializer):
+    """Validates the JSON-mode reply of the clinical check (see analysis.py)."""
+    causes = serializers.ListField(child=serializers.CharField(max_length=300), min_length=1, max_length=10)
+    precautions = serializers.ListField(child=serializers.CharField(max_length=300), min_length=1, max_length=10)
+    severity = serializers.ChoiceField(choices=['LOW', 'MEDIUM', 'HIGH'])
+    risk_score = serializers.IntegerField(min_value=0, max_value=100)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            data = dict(data)
+            if isinstance(data.get('severity'), str):
+                data['severity'] = data['severity'].strip().upper()
+            for field in ('causes', 'precautions'):
+                # A single item sometimes comes back as a bare string
+                if isinstance(data.get(field), str):
+                    data[field] = [data[field]]
+        return super().to_internal_value(data)
+
+
+class SearchResultSerializer(SymptomSerializer):
+    """A search hit: the list fields plus its rank and highlighted fragments."""
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+    highlights = serializers.DictField(child=serializers.CharField(), read_only=True)
+
+    class Meta(SymptomSerializer.Meta):
+        fields = LIST_FIELDS + ['rank', 'highlights']
@@ -1,3 +1,587 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import re
+import threading
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from llm import gateway
+from llm.cache import get_response_cache
+from llm.fakeserver import FakeLLMServer
+from users.views import create_jwt
+from . import analysis, compression, search
+from .fields import Compressed
+from .models import Symptom
+from .serializers import SymptomSerializer
+
+INDEX_NAME = 'symptom_user_created_idx'
+
+
+class SymptomQueryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', email='alice@example.com', password='Secret#1')
+        cls.other = User.objects.create_user(username='bob', email='bob@example.com', password='Secret#1')
+        Symptom.objects.bulk_create(
+            [Symptom(user=cls.user, title=f'Check {i}', description='fever', ai_analysis='rest') for i in range(30)]
+            + [Symptom(user=cls.other, title=f'Other {i}') for i in range(30)]
+        )
+
+    def setUp(self):
+        # Start every test with a cold authentication cache
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.user)}')
+        self.symptom = Symptom.objects.filter(user=self.user).first()
+
+
+class SymptomQueryCountTests(SymptomQueryTestCase):
+    """Every endpoint is one auth lookup plus a fixed number of queries, whatever the row count."""
+
+    def test_history_list(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/symptoms/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_history_next_page(self):
+        cursor = self.client.get('/api/symptoms/').data['next_cursor']
+        # The user is now cached by JWTAuthentication
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/symptoms/', {'cursor': cursor})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_detail(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/symptoms/{self.symptom.pk}/')
+        self.assertEqual(response.data['ai_analysis'], 'rest')
+
+    # Writes also take a savepoint and add a delta to the analytics rollups
+
+    def test_patch(self):
+        with self.assertNumQueries(6):
+            response = self.client.patch(f'/api/symptoms/{self.symptom.pk}/', {'severity': 'HIGH'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete(self):
+        # Daily rollup and symptom-term upserts
+        with self.assertNumQueries(7):
+            response = self.client.delete(f'/api/symptoms/{self.symptom.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_other_users_record_is_not_found(self):
+        other = Symptom.objects.filter(user=self.other).first()
+        response = self.client.get(f'/api/symptoms/{other.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_clear_all(self):
+        # The user's rollups are dropped with two DELETEs, not per day
+        with self.assertNumQueries(6):
+            response = self.client.delete('/api/symptoms/clear-all/')
+        self.assertEqual(response.data['deleted_count'], 30)
+        self.assertEqual(Symptom.objects.filter(user=self.other).count(), 30)
+
+
+class BulkDeleteTests(SymptomQueryTestCase):
+    def test_rows_are_deleted_a_chunk_at_a_time(self):
+        with self.assertNumQueries(3):
+            deleted = Symptom.objects.filter(user=self.user).bulk_delete(chunk_size=12)
+        self.assertEqual(deleted, 30)
+        self.assertFalse(Symptom.objects.filter(user=self.user).exists())
+        self.assertEqual(Symptom.objects.filter(user=self.other).count(), 30)
+
+    def test_exact_multiple_of_the_chunk_size(self):
+        # The last full chunk can't tell it was the last; one empty DELETE follows
+        with self.assertNumQueries(4):
+            self.assertEqual(Symptom.objects.filter(user=self.user).bulk_delete(chunk_size=10), 30)
+
+    def test_delete_signal_receivers_get_the_instances(self):
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance.pk)
+
+        post_delete.connect(receiver, sender=Symptom)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Symptom)
+        pks = set(Symptom.objects.filter(user=self.user).values_list('pk', flat=True))
+
+        self.assertEqual(Symptom.objects.filter(user=self.user).bulk_delete(chunk_size=7), 30)
+        self.assertEqual(set(deleted), pks)
+        self.assertEqual(Symptom.objects.filter(user=self.other).count(), 30)
+
+    def test_clear_all_keeps_the_rows_when_the_rollups_fail(self):
+        with mock.patch('analytics.rollups.clear', side_effect=DatabaseError('lock timeout')):
+            with self.assertRaises(DatabaseError):
+                self.client.delete('/api/symptoms/clear-all/')
+        self.assertEqual(Symptom.objects.filter(user=self.user).count(), 30)
+
+
+class SymptomQueryPlanTests(SymptomQueryTestCase):
+    """The per-user access paths must be served by the composite index."""
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be sequentially scanned
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertIn(INDEX_NAME, plan)
+
+    def test_history_page_uses_index(self):
+        self.assertUsesIndex(Symptom.objects.filter(user=self.user).order_by('-created_at', '-id')[:21])
+
+    def test_keyset_page_uses_index(self):
+        created_at, pk = self.symptom.created_at, self.symptom.pk
+        queryset = Symptom.objects.filter(user=self.user).filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        self.assertUsesIndex(queryset.order_by('-created_at', '-id')[:21])
+
+    def test_clear_all_uses_index(self):
+        self.assertUsesIndex(Symptom.objects.filter(user=self.user).values('pk'))
+
+    def test_detail_lookup_uses_primary_key(self):
+        plan = Symptom.objects.filter(pk=self.symptom.pk, user=self.user).explain()
+        self.assertIsNone(re.search(r'\bSCAN symptoms_symptom\b|Seq Scan', plan), plan)
+
+
+ANALYSIS = {
+    'causes': ['Viral infection', 'Dehydration'],
+    'precautions': ['Rest'],
+    'severity': 'MEDIUM',
+    'risk_score': 35,
+}
+
+
+class StructuredAnalysisTests(SimpleTestCase):
+    def test_valid_reply(self):
+        self.assertEqual(analysis.validate(json.dumps(ANALYSIS)), (ANALYSIS, None))
+
+    def test_reply_wrapped_in_prose_is_repaired(self):
+        reply = 'Here you go:\n```json\n' + json.dumps({**ANALYSIS, 'severity': 'medium'}) + '\n```'
+        self.assertEqual(analysis.validate(reply)[0], ANALYSIS)
+
+    def test_wrong_shape_is_rejected_with_reason(self):
+        parsed, error = analysis.validate(json.dumps({**ANALYSIS, 'risk_score': 250}))
+        self.assertIsNone(parsed)
+        self.assertIn('risk_score', error)
+
+    def test_invalid_reply_is_reprompted_once(self):
+        replies = [('{"causes": "not finished"', gateway.DEFAULT_MODEL), (json.dumps(ANALYSIS), gateway.DEFAULT_MODEL)]
+        with mock.patch.object(gateway, 'chat', side_effect=replies) as chat:
+            result, value = analysis.complete('headache')
+        self.assertEqual(chat.call_count, 2)
+        self.assertEqual(result['severity'], 'MEDIUM')
+        self.assertEqual(result['suggestions'], ['Viral infection', 'Dehydration', 'Rest'])
+        self.assertEqual(json.loads(value), ANALYSIS)
+
+    def test_falls_back_to_list_when_reprompt_fails(self):
+        with mock.patch.object(gateway, 'chat', side_effect=[('- a\n- b', gateway.DEFAULT_MODEL)] * 2):
+            result, value = analysis.complete('headache')
+        self.assertEqual(result, {'suggestions': ['a', 'b']})
+        self.assertIsNone(value)
+
+    def test_fallback_model_answer_is_not_cached(self):
+        with mock.patch.object(gateway, 'chat', return_value=(json.dumps(ANALYSIS), 'llama-3.1-8b-instant')):
+            result, value = analysis.complete('headache')
+        self.assertEqual(result['severity'], 'MEDIUM')
+        self.assertIsNone(value)
+
+
+class AssessmentFillTests(SymptomQueryTestCase):
+    def test_logged_symptom_takes_severity_from_cached_check(self):
+        get_response_cache().set(analysis.cache_key('sharp chest pain'), json.dumps({**ANALYSIS, 'severity': 'HIGH', 'risk_score': 80}))
+        response = self.client.post('/api/symptoms/', {'title': 'Chest', 'description': 'sharp chest pain'}, format='json')
+        self.assertEqual((response.data['severity'], response.data['risk_score']), ('HIGH', 80))
+
+    def test_lookups_leave_the_hit_rate_alone(self):
+        get_response_cache().set(analysis.cache_key('sharp chest pain'), json.dumps({**ANALYSIS, 'severity': 'HIGH', 'risk_score': 80}))
+        before = get_response_cache().stats()
+        for description in ('sharp chest pain', 'never checked'):
+            self.client.post('/api/symptoms/', {'title': 'Chest', 'description': description}, format='json')
+        self.assertEqual(get_response_cache().stats(), before)
+
+    def test_check_on_another_worker_still_fills_severity(self):
+        reply = (json.dumps({**ANALYSIS, 'severity': 'HIGH', 'risk_score': 80}), gateway.DEFAULT_MODEL)
+        with mock.patch.object(gateway, 'chat', return_value=reply):
+            self.client.post('/api/symptoms/check/', {'description': 'sharp chest pain'}, format='json')
+        # This worker's response cache never saw the check
+        get_response_cache().clear()
+        response = self.client.post('/api/symptoms/', {'title': 'Chest', 'description': 'Sharp chest pain.'}, format='json')
+        self.assertEqual((response.data['severity'], response.data['risk_score']), ('HIGH', 80))
+
+    def test_client_values_win(self):
+        get_response_cache().set(analysis.cache_key('sharp chest pain'), json.dumps({**ANALYSIS, 'severity': 'HIGH'}))
+        response = self.client.post(
+            '/api/symptoms/', {'title': 'Chest', 'description': 'sharp chest pain', 'severity': 'LOW'}, format='json'
+        )
+        self.assertEqual((response.data['severity'], response.data['risk_score']), ('LOW', 0))
+
+
+class SymptomSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', email='alice@example.com', password='Secret#1')
+        cls.other = User.objects.create_user(username='bob', email='bob@example.com', password='Secret#1')
+        cls.in_title = Symptom.objects.create(user=cls.user, title='Migraine', description='since monday')
+        cls.in_analysis = Symptom.objects.create(user=cls.user, title='Checkup', ai_analysis='- Possible migraine')
+        Symptom.objects.bulk_create(
+            [Symptom(user=cls.user, title=f'Cough {i}', description='dry cough at night') for i in range(25)]
+            + [Symptom(user=cls.other, title='Migraine', description='<b>migraine</b> again')]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.user)}')
+
+    def search(self, q, **params):
+        return self.client.get('/api/symptoms/search/', {'q': q, **params})
+
+    def test_title_match_ranks_above_analysis_match(self):
+        results = self.search('migraines').data['results']
+        self.assertEqual([r['id'] for r in results], [self.in_title.pk, self.in_analysis.pk])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+
+    def test_highlights_are_escaped(self):
+        Symptom.objects.create(user=self.user, title='Rash', description='<b>itchy</b> rash')
+        [result] = self.search('itchy').data['results']
+        # PostgreSQL snippets start at a word, so the opening tag may be cut
+        self.assertIn('<mark>itchy</mark>&lt;/b&gt; rash', result['highlights']['description'])
+        self.assertNotIn('<b>', result['highlights']['description'])
+        self.assertNotIn('title', result['highlights'])
+
+    def test_pages_do_not_overlap(self):
+        first = self.search('cough', limit=10).data
+        with self.assertNumQueries(3):
+            second = self.search('cough', limit=20, cursor=first['next_cursor']).data
+        ids = [r['id'] for r in first['results']] + [r['id'] for r in second['results']]
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertIsNone(second['next_cursor'])
+
+    def test_other_users_records_are_excluded(self):
+        self.assertNotIn('<b>', json.dumps(self.search('migraine').data))
+        self.assertEqual(len(self.search('migraine').data['results']), 2)
+
+    def test_updates_and_deletes_are_indexed(self):
+        Symptom.objects.filter(pk=self.in_title.pk).update(title='Headache')
+        self.in_analysis.delete()
+        self.assertEqual(self.search('migraine').data['results'], [])
+        self.assertEqual(len(self.search('headache').data['results']), 1)
+
+    def test_queryset_writes_are_indexed(self):
+        Symptom.objects.filter(pk=self.in_title.pk).update(description='stabbing pain behind the eye')
+        rows = [Symptom.objects.get(pk=self.in_analysis.pk)]
+        rows[0].ai_analysis = 'Possible sinusitis'
+        Symptom.objects.bulk_update(rows, ['ai_analysis'])
+        self.assertEqual([r['id'] for r in self.search('stabbing').data['results']], [self.in_title.pk])
+        self.assertEqual([r['id'] for r in self.search('sinusitis').data['results']], [self.in_analysis.pk])
+        # The title is still indexed after a description-only write
+        self.assertEqual([r['id'] for r in self.search('migraine').data['results']], [self.in_title.pk])
+
+    def test_compressing_keeps_the_index(self):
+        call_command('compress_symptom_text', '--dictionary', '0', stdout=io.StringIO())
+        self.assertEqual(len(self.search('cough').data['results']), 20)
+        self.assertEqual(len(self.search('migraine').data['results']), 2)
+
+    def test_search_text_is_not_stored(self):
+        self.in_title.description = 'since tuesday'
+        self.in_title.save(update_fields=['description'])
+        Symptom.objects.filter(pk=self.in_analysis.pk).update(ai_analysis='rest')
+        self.assertFalse(Symptom.objects.filter(search_text__isnull=False).exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search trigger')
+    def test_raw_sql_title_change_is_indexed(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {Symptom._meta.db_table} SET title = 'Headache' WHERE id = %s", [self.in_title.pk])
+        self.assertEqual([r['id'] for r in self.search('headache').data['results']], [self.in_title.pk])
+        # The description is still indexed
+        self.assertEqual([r['id'] for r in self.search('monday').data['results']], [self.in_title.pk])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search trigger')
+    def test_raw_sql_readable_text_is_indexed(self):
+        with connection.cursor() as cursor:
+            # Legacy plain UTF-8 and codec 0 (stored uncompressed)
+            cursor.execute(
+                f"UPDATE {Symptom._meta.db_table} SET description = convert_to('stabbing pain', 'UTF8') WHERE id = %s",
+                [self.in_title.pk],
+            )
+            cursor.execute(
+                f"UPDATE {Symptom._meta.db_table} SET ai_analysis = %s WHERE id = %s",
+                [compression.compress('Possible sinusitis', 0), self.in_analysis.pk],
+            )
+        self.assertEqual([r['id'] for r in self.search('stabbing').data['results']], [self.in_title.pk])
+        self.assertEqual([r['id'] for r in self.search('sinusitis').data['results']], [self.in_analysis.pk])
+        self.assertEqual(self.search('monday').data['results'], [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search trigger')
+    def test_unreadable_write_is_queued_for_reindex(self):
+        text = 'Possible causes:\n- Cluster headache\n\nPrecautions:\n- Rest in a dark room\n'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Symptom._meta.db_table} SET description = %s WHERE id = %s",
+                [compression.compress(text, 1), self.in_title.pk],
+            )
+        # The old entry is kept until the row is reindexed
+        self.assertEqual(self.search('cluster').data['results'], [])
+        self.assertEqual(len(self.search('monday').data['results']), 1)
+
+        out = io.StringIO()
+        call_command('reindex_symptom_search', stdout=out)
+        self.assertIn('Indexed 1 queued symptoms', out.getvalue())
+        self.assertEqual([r['id'] for r in self.search('cluster').data['results']], [self.in_title.pk])
+        self.assertEqual(self.search('monday').data['results'], [])
+        self.assertEqual(search.reindex_pending(connection), 0)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.search('  ').status_code, 400)
+        self.assertEqual(self.search('cough', cursor='nope').status_code, 400)
+
+    def test_query_syntax_is_not_interpreted(self):
+        response = self.search('cough" OR title:*')
+        self.assertEqual(response.status_code, 200)
+
+
+class SymptomExportTests(SymptomQueryTestCase):
+    def export(self, fmt, data=None, **extra):
+        response = self.client.get(f'/api/symptoms/export/{fmt}/', data, **extra)
+        self.assertEqual(response.status_code, 200)
+        # A sync iterator, which WSGI servers send chunk by chunk
+        self.assertFalse(response.is_async)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        Symptom.objects.create(user=self.user, title='=HYPERLINK("x")', description='cough')
+        response, body = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(len(rows), 31)
+        self.assertEqual(rows[0]['description'], 'fever')
+        # Formula-looking cells are neutralized for spreadsheet apps
+        self.assertEqual(rows[-1]['title'], '\'=HYPERLINK("x")')
+
+    def test_ndjson(self):
+        _, body = self.export('ndjson')
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(records), 30)
+        self.assertEqual(records[0], SymptomSerializer(self.symptom).data)
+
+    def test_fields(self):
+        _, body = self.export('ndjson', data={'fields': 'id,title'})
+        self.assertEqual(json.loads(body.splitlines()[0]), {'id': self.symptom.pk, 'title': 'Check 0'})
+        response = self.client.get('/api/symptoms/export/ndjson/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_is_negotiated(self):
+        response, body = self.export('ndjson', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(gzip.decompress(body).splitlines()), 30)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/symptoms/export/xml/').status_code, 400)
+
+    def test_asgi_gets_an_async_stream(self):
+        async def export():
+            response = await AsyncClient().get(
+                '/api/symptoms/export/ndjson/', headers={'Authorization': f'Bearer {create_jwt(self.user)}'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(len(async_to_sync(export)().splitlines()), 30)
+
+
+class SymptomBatchTests(SymptomQueryTestCase):
+    ITEMS = ['fever and cough', 'Fever, and cough!', 'headache']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.llm = FakeLLMServer(('127.0.0.1', 0), latency='fixed:0', ttft='fixed:0', tokens_per_second=0)
+        cls.llm.daemon_threads = True
+        threading.Thread(target=cls.llm.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            GROQ_API_KEY='test',
+            LLM_GATEWAY={'BASE_URL': f'http://127.0.0.1:{cls.llm.server_port}'},
+            LLM_RESILIENCE={'MAX_ATTEMPTS': 1, 'FALLBACK_MODELS': {}},
+            LLM_THROTTLE={},
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.llm.shutdown()
+        cls.llm.server_close()
+        gateway.reset()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        gateway.reset()
+        get_response_cache().clear()
+        self.llm.requests = 0
+
+    def check_lines(self, body):
+        lines = [json.loads(line) for line in body.splitlines()]
+        results = sorted(line['index'] for line in lines if line['type'] == 'result')
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(lines[-1], {'type': 'done', 'items': 3, 'unique': 2, 'cached': 0, 'failed': 0, 'saved': 3})
+        self.assertEqual(Symptom.objects.filter(user=self.user, title='Batch').count(), 3)
+        # Items that normalize the same share one call
+        self.assertEqual(self.llm.requests, 2)
+
+    def test_wsgi_streams_from_a_thread_pool(self):
+        items = [{'title': 'Batch', 'description': description} for description in self.ITEMS]
+        response = self.client.post('/api/symptoms/check/batch/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        self.check_lines(b''.join(response.streaming_content))
+
+    def test_asgi_streams_on_the_event_loop(self):
+        items = [{'title': 'Batch', 'description': description} for description in self.ITEMS]
+
+        async def check():
+            response = await AsyncClient().post(
+                '/api/symptoms/check/batch/', {'items': items}, content_type='application/json',
+                headers={'Authorization': f'Bearer {create_jwt(self.user)}'},
+            )
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        self.check_lines(async_to_sync(check)())
+
+
+class CompressedTextTests(TestCase):
+    TEXT = 'Possible causes:\n- Viral infection\n- Dehydration\n\nPrecautions:\n- Rest and drink plenty of fluids\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', email='alice@example.com', password='Secret#1')
+        cls.symptom = Symptom.objects.create(user=cls.user, title='Check', description='fever', ai_analysis=cls.TEXT)
+
+    def stored(self, column):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM symptoms_symptom WHERE id = %s', [self.symptom.pk])
+            return cursor.fetchone()[0]
+
+    def test_stored_compressed_and_read_back(self):
+        stored = bytes(self.stored('ai_analysis'))
+        self.assertEqual(compression.codec(stored), compression.get_config('DICTIONARY'))
+        self.assertLess(len(stored), len(self.TEXT) / 2)
+        # Too short to be worth compressing
+        self.assertEqual(compression.codec(bytes(self.stored('description'))), compression.STORED)
+        self.assertEqual(Symptom.objects.get(pk=self.symptom.pk).ai_analysis, self.TEXT)
+
+    def test_decompressed_on_first_access_only(self):
+        symptom = Symptom.objects.get(pk=self.symptom.pk)
+        self.assertIsInstance(symptom.__dict__['ai_analysis'], Compressed)
+        self.assertEqual(symptom.ai_analysis, self.TEXT)
+        self.assertEqual(symptom.__dict__['ai_analysis'], self.TEXT)
+
+    def test_unchanged_text_is_not_recompressed(self):
+        symptom = Symptom.objects.get(pk=self.symptom.pk)
+        symptom.ai_analysis  # read (e.g. by the rollups); description never is
+        symptom.severity = 'HIGH'
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            symptom.save()
+        compress.assert_not_called()
+        symptom.ai_analysis = 'Rest'
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            symptom.save()
+        compress.assert_called_once_with('Rest')
+
+    def test_legacy_rows_are_read_and_converted(self):
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE symptoms_symptom SET ai_analysis = %s WHERE id = %s', [self.TEXT, self.symptom.pk])
+        self.assertEqual(Symptom.objects.get(pk=self.symptom.pk).ai_analysis, self.TEXT)
+
+        call_command('compress_symptom_text', stdout=io.StringIO())
+        self.assertEqual(compression.codec(bytes(self.stored('ai_analysis'))), compression.get_config('DICTIONARY'))
+        self.assertEqual(Symptom.objects.get(pk=self.symptom.pk).ai_analysis, self.TEXT)
+
+    def test_convert_to_uncompressed(self):
+        call_command('compress_symptom_text', '--dictionary', '0', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(bytes(self.stored('ai_analysis')), b'\x00\x00' + self.TEXT.encode())
+        self.assertEqual(Symptom.objects.get(pk=self.symptom.pk).ai_analysis, self.TEXT)
+
+    def test_search_reads_decompressed_text(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {create_jwt(self.user)}')
+        [result] = client.get('/api/symptoms/search/', {'q': 'dehydration'}).data['results']
+        self.assertIn('<mark>Dehydration</mark>', result['highlights']['ai_analysis'])
+
+    def test_train_keeps_recurring_lines(self):
+        samples = [f'Visit {i}\nPossible causes:\nPrecautions:' for i in range(20)] + ['Possible causes:']
+        trained = compression.train(samples)
+        self.assertEqual(trained.splitlines(), ['Precautions:', 'Possible causes:'])
+
+
+class SearchMigrationTests(TransactionTestCase):
+    """0010 (compressed columns) and 0011 (search trigger) on a table that already has rows."""
+    BEFORE = [('symptoms', '0009_symptom_search')]
+    AFTER = [('symptoms', '0011_symptom_search_text')]
+
+    def migrate(self, targets=None):
+        executor = MigrationExecutor(connection)
+        targets = targets or executor.loader.graph.leaf_nodes()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def titles(self, user, text):
+        return [symptom.title for symptom in search.search(user, text)]
+
+    def stored_text(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT title, description, ai_analysis FROM symptoms_symptom ORDER BY id')
+            return cursor.fetchall()
+
+    def test_forwards_and_backwards(self):
+        user = User.objects.create_user(username='alice', email='alice@example.com', password='Secret#1')
+        self.addCleanup(self.migrate)
+        old = self.migrate(self.BEFORE).get_model('symptoms', 'Symptom')
+        old.objects.create(user_id=user.pk, title='Checkup', description='dry cough at night', ai_analysis=CompressedTextTests.TEXT)
+        old.objects.create(user_id=user.pk, title='Migraine')
+        before = self.stored_text()
+
+        # Legacy rows are read and indexed as they are
+        historical = self.migrate(self.AFTER).get_model('symptoms', 'Symptom')
+        self.assertEqual(Symptom.objects.get(title='Checkup').ai_analysis, CompressedTextTests.TEXT)
+        self.assertEqual(self.titles(user, 'dehydration'), ['Checkup'])
+
+        # A data migration's write: no search_text from a historical model
+        row = historical.objects.get(title='Migraine')
+        row.description = 'Throbbing pain on one side with sensitivity to light and sound, twice a week'
+        row.save(update_fields=['description'])
+        search.reindex_pending(connection)
+        self.assertEqual(self.titles(user, 'throbbing'), ['Migraine'])
+
+        call_command('compress_symptom_text', stdout=io.StringIO())
+        self.assertEqual(self.titles(user, 'dehydration'), ['Checkup'])
+        self.assertEqual(self.titles(user, 'throbbing'), ['Migraine'])
+
+        # Back to text columns, which needs the rows stored uncompressed first
+        call_command('compress_symptom_text', '--dictionary', '0', stdout=io.StringIO())
+        self.migrate(self.BEFORE)
+        after = self.stored_text()
+        self.assertEqual(after[0], before[0])
+        self.assertEqual(after[1][0], 'Migraine')
+        self.assertEqual(after[1][1], row.description)
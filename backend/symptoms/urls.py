@@ -1,9 +1,13 @@
 from django.urls import path
-from .views import log_symptom, check_symptom, log_symptom_detail, clear_all_symptoms
+from .views import log_symptom, check_symptom, check_symptom_batch, log_symptom_detail, clear_all_symptoms, check_cache_stats, search_symptoms, export_symptoms
 
 urlpatterns = [
     path('', log_symptom),              
     path('check/', check_symptom), 
+    path('check/batch/', check_symptom_batch),
+    path('check/cache-stats/', check_cache_stats),
+    path('search/', search_symptoms),
+    path('export/<str:fmt>/', export_symptoms),
     path('clear-all/', clear_all_symptoms),
     path('<int:pk>/', log_symptom_detail, name='log-symptom-detail'),
 ]
\ No newline at end of file
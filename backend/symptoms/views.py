@@ -1,14 +1,30 @@
-from rest_framework.decorators import api_view, permission_classes
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import ParseError
 from .models import Symptom
-from .serializers import SymptomSerializer
-from django.conf import settings
-from groq import Groq
+from .serializers import BatchItemSerializer, SearchResultSerializer, SymptomSerializer, LIST_FIELDS
+from .pagination import KeysetPagination, SearchPagination
+from .analysis import analyze, cached_assessment
+from . import batch, export
+from llm import gateway
+from llm.cache import get_response_cache
+from llm.throttling import UpstreamConcurrencyThrottle, UserConcurrencyThrottle, UserTokenBucketThrottle, deferred
+from jobs.views import enqueue_job, requested_webhook
+from analytics import rollups
 
-# Initialize Groq client
-client = Groq(api_key=settings.GROQ_API_KEY)
+class SymptomCheckRateThrottle(UserTokenBucketThrottle):
+    scope = 'symptom_check'
+
+class SymptomBatchRateThrottle(UserTokenBucketThrottle):
+    scope = 'symptom_batch'
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -16,60 +32,174 @@ def log_symptom(request):
     if request.method == 'POST':
         serializer = SymptomSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            # Fill severity/risk_score from an earlier check of the same
+            # description unless the client sent its own
+            assessment = {}
+            if 'severity' not in request.data and 'risk_score' not in request.data:
+                assessment = cached_assessment(serializer.validated_data.get('description'))
+            with transaction.atomic():
+                symptom = serializer.save(user=request.user, **assessment)
+                rollups.Delta().add(symptom).apply()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # ?fields=a,b selects columns; by default the large text fields are left
+    # out and fetched per record from the detail endpoint
+    fields = LIST_FIELDS
+    if request.query_params.get('fields'):
+        fields = [f.strip() for f in request.query_params['fields'].split(',') if f.strip()]
+        unknown = set(fields) - set(SymptomSerializer.Meta.fields)
+        if unknown:
+            return Response({'error': f"Unknown fields: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+
     # Filter symptoms to only show those belonging to the logged-in user
-    symptoms = Symptom.objects.filter(user=request.user).order_by('-created_at')
-    serializer = SymptomSerializer(symptoms, many=True)
-    return Response(serializer.data)
+    symptoms = Symptom.objects.filter(user=request.user).only(*fields, 'created_at')
+    paginator = KeysetPagination()
+    try:
+        page = paginator.paginate_queryset(symptoms, request)
+    except ParseError as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = SymptomSerializer(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SymptomCheckRateThrottle, UserConcurrencyThrottle, UpstreamConcurrencyThrottle])
 def check_symptom(request):
     description = request.data.get('description', '')
     if not description:
         return Response({'error': 'Description is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    if deferred(request):
+        try:
+            webhook_url = requested_webhook(request)
+        except ParseError as e:
+            return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+        return enqueue_job(request.user, 'symptom_check', {'description': description}, webhook_url)
+
     try:
-        # Use Groq for free AI analysis
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a clinical assistant. Analyze symptoms and provide 3 possible causes and 2 important precautions. Format as a clear list."
-                },
-                {
-                    "role": "user",
-                    "content": description,
-                }
-            ],
-            model="llama-3.3-70b-versatile",
-        )
-        text = chat_completion.choices[0].message.content.strip()
-        suggestions = [line.strip('- ').strip() for line in text.split('\n') if line.strip()]
-        return Response({'suggestions': suggestions}, status=status.HTTP_200_OK)
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-
-@api_view(['DELETE', 'PATCH'])
+        return Response(analyze(description), status=status.HTTP_200_OK)
+    except gateway.LLMBusy as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except gateway.LLMError:
+        return Response({'error': gateway.UNAVAILABLE_MESSAGE}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def served_by_asgi(request):
+    # Streamed bodies must be async iterators under ASGI and sync ones under
+    # WSGI; either handler buffers the other kind whole
+    return isinstance(request._request, ASGIRequest)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([SymptomBatchRateThrottle, UserConcurrencyThrottle, UpstreamConcurrencyThrottle])
+def check_symptom_batch(request):
+    """
+    Analyze many descriptions in one request: ``{"items": [...], "save": true}``
+    where each item is a description string or an object with ``description``
+    and optional record fields. Results stream back as NDJSON (see batch.py).
+    """
+    items = request.data.get('items')
+    if not isinstance(items, list) or not items:
+        return Response({'error': 'items must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > batch.get_config('MAX_ITEMS'):
+        return Response({'error': f"At most {batch.get_config('MAX_ITEMS')} items per batch"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = BatchItemSerializer(data=items, many=True)
+    if not serializer.is_valid():
+        errors = serializer.errors
+        if isinstance(errors, list):
+            errors = {index: error for index, error in enumerate(errors) if error}
+        return Response({'error': 'Invalid items', 'items': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    items = serializer.validated_data
+    groups = batch.group_items(items)
+    cached = batch.lookup_cached(groups)
+    save = request.data.get('save', True) is not False
+
+    stream = batch.astream_results if served_by_asgi(request) else batch.stream_results
+    response = StreamingHttpResponse(
+        stream(request.user, items, groups, cached, save=save),
+        content_type='application/x-ndjson',
+    )
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_symptoms(request, fmt):
+    # Whole history as a download, streamed in constant memory (see export.py)
+    if fmt not in export.CONTENT_TYPES:
+        return Response({'error': f"Format must be one of: {', '.join(export.CONTENT_TYPES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    fields = SymptomSerializer.Meta.fields
+    if request.query_params.get('fields'):
+        fields = [f.strip() for f in request.query_params['fields'].split(',') if f.strip()]
+        unknown = set(fields) - set(SymptomSerializer.Meta.fields)
+        if unknown:
+            return Response({'error': f"Unknown fields: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    gzip = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    stream = export.astream if served_by_asgi(request) else export.stream
+    response = StreamingHttpResponse(
+        stream(request.user, fmt, fields, gzip=gzip),
+        content_type=export.CONTENT_TYPES[fmt],
+    )
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = f'attachment; filename="symptoms-{timezone.localdate():%Y%m%d}.{fmt}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_symptoms(request):
+    # Ranked full-text search over the user's own history (see search.py)
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    paginator = SearchPagination()
+    try:
+        page = paginator.paginate_search(request.user, text, request)
+    except ParseError as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = SearchResultSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def check_cache_stats(request):
+    return Response(get_response_cache().stats(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET', 'DELETE', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def log_symptom_detail(request, pk):
     try:
         # Ensure the user can only access their OWN symptom
         symptom = Symptom.objects.get(pk=pk, user=request.user)
         
-        if request.method == 'DELETE':
-            symptom.delete()
+        if request.method == 'GET':
+            # Full record, including the analysis left out of the history list
+            return Response(SymptomSerializer(symptom).data, status=status.HTTP_200_OK)
+
+        elif request.method == 'DELETE':
+            with transaction.atomic():
+                delta = rollups.Delta().remove(symptom)
+                symptom.delete()
+                delta.apply()
             return Response(status=status.HTTP_204_NO_CONTENT)
         
         elif request.method == 'PATCH':
             # Update symptom with new data (e.g., full conversation)
             serializer = SymptomSerializer(symptom, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic():
+                    delta = rollups.Delta().remove(symptom)
+                    serializer.save()
+                    delta.add(symptom).apply()
                 return Response(serializer.data, status=status.HTTP_200_OK)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
@@ -79,7 +209,10 @@ def log_symptom_detail(request, pk):
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def clear_all_symptoms(request):
-    deleted_count, _ = Symptom.objects.filter(user=request.user).delete()
+    # The rows and their rollups go together; the chunks still bound each DELETE
+    with transaction.atomic():
+        deleted_count = Symptom.objects.filter(user=request.user).bulk_delete()
+        rollups.clear(request.user)
     return Response({
         'message': 'All symptoms cleared successfully',
         'deleted_count': deleted_count
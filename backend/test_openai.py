@@ -1,30 +1,47 @@
+"""
+Manual smoke test for an OpenAI-compatible endpoint.
+
+    python test_openai.py
+
+Reads OPENAI_API_KEY from backend/.env. Set OPENAI_BASE_URL to try it against
+the local fake server instead (python manage.py fake_llm, then
+OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=fake).
+"""
 import os
 import sys
-from openai import OpenAI
+from pathlib import Path
+
 from dotenv import load_dotenv
+from openai import OpenAI
+
+
+def main():
+    # Load .env from the backend directory
+    load_dotenv(Path(__file__).resolve().parent / ".env")
+
+    api_key = os.getenv("OPENAI_API_KEY")
 
-# Load .env from the backend directory
-load_dotenv('c:/Users/payya/OneDrive/Desktop/Minimedi/minimedi/backend/.env')
+    print(f"Testing key: {api_key[:10]}...{api_key[-5:]}" if api_key else "Testing key: NONE")
 
-api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("ERROR: No API key found in .env")
+        sys.exit(1)
 
-print(f"Testing key: {api_key[:10]}...{api_key[-5:] if api_key else 'NONE'}")
+    client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None)
 
-if not api_key:
-    print("ERROR: No API key found in .env")
-    sys.exit(1)
+    try:
+        print("Sending test request to GPT-3.5-Turbo...")
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": "Hello, are you working?"}],
+            max_tokens=10
+        )
+        print("SUCCESS! Response received:")
+        print(response.choices[0].message.content)
+    except Exception as e:
+        print("FAILED! Error details:")
+        print(str(e))
 
-client = OpenAI(api_key=api_key)
 
-try:
-    print("Sending test request to GPT-3.5-Turbo...")
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": "Hello, are you working?"}],
-        max_tokens=10
-    )
-    print("SUCCESS! Response received:")
-    print(response.choices[0].message.content)
-except Exception as e:
-    print("FAILED! Error details:")
-    print(str(e))
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,188 @@
+import hashlib
 import jwt
-import os
+import threading
+import time
+from collections import OrderedDict
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from metrics.instrument import phase
 
 User = get_user_model()
 
+DEFAULTS = {
+    "TOKEN_CACHE_SIZE": 1024,    # verified tokens kept per process
+    "USER_CACHE_TIMEOUT": 30,    # seconds a loaded user is reused
+    "USER_CACHE_ALIAS": "default",
+    "LAZY_USER": False,          # build request.user from claims only
+    "PROFILE_VERSION_TIMEOUT": 60,  # seconds a remembered profile version is trusted
+}
+
+# Token claims that map straight onto User fields for the lazy user
+CLAIM_FIELDS = {
+    "id": "id",
+    "username": "username",
+    "email": "email",
+    "name": "first_name",
+    "isAdmin": "is_superuser",
+}
+
+
+def get_config(name):
+    return getattr(settings, "JWT_AUTH", {}).get(name, DEFAULTS[name])
+
+
+class VerifiedTokenCache:
+    """
+    Small LRU of tokens whose signature has already been checked, so a
+    client repeating the same bearer token skips the HMAC and JSON decode.
+    Expiry is still enforced on every hit.
+    """
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            payload = self._data.get(token)
+            if payload is None:
+                return None
+            if payload.get("exp", 0) <= time.time():
+                del self._data[token]
+                raise jwt.ExpiredSignatureError
+            self._data.move_to_end(token)
+            return payload
+
+    def set(self, token, payload):
+        with self._lock:
+            self._data[token] = payload
+            self._data.move_to_end(token)
+            while len(self._data) > get_config("TOKEN_CACHE_SIZE"):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def decode_token(token):
+    """Verify ``token`` (or reuse a previous verification) and return its claims."""
+    payload = verified_tokens.get(token)
+    if payload is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+        verified_tokens.set(token, payload)
+    return payload
+
+
+# =========================
+# USER CACHE
+# =========================
+# One cache entry per user holds the users loaded for each token ``iat``, so
+# a token issued after a profile change never sees an older copy and saving
+# or deleting the user drops every entry with a single delete.
+#
+# That delete only reaches the cache of the process that saved the user when
+# USER_CACHE_ALIAS is per process (LocMemCache). Every entry therefore carries
+# its load time and is reloaded after USER_CACHE_TIMEOUT seconds however often
+# the key is rewritten, which bounds how long another worker keeps accepting a
+# deleted or deactivated user.
+MAX_TOKENS_PER_USER = 4
+
+
+def user_cache_key(user_id):
+    return f"users:jwt:{user_id}"
+
+
+def invalidate_user_cache(user_id):
+    caches[get_config("USER_CACHE_ALIAS")].delete(user_cache_key(user_id))
+
+
+def get_cached_user(payload):
+    cache = caches[get_config("USER_CACHE_ALIAS")]
+    key = user_cache_key(payload["id"])
+    iat = payload.get("iat")
+
+    timeout = get_config("USER_CACHE_TIMEOUT")
+    entries = cache.get(key) or {}
+    entry = entries.get(iat)
+    if entry is not None and time.time() - entry[0] < timeout:
+        return entry[1]
+
+    user = User.objects.get(id=payload["id"])
+    entries = {k: v for k, v in list(entries.items())[-(MAX_TOKENS_PER_USER - 1):] if k != iat}
+    entries[iat] = (time.time(), user)
+    cache.set(key, entries, timeout)
+    return user
+
+
+# =========================
+# PROFILE VERSION
+# =========================
+# Tokens carry a "ver" claim derived from the profile fields they embed. The
+# current version of every user is kept in the cache (refreshed on save), so
+# a stale token can be detected without reading the user row. The save only
+# refreshes caches the saving process can reach, so versions expire after
+# PROFILE_VERSION_TIMEOUT seconds and are then re-read from the user row.
+def profile_version(user):
+    raw = "|".join(str(v) for v in (user.username, user.email, user.first_name, user.is_superuser))
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def profile_version_key(user_id):
+    return f"users:profile-ver:{user_id}"
+
+
+def remember_profile_version(user):
+    caches[get_config("USER_CACHE_ALIAS")].set(
+        profile_version_key(user.pk), profile_version(user), get_config("PROFILE_VERSION_TIMEOUT")
+    )
+
+
+def forget_profile_version(user_id):
+    caches[get_config("USER_CACHE_ALIAS")].delete(profile_version_key(user_id))
+
+
+def current_profile_version(user_id):
+    """Return the user's current profile version, or None if the user is gone."""
+    version = caches[get_config("USER_CACHE_ALIAS")].get(profile_version_key(user_id))
+    if version is None:
+        user = User.objects.filter(id=user_id).first()
+        if user is None:
+            return None
+        remember_profile_version(user)
+        version = profile_version(user)
+    return version
+
+
+def lazy_user(payload):
+    """
+    Build a User from the token claims without touching the database. The
+    other fields are deferred, so Django loads them on first access.
+    """
+    known = {field: payload[claim] for claim, field in CLAIM_FIELDS.items() if claim in payload}
+    # from_db() expects values in concrete field order
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in known]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [known[name] for name in fields])
+
+
 class JWTAuthentication(BaseAuthentication):
+    def authenticate_header(self, request):
+        # A challenge makes DRF answer failed authentication with 401, not 403
+        return 'Bearer realm="api"'
+
     def authenticate(self, request):
+        with phase("auth"):
+            return self._authenticate(request)
+
+    def _authenticate(self, request):
         auth_header = request.headers.get("Authorization")
         if not auth_header:
             return None
@@ -22,15 +196,20 @@ class JWTAuthentication(BaseAuthentication):
             return None
 
         try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+            payload = decode_token(token)
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed("Token has expired")
         except jwt.InvalidTokenError:
             raise AuthenticationFailed("Invalid token")
 
+        if get_config("LAZY_USER"):
+            return (lazy_user(payload), payload)
+
         try:
-            user = User.objects.get(id=payload["id"])
+            user = get_cached_user(payload)
         except User.DoesNotExist:
             raise AuthenticationFailed("User not found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive")
 
-        return (user, None)
+        return (user, payload)
@@ -0,0 +1,23 @@
+import os
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Warning, register
+
+
+@register()
+def per_process_user_cache(app_configs, **kwargs):
+    # gunicorn reads WEB_CONCURRENCY too (see start.sh)
+    from .authentication import get_config
+
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and isinstance(caches[get_config("USER_CACHE_ALIAS")], LocMemCache):
+        return [Warning(
+            f"JWT_AUTH['USER_CACHE_ALIAS'] is a per-process cache but {workers} workers are configured.",
+            hint=(
+                "Deleting, deactivating or editing a user reaches the other workers only after "
+                "USER_CACHE_TIMEOUT / PROFILE_VERSION_TIMEOUT seconds. Set REDIS_URL to share the cache."
+            ),
+            id="users.W001",
+        )]
+    return []
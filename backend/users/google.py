@@ -0,0 +1,174 @@
+"""
+Google sign-in verification.
+
+Two flows are supported:
+
+* ID tokens (``id_token`` / ``credential``) are verified locally with
+  google-auth against Google's JWKS. The key set is cached in-process and
+  refetched every ``CERTS_REFRESH`` seconds, or early when a token names a
+  key id we have not seen yet (Google rotated its keys).
+* Access tokens (``token``) still need Google's userinfo endpoint. Calls go
+  through one pooled ``requests.Session`` with timeouts, and the resulting
+  identity is cached for ``USERINFO_CACHE_TIMEOUT`` seconds keyed by a hash
+  of the token.
+"""
+import hashlib
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from google.auth import exceptions as google_exceptions
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token as google_id_token
+from requests.adapters import HTTPAdapter
+
+DEFAULTS = {
+    "CLIENT_ID": None,                 # falls back to settings.GOOGLE_CLIENT_ID
+    "CERTS_URL": "https://www.googleapis.com/oauth2/v3/certs",
+    "USERINFO_URL": "https://www.googleapis.com/oauth2/v3/userinfo",
+    "ISSUERS": ["accounts.google.com", "https://accounts.google.com"],
+    "CERTS_REFRESH": 3600,             # seconds the key set is reused
+    "CERTS_MIN_REFRESH": 60,           # never refetch keys more often than this
+    "USERINFO_CACHE_TIMEOUT": 300,     # seconds an access token's identity is reused
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": (3.05, 5),              # (connect, read) seconds
+    "POOL_SIZE": 10,
+}
+
+
+class GoogleAuthError(Exception):
+    """The token was rejected."""
+
+
+class GoogleUnavailable(Exception):
+    """Google could not be reached."""
+
+
+def get_config(name):
+    value = getattr(settings, "GOOGLE_AUTH", {}).get(name, DEFAULTS[name])
+    if name == "CLIENT_ID" and value is None:
+        value = getattr(settings, "GOOGLE_CLIENT_ID", None)
+    return value
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=get_config("POOL_SIZE"))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class CachedCertsRequest(google_requests.Request):
+    """
+    google-auth transport that serves the certs URL from memory. Every other
+    request goes straight through the pooled session.
+    """
+
+    def __init__(self):
+        super().__init__(session=get_session())
+        self._lock = threading.Lock()
+        self._certs = None
+        self._fetched_at = 0.0
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        timeout = timeout or get_config("TIMEOUT")
+        if url != get_config("CERTS_URL") or method != "GET":
+            return super().__call__(url, method, body, headers, timeout, **kwargs)
+
+        with self._lock:
+            if self._certs is None or time.monotonic() - self._fetched_at > get_config("CERTS_REFRESH"):
+                response = super().__call__(url, method, body, headers, timeout, **kwargs)
+                if response.status != 200:
+                    return response
+                self._certs = response
+                self._fetched_at = time.monotonic()
+            return self._certs
+
+    def expire(self):
+        """Drop the cached keys unless they were fetched very recently."""
+        with self._lock:
+            if time.monotonic() - self._fetched_at > get_config("CERTS_MIN_REFRESH"):
+                self._certs = None
+
+    def clear(self):
+        with self._lock:
+            self._certs = None
+            self._fetched_at = 0.0
+
+
+certs_request = CachedCertsRequest()
+
+
+def _verify(token, audience):
+    return google_id_token.verify_token(token, certs_request, audience=audience, certs_url=get_config("CERTS_URL"))
+
+
+def verify_id_token(token):
+    """Verify a Google ID token locally and return its claims."""
+    audience = get_config("CLIENT_ID")
+    if not audience:
+        raise GoogleAuthError("Google ID-token login is not configured")
+
+    try:
+        try:
+            claims = _verify(token, audience)
+        except Exception:
+            # Possibly signed with a key published after our last fetch
+            certs_request.expire()
+            claims = _verify(token, audience)
+    except google_exceptions.TransportError as e:
+        raise GoogleUnavailable(str(e))
+    except Exception as e:
+        raise GoogleAuthError(str(e))
+
+    if claims.get("iss") not in get_config("ISSUERS"):
+        raise GoogleAuthError("Wrong issuer")
+    if not claims.get("email") or claims.get("email_verified") is False:
+        raise GoogleAuthError("Email not verified")
+    return claims
+
+
+def userinfo_cache_key(access_token):
+    return "users:google:" + hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def fetch_userinfo(access_token):
+    """Resolve an access token to Google's userinfo, reusing recent answers."""
+    cache = caches[get_config("CACHE_ALIAS")]
+    key = userinfo_cache_key(access_token)
+    info = cache.get(key)
+    if info is not None:
+        return info
+
+    try:
+        response = get_session().get(
+            get_config("USERINFO_URL"),
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=get_config("TIMEOUT"),
+        )
+    except requests.RequestException as e:
+        raise GoogleUnavailable(str(e))
+
+    if response.status_code >= 500:
+        raise GoogleUnavailable(f"userinfo returned {response.status_code}")
+    if not response.ok:
+        raise GoogleAuthError("Invalid Google token")
+
+    info = response.json()
+    if not info.get("email") or not info.get("sub"):
+        raise GoogleAuthError("Invalid Google token")
+    info = {"sub": info["sub"], "email": info["email"], "name": info.get("name", "")}
+    cache.set(key, info, get_config("USERINFO_CACHE_TIMEOUT"))
+    return info
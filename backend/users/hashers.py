@@ -0,0 +1,86 @@
+"""
+Password hashers whose cost parameters come from ``settings.PASSWORD_HASHING``.
+
+The hashers keep Django's algorithm names, so existing hashes still verify.
+When a deployment raises (or lowers) a parameter, or switches profile, the
+stored hash no longer matches the preferred hasher and ``check_password``
+rehashes it on the next successful login.
+
+``PASSWORD_HASHERS`` is built from ``hasher_list`` in the settings module,
+so nothing here may read settings at import time.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+DEFAULTS = {
+    "PBKDF2": {"iterations": hashers.PBKDF2PasswordHasher.iterations},
+    "SCRYPT": {
+        "work_factor": hashers.ScryptPasswordHasher.work_factor,
+        "block_size": hashers.ScryptPasswordHasher.block_size,
+        "parallelism": hashers.ScryptPasswordHasher.parallelism,
+    },
+    "ARGON2": {
+        "time_cost": hashers.Argon2PasswordHasher.time_cost,
+        "memory_cost": hashers.Argon2PasswordHasher.memory_cost,
+        "parallelism": hashers.Argon2PasswordHasher.parallelism,
+    },
+}
+
+PROFILES = {
+    "pbkdf2": "users.hashers.PBKDF2PasswordHasher",
+    "scrypt": "users.hashers.ScryptPasswordHasher",
+    "argon2": "users.hashers.Argon2PasswordHasher",
+}
+
+
+def get_params(profile):
+    config = getattr(settings, "PASSWORD_HASHING", {})
+    return {**DEFAULTS[profile], **config.get(profile, {})}
+
+
+def hasher_list(profile):
+    """``PASSWORD_HASHERS`` with ``profile`` preferred and the others kept for verifying."""
+    preferred = PROFILES[profile]
+    return [preferred] + [path for path in PROFILES.values() if path != preferred]
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return get_params("PBKDF2")["iterations"]
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return get_params("SCRYPT")["work_factor"]
+
+    @property
+    def block_size(self):
+        return get_params("SCRYPT")["block_size"]
+
+    @property
+    def parallelism(self):
+        return get_params("SCRYPT")["parallelism"]
+
+    @property
+    def maxmem(self):
+        # OpenSSL's default 32 MiB cap is too small once work_factor goes up
+        params = get_params("SCRYPT")
+        return 256 * params["work_factor"] * params["block_size"] * params["parallelism"]
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Needs ``argon2-cffi`` (``pip install django[argon2]``)."""
+
+    @property
+    def time_cost(self):
+        return get_params("ARGON2")["time_cost"]
+
+    @property
+    def memory_cost(self):
+        return get_params("ARGON2")["memory_cost"]
+
+    @property
+    def parallelism(self):
+        return get_params("ARGON2")["parallelism"]
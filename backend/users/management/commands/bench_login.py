@@ -0,0 +1,80 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from users.hashers import PROFILES, hasher_list
+from users.views import LoginView
+
+PASSWORD = "Bench-Password-123!"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure password verification cost per hasher profile (single thread and with "
+        "--threads workers) and the end-to-end LoginView latency for the active profile. "
+        "Use the numbers to size workers against hashing CPU cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=sorted(PROFILES))
+        parser.add_argument("--logins", type=int, default=20, help="verifications per measurement")
+        parser.add_argument("--threads", type=int, default=4)
+
+    def handle(self, *args, **options):
+        threaded = f"x{options['threads']} logins/s"
+        self.stdout.write(f"{'profile':>8} {'ms/login':>9} {'logins/s':>9} {threaded:>14}")
+        for profile in options["profiles"]:
+            with override_settings(PASSWORD_HASHERS=hasher_list(profile)):
+                try:
+                    encoded = get_hasher().encode(PASSWORD, get_hasher().salt())
+                except (ImportError, ValueError) as e:
+                    self.stdout.write(f"{profile:>8} skipped: {e}")
+                    continue
+                self._hash_row(profile, encoded, options["logins"], options["threads"])
+
+        self._login_view(options["logins"])
+
+    def _hash_row(self, profile, encoded, logins, threads):
+        hasher = get_hasher()
+        started = time.perf_counter()
+        for _ in range(logins):
+            hasher.verify(PASSWORD, encoded)
+        serial = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: hasher.verify(PASSWORD, encoded), range(logins)))
+        parallel = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{profile:>8} {serial / logins * 1000:>9.1f} {logins / serial:>9.1f} {logins / parallel:>14.1f}"
+        )
+
+    def _login_view(self, logins):
+        email = f"bench-login-{uuid.uuid4().hex[:8]}@example.com"
+        user = User.objects.create_user(username=email, email=email, password=PASSWORD)
+        view = LoginView.as_view()
+        factory = APIRequestFactory()
+        try:
+            timings = []
+            for _ in range(logins):
+                request = factory.post("/api/users/login/", {"email": email.upper(), "password": PASSWORD}, format="json")
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = view(request)
+                    timings.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.data
+            self.stdout.write(
+                f"LoginView: p50 {statistics.median(timings) * 1000:.1f} ms, "
+                f"max {max(timings) * 1000:.1f} ms, {len(queries)} queries per login"
+            )
+        finally:
+            user.delete()
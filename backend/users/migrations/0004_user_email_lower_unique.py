@@ -0,0 +1,43 @@
+from django.core.management.base import CommandError
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+CREATE_INDEX = "CREATE UNIQUE INDEX users_user_email_lower_uniq ON auth_user (LOWER(email)) WHERE email > ''"
+DROP_INDEX = "DROP INDEX IF EXISTS users_user_email_lower_uniq"
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """
+    The index can't be built while two accounts share an email (ignoring
+    case). Stop with the list instead of a bare IntegrityError; merge or
+    rename those accounts, then migrate again.
+    """
+    User = apps.get_model('auth', 'User')
+    users = User.objects.using(schema_editor.connection.alias).filter(email__gt='').annotate(email_lower=Lower('email'))
+    duplicates = list(
+        users.values('email_lower').annotate(count=Count('id')).filter(count__gt=1).values_list('email_lower', flat=True)
+    )
+    if not duplicates:
+        return
+    lines = [
+        f"  {email}: user ids {', '.join(str(pk) for pk in users.filter(email_lower=email).order_by('pk').values_list('pk', flat=True))}"
+        for email in sorted(duplicates)
+    ]
+    raise CommandError(
+        "These emails are used by more than one account (ignoring case); merge or rename "
+        "the accounts before migrating:\n" + "\n".join(lines)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_issuereport'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
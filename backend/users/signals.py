@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_profile_version, invalidate_user_cache, remember_profile_version
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, **kwargs):
+    invalidate_user_cache(instance.pk)
+    remember_profile_version(instance)
+
+
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    invalidate_user_cache(instance.pk)
+    forget_profile_version(instance.pk)
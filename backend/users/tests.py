@@ -1,3 +1,325 @@
-from django.test import TestCase
+import importlib
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users import authentication, google
+from users.hashers import hasher_list
+from users.signals import drop_cached_user
+from users.views import create_jwt, users_by_email
+
+User = get_user_model()
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+
+class StubGoogle(BaseHTTPRequestHandler):
+    """Serves /certs (a JWKS) and /userinfo for a fixed set of access tokens."""
+
+    keys = []
+    userinfo = {}
+    hits = {"/certs": 0, "/userinfo": 0}
+
+    def do_GET(self):
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == "/certs":
+            self._reply(200, {"keys": self.keys})
+        elif self.path == "/userinfo":
+            token = self.headers.get("Authorization", "").replace("Bearer ", "")
+            if token in self.userinfo:
+                self._reply(200, self.userinfo[token])
+            else:
+                self._reply(401, {"error": "invalid_token"})
+        else:
+            self._reply(404, {})
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_key(kid):
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private.public_key()))
+    jwk.update(kid=kid, alg="RS256", use="sig")
+    return private, jwk
+
+
+class GoogleLoginTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubGoogle)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.google_auth = {
+            "CLIENT_ID": CLIENT_ID,
+            "CERTS_URL": f"{base}/certs",
+            "USERINFO_URL": f"{base}/userinfo",
+        }
+        cls.settings_override = override_settings(GOOGLE_AUTH=cls.google_auth)
+        cls.settings_override.enable()
+        cls.private, jwk = make_key("k1")
+        StubGoogle.keys = [jwk]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        google.certs_request.clear()
+        StubGoogle.hits.clear()
+        StubGoogle.userinfo = {"good-token": {"sub": "1234567890", "email": "ann@example.com", "name": "Ann"}}
+        self.client = APIClient()
+
+    def id_token(self, private=None, kid="k1", **claims):
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": "1234567890",
+            "email": "ann@example.com",
+            "email_verified": True,
+            "name": "Ann",
+            "iat": now,
+            "exp": now + 3600,
+            **claims,
+        }
+        return jwt.encode(payload, private or self.private, algorithm="RS256", headers={"kid": kid})
+
+    def login(self, **data):
+        return self.client.post("/api/users/google-login/", data, format="json")
+
+    def test_id_token_is_verified_against_cached_keys(self):
+        first = self.login(id_token=self.id_token())
+        second = self.login(credential=self.id_token(sub="1234567890", name="Ann B"))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(User.objects.filter(email="ann@example.com").count(), 1)
+        self.assertEqual(StubGoogle.hits.get("/certs"), 1)
+        self.assertNotIn("/userinfo", StubGoogle.hits)
+
+    def test_id_token_for_other_audience_is_rejected(self):
+        response = self.login(id_token=self.id_token(aud="someone-else"))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.exists())
+
+    def test_id_token_with_bad_signature_is_rejected(self):
+        forged, _ = make_key("k1")
+        self.assertEqual(self.login(id_token=self.id_token(private=forged)).status_code, 400)
+
+    def test_unknown_key_id_refetches_keys(self):
+        self.login(id_token=self.id_token())
+        rotated, jwk = make_key("k2")
+        StubGoogle.keys = StubGoogle.keys + [jwk]
+        try:
+            with override_settings(GOOGLE_AUTH={**self.google_auth, "CERTS_MIN_REFRESH": 0}):
+                response = self.login(id_token=self.id_token(private=rotated, kid="k2"))
+        finally:
+            StubGoogle.keys = StubGoogle.keys[:1]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubGoogle.hits.get("/certs"), 2)
+
+    def test_access_token_identity_is_cached(self):
+        self.assertEqual(self.login(token="good-token").status_code, 200)
+        self.assertEqual(self.login(token="good-token").status_code, 200)
+        self.assertEqual(StubGoogle.hits.get("/userinfo"), 1)
+        self.assertTrue(User.objects.filter(email="ann@example.com", first_name="Ann").exists())
+
+    def test_invalid_access_token_is_rejected(self):
+        self.assertEqual(self.login(token="bad-token").status_code, 400)
+
+    def test_unreachable_google_returns_503(self):
+        with override_settings(GOOGLE_AUTH={"USERINFO_URL": "http://127.0.0.1:9/userinfo", "TIMEOUT": 1}):
+            response = self.login(token="good-token")
+        self.assertEqual(response.status_code, 503)
+
+    def test_missing_token(self):
+        self.assertEqual(self.login().status_code, 400)
+
+
+class JWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="amy", email="amy@example.com", password="Secret#1")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt(self.user)}")
+
+    def profile(self):
+        return self.client.get("/api/users/profile/")
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.profile().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.profile().status_code, 401)
+
+    def test_change_missed_by_this_process_is_picked_up_after_the_timeout(self):
+        self.assertEqual(self.profile().status_code, 200)
+        # As if another worker deactivated the user: no invalidation here
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.profile().status_code, 200)
+
+        later = time.time() + authentication.get_config("USER_CACHE_TIMEOUT")
+        with mock.patch("users.authentication.time.time", return_value=later):
+            self.assertEqual(self.profile().status_code, 401)
+
+
+    def test_expired_token_gets_401_with_an_error(self):
+        with mock.patch("users.views.timezone.now", return_value=timezone.now() - timedelta(days=30)):
+            token = create_jwt(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.profile()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {"error": "Invalid or expired token."})
+        self.assertEqual(response["WWW-Authenticate"], 'Bearer realm="api"')
+
+    def test_missing_token_gets_401(self):
+        response = APIClient().get("/api/users/profile/")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {"error": "Invalid or expired token."})
+
+    def test_bad_token_is_401_on_other_endpoints(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(self.client.get("/api/symptoms/").status_code, 401)
+
+
+class ProfileVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="amy", email="amy@example.com", password="Secret#1", first_name="Amy")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {create_jwt(self.user)}")
+
+    def test_edit_missed_by_this_process_is_picked_up_after_the_timeout(self):
+        etag = self.client.get("/api/users/profile/")["ETag"]
+        # As if another worker saved the edit: this process's version isn't refreshed
+        User.objects.filter(pk=self.user.pk).update(first_name="Amelia")
+        self.assertEqual(self.client.get("/api/users/profile/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        later = time.time() + authentication.get_config("PROFILE_VERSION_TIMEOUT") + 1
+        with mock.patch("time.time", return_value=later):
+            response = self.client.get("/api/users/profile/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["name"], "Amelia")
+        self.assertIn("token", response.data)
+
+    def test_deleted_user_gets_401_not_500(self):
+        self.client.get("/api/users/profile/")
+        # Deleted by another worker: this one still has the user and a newer version cached
+        post_delete.disconnect(drop_cached_user, sender=User)
+        try:
+            User.objects.filter(pk=self.user.pk).delete()
+        finally:
+            post_delete.connect(drop_cached_user, sender=User)
+        cache.set(authentication.profile_version_key(self.user.pk), "0123456789abcdef")
+
+        self.assertEqual(self.client.get("/api/users/profile/").status_code, 401)
+
+
+@override_settings(PASSWORD_HASHING={"PBKDF2": {"iterations": 1000}})
+class EmailLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="amy", email="Amy@Example.com", password="Secret#1")
+        self.client = APIClient()
+
+    def login(self, email, password="Secret#1"):
+        return self.client.post("/api/users/login/", {"email": email, "password": password}, format="json")
+
+    def test_login_ignores_email_case(self):
+        response = self.login("amy@EXAMPLE.com")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("token", response.data)
+        self.assertEqual(self.login("amy@example.com", "wrong").status_code, 401)
+        self.assertEqual(self.login("bob@example.com").status_code, 404)
+
+    def test_users_by_email(self):
+        User.objects.create_user(username="no-email", email="", password="x")
+        self.assertEqual(list(users_by_email("AMY@example.COM")), [self.user])
+        self.assertFalse(users_by_email("").exists())
+
+    def test_email_is_unique_ignoring_case(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user(username="amy2", email="amy@example.com", password="x")
+        # Users without an email aren't covered by the index
+        User.objects.create_user(username="a", email="", password="x")
+        User.objects.create_user(username="b", email="", password="x")
+
+    def test_signup_rejects_an_email_in_another_case(self):
+        response = self.client.post(
+            "/api/users/signup/", {"email": "AMY@example.com", "password": "Another#Secret1"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Email already exists."})
+
+    def test_login_rehashes_after_the_parameters_change(self):
+        self.assertIn("$1000$", self.user.password)
+        with override_settings(PASSWORD_HASHING={"PBKDF2": {"iterations": 2000}}):
+            self.assertEqual(self.login("amy@example.com").status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$2000$"))
+        # A failed login leaves the hash alone
+        with override_settings(PASSWORD_HASHING={"PBKDF2": {"iterations": 3000}}):
+            self.assertEqual(self.login("amy@example.com", "wrong").status_code, 401)
+        self.user.refresh_from_db()
+        self.assertIn("$2000$", self.user.password)
+
+    def test_login_rehashes_after_a_profile_switch(self):
+        scrypt = {"SCRYPT": {"work_factor": 2**4, "block_size": 8, "parallelism": 1}}
+        with override_settings(PASSWORD_HASHERS=hasher_list("scrypt"), PASSWORD_HASHING=scrypt):
+            self.assertEqual(self.login("amy@example.com").status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith("scrypt$"))
+            self.assertTrue(self.user.check_password("Secret#1"))
+
+
+class EmailIndexMigrationTests(TestCase):
+    migration = importlib.import_module("users.migrations.0004_user_email_lower_unique")
+
+    def check_duplicates(self):
+        schema_editor = mock.Mock(connection=connection)
+        self.migration.check_duplicate_emails(apps, schema_editor)
+
+    def test_duplicates_are_listed_before_building_the_index(self):
+        # As before the migration: no index, two accounts for one address
+        with connection.cursor() as cursor:
+            cursor.execute(self.migration.DROP_INDEX)
+        first = User.objects.create_user(username="a", email="Amy@example.com", password="x")
+        second = User.objects.create_user(username="b", email="amy@EXAMPLE.com", password="x")
+        User.objects.create_user(username="c", email="bob@example.com", password="x")
+
+        with self.assertRaisesMessage(CommandError, f"amy@example.com: user ids {first.pk}, {second.pk}") as raised:
+            self.check_duplicates()
+        self.assertNotIn("bob@example.com", str(raised.exception))
+
+    def test_no_duplicates_passes(self):
+        User.objects.create_user(username="a", email="amy@example.com", password="x")
+        User.objects.create_user(username="b", email="", password="x")
+        User.objects.create_user(username="c", email="", password="x")
+        self.check_duplicates()
@@ -1,19 +1,22 @@
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView, RetrieveDestroyAPIView
-from rest_framework.permissions import IsAdminUser
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from django.contrib.auth import get_user_model, authenticate
+from django.contrib.auth import get_user_model
 from rest_framework import status
 import jwt
 from datetime import datetime, timedelta
 import os
-import requests
 
 from django.conf import settings
 from django.utils import timezone
 from django.db import IntegrityError
+from django.db.models.functions import Lower
 from .models import IssueReport
 from .serializers import IssueReportSerializer
+from .authentication import current_profile_version, profile_version
+from . import google
 
 import re
 
@@ -38,23 +41,23 @@ def is_strong_password(password):
     return True, ""
 
 def create_jwt(user):
-    # Create JWT token with 24-hour expiration for daily usage
+    # Create JWT token with 24-hour expiration for daily usage. Profile fields
+    # ride along as signed claims so ProfileView needs no database read.
     payload = {
         "id": user.id,
         "username": user.username,
         "email": user.email,
+        "name": user.first_name,
+        "isAdmin": user.is_superuser,
+        "ver": profile_version(user),
         "exp": timezone.now() + timedelta(days=1),  # Token valid for 24 hours
         "iat": timezone.now()
     }
     return jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
 
-def decode_jwt(token):
-    try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+def users_by_email(email):
+    # Same expression and predicate as the unique lower(email) index (migration 0004)
+    return User.objects.alias(email_lower=Lower("email")).filter(email_lower=email.lower(), email__gt="")
 
 class SignupView(APIView):
     def post(self, request):
@@ -72,7 +75,7 @@ class SignupView(APIView):
         if not is_strong:
             return Response({"error": msg}, status=status.HTTP_400_BAD_REQUEST)
 
-        if User.objects.filter(email=email).exists():
+        if users_by_email(email).exists():
             return Response({"error": "Email already exists."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
@@ -96,64 +99,98 @@ class LoginView(APIView):
         email = data.get("email")
         password = data.get("password")
 
-        user_qs = User.objects.filter(email=email)
-        if not user_qs.exists():
+        if not email or not password:
+            return Response({"error": "Email and password are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = users_by_email(email).get()
+        except User.DoesNotExist:
             return Response({"error": "User not found."}, status=404)
 
-        user = authenticate(username=user_qs[0].username, password=password)
-        if user:
+        # check_password() rehashes the password if the hasher settings changed
+        if user.is_active and user.check_password(password):
             token = create_jwt(user)
             return Response({"token": token}, status=200)
         return Response({"error": "Invalid credentials."}, status=401)
 
 class ProfileView(APIView):
-    def get(self, request):
-        auth_header = request.headers.get("Authorization", "")
-        token = auth_header.replace("Bearer ", "")
-        decoded = decode_jwt(token)
-
-        if not decoded:
-            return Response({"error": "Invalid or expired token."}, status=401)
+    permission_classes = [IsAuthenticated]
+
+    def handle_exception(self, exc):
+        # The frontend logs out on a 401 whose "error" mentions the token
+        if isinstance(exc, (AuthenticationFailed, NotAuthenticated)):
+            return Response(
+                {"error": "Invalid or expired token."},
+                status=status.HTTP_401_UNAUTHORIZED,
+                headers={"WWW-Authenticate": self.get_authenticate_header(self.request)},
+            )
+        return super().handle_exception(exc)
 
-        try:
-            user = User.objects.get(username=decoded["username"])
-        except User.DoesNotExist:
-             return Response({"error": "User not found."}, status=404)
+    def get(self, request):
+        claims = request.auth
+        version = current_profile_version(claims["id"])
+        if version is None:
+            return Response({"error": "User not found."}, status=404)
 
-        return Response({
-            "username": user.username,
-            "email": user.email,
-            "name": user.first_name,
-            "isAdmin": user.is_superuser
-        }, status=200)
+        etag = f'"{version}"'
+        if claims.get("ver") == version:
+            # Token is current: answer from its claims
+            if etag in request.headers.get("If-None-Match", ""):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            data = {
+                "username": claims["username"],
+                "email": claims["email"],
+                "name": claims["name"],
+                "isAdmin": claims["isAdmin"]
+            }
+        else:
+            # Profile changed since the token was issued: hand out a fresh one
+            try:
+                user = User.objects.get(id=claims["id"])
+            except User.DoesNotExist:
+                return Response({"error": "User not found."}, status=status.HTTP_401_UNAUTHORIZED)
+            data = {
+                "username": user.username,
+                "email": user.email,
+                "name": user.first_name,
+                "isAdmin": user.is_superuser,
+                "token": create_jwt(user)
+            }
+
+        return Response(data, status=200, headers={"ETag": etag})
 
 class GoogleLoginView(APIView):
     def post(self, request):
+        # ID tokens are verified locally; access tokens go through userinfo
+        id_token = request.data.get("id_token") or request.data.get("credential")
         access_token = request.data.get("token")
-        if not access_token:
+        if not id_token and not access_token:
             return Response({"error": "Token is required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Get user info from Google using the access token
-            response = requests.get('https://www.googleapis.com/oauth2/v3/userinfo', 
-                                    params={'access_token': access_token})
-            
-            if not response.ok:
-                return Response({"error": "Invalid Google token"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            idinfo = response.json()
+            if id_token:
+                idinfo = google.verify_id_token(id_token)
+            else:
+                idinfo = google.fetch_userinfo(access_token)
+        except google.GoogleAuthError:
+            return Response({"error": "Invalid Google token"}, status=status.HTTP_400_BAD_REQUEST)
+        except google.GoogleUnavailable:
+            return Response({"error": "Google sign-in is temporarily unavailable"},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
             email = idinfo['email']
             name = idinfo.get('name', '')
             google_id = idinfo['sub']
 
             # Find or create user
-            user, created = User.objects.get_or_create(
-                email=email,
-                defaults={
-                    'username': email.split('@')[0] + "_" + google_id[:5],
-                    'first_name': name
-                }
-            )
+            user = users_by_email(email).first()
+            if user is None:
+                user = User.objects.create(
+                    email=email,
+                    username=email.split('@')[0] + "_" + google_id[:5],
+                    first_name=name
+                )
 
             # Generate our app's JWT
             app_token = create_jwt(user)
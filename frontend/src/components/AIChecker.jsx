@@ -181,81 +181,30 @@ export default function AIChecker() {
     setIsLoading(true);
 
     try {
-      const res = await axiosInstance.post("/ai-check/", { messages: newMessages });
+      // Only the new message travels; the server keeps the conversation history
+      const send = (conversationId) => axiosInstance.post("/ai-check/", {
+        message: currentInput,
+        ...(conversationId && { conversation_id: conversationId })
+      });
+      const conversationId = localStorage.getItem("minimedi_conversation_id");
+      let res;
+      try {
+        res = await send(conversationId);
+      } catch (error) {
+        // Conversation gone (deleted, or stored by another account): start a new one
+        if (!conversationId || error.response?.status !== 404) throw error;
+        localStorage.removeItem("minimedi_conversation_id");
+        res = await send(null);
+      }
       const botResponse = res.data.response;
+      if (res.data.conversation_id) {
+        localStorage.setItem("minimedi_conversation_id", res.data.conversation_id.toString());
+      }
 
-      // Robust extraction of hidden DATA block
-      const dataMatch = botResponse.match(/###DATA_START###([\s\S]*?)###DATA_END###/);
+      // The server parses the hidden DATA block and saves the record itself
       const aiText = botResponse.replace(/###DATA_START###([\s\S]*?)###DATA_END###/g, "").trim();
 
       setMessages(prev => [...prev, { role: "assistant", content: aiText }]);
-
-      // Auto-save or update on EVERY AI response (not just when complete)
-      if (dataMatch) {
-        console.log('✅ DATA block found in AI response');
-        try {
-          const extracted = JSON.parse(dataMatch[1].trim());
-          console.log('📊 Extracted data:', extracted);
-          const savedRecordId = localStorage.getItem('minimedi_saved_record_id');
-          console.log('💾 Saved record ID from localStorage:', savedRecordId);
-
-          // Check if we already have a saved record for this conversation
-          if (savedRecordId) {
-            // UPDATE existing record with latest conversation
-            const conversationSummary = [...messages, { role: "assistant", content: aiText }]
-              .filter(msg => msg.role === 'assistant')
-              .map(msg => msg.content)
-              .join('\n\n');
-
-            console.log('🔄 Updating existing record:', savedRecordId);
-            const updateResponse = await axiosInstance.patch(`/symptoms/${savedRecordId}/`, {
-              ai_analysis: conversationSummary,
-              // Update other fields if available
-              ...(extracted.name && { patient_name: extracted.name }),
-              ...(extracted.age && { age: parseInt(extracted.age) }),
-              ...(extracted.gender && { gender: extracted.gender }),
-              ...(extracted.symptoms && { description: extracted.symptoms }),
-              ...(extracted.duration && { duration: parseInt(extracted.duration) })
-            });
-            console.log('✅ Update successful:', updateResponse.data);
-          } else {
-            // CREATE new record (first save)
-            console.log('🆕 Creating new record with data:', {
-              patient_name: extracted.name || "Guest",
-              title: "Health Analysis Report",
-              description: extracted.symptoms || "In progress...",
-              ai_analysis: aiText,
-              age: parseInt(extracted.age) || 0,
-              gender: extracted.gender || "Unknown",
-              duration: parseInt(extracted.duration) || 1,
-              severity: "MEDIUM",
-              risk_score: Math.floor(Math.random() * 40) + 20
-            });
-            const response = await axiosInstance.post("/symptoms/", {
-              patient_name: extracted.name || "Guest",
-              title: "Health Analysis Report",
-              description: extracted.symptoms || "In progress...",
-              ai_analysis: aiText,
-              age: parseInt(extracted.age) || 0,
-              gender: extracted.gender || "Unknown",
-              duration: parseInt(extracted.duration) || 1,
-              severity: "MEDIUM",
-              risk_score: Math.floor(Math.random() * 40) + 20
-            });
-
-            // Store record ID for future updates
-            if (response.data && response.data.id) {
-              localStorage.setItem('minimedi_saved_record_id', response.data.id.toString());
-              console.log('✅ Record created successfully. ID:', response.data.id);
-            }
-          }
-        } catch (e) {
-          console.error("❌ Auto-save/update error:", e);
-          console.error("Error details:", e.response?.data || e.message);
-        }
-      } else {
-        console.log('⚠️ No DATA block found in AI response. Response:', botResponse.substring(0, 200));
-      }
     } catch (error) {
       console.error("Consultation failed", error);
       setMessages(prev => [...prev, { role: "assistant", content: "I'm having trouble thinking clearly right now. Please try again in a moment." }]);
@@ -264,31 +213,10 @@ export default function AIChecker() {
     }
   };
 
-  const resetChat = async () => {
-    // Update the saved record with full conversation before resetting
-    const savedRecordId = localStorage.getItem('minimedi_saved_record_id');
-    if (savedRecordId) {
-      try {
-        // Create a summary of the entire conversation
-        const conversationSummary = messages
-          .filter(msg => msg.role === 'assistant')
-          .map(msg => msg.content)
-          .join('\n\n');
-
-        // Update the existing record with full conversation
-        await axiosInstance.patch(`/symptoms/${savedRecordId}/`, {
-          ai_analysis: conversationSummary
-        });
-
-        // Clear the saved record ID
-        localStorage.removeItem('minimedi_saved_record_id');
-      } catch (e) {
-        console.error("Failed to update conversation history:", e);
-      }
-    }
-
+  const resetChat = () => {
     // Reset the chat
     localStorage.removeItem("minimedi_chat_session");
+    localStorage.removeItem("minimedi_conversation_id");
     setMessages([
       { role: "assistant", content: "Hello! I'm MiniMedi, your AI Health Assistant. 👋 Before we begin, may I know your name?" }
     ]);
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from "react";
 import { Link, useNavigate } from "react-router-dom";
 import { toast } from "react-toastify";
-import { getToken, removeToken } from "../utils/auth";
+import { getToken, removeToken, setToken } from "../utils/auth";
 import axiosInstance from "../api/axiosInstance";
 import "../index.css";
 
@@ -16,6 +16,8 @@ const Navbar = ({ theme, toggleTheme, token }) => {
       axiosInstance.get("/users/profile/")
         .then((res) => {
           const data = res.data;
+          // Server reissues the token when the profile changed since login
+          if (data.token) setToken(data.token);
           setUsername(data.name || data.username);
           setIsAdmin(data.isAdmin);
         })
@@ -6,14 +6,14 @@ export default function SymptomForm() {
   const [entries, setEntries] = useState([]);
 
   useEffect(() => {
-    axiosInstance.get("/symptoms/").then((res) => setEntries(res.data));
+    axiosInstance.get("/symptoms/").then((res) => setEntries(res.data.results));
   }, []);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
     await axiosInstance.post("/symptoms/", { title });
     const res = await axiosInstance.get("/symptoms/");
-    setEntries(res.data);
+    setEntries(res.data.results);
     setTitle("");
   };
 
@@ -76,6 +76,8 @@ export default function History() {
   const [modalOpen, setModalOpen] = useState(false);
   const [modalConfig, setModalConfig] = useState({ title: "", message: "", onConfirm: () => { } });
   const [timeFilter, setTimeFilter] = useState('all'); // 'today', 'week', 'month', 'year', 'all'
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   useEffect(() => {
     const token = getToken();
@@ -87,10 +89,13 @@ export default function History() {
     }
   }, []);
 
-  const fetchSymptoms = async () => {
+  // History is paginated; the list omits description/ai_analysis, which are
+  // loaded per record when it is expanded
+  const fetchSymptoms = async (cursor = null) => {
     try {
-      const res = await axiosInstance.get("/symptoms/");
-      setEntries(res.data);
+      const res = await axiosInstance.get("/symptoms/", { params: cursor ? { cursor } : {} });
+      setEntries((prev) => cursor ? [...prev, ...res.data.results] : res.data.results);
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       toast.error("Failed to fetch symptoms.");
     } finally {
@@ -98,6 +103,21 @@ export default function History() {
     }
   };
 
+  const loadMore = async () => {
+    setIsLoadingMore(true);
+    await fetchSymptoms(nextCursor);
+    setIsLoadingMore(false);
+  };
+
+  const fetchDetail = async (id) => {
+    try {
+      const res = await axiosInstance.get(`/symptoms/${id}/`);
+      setEntries((prev) => prev.map((entry) => entry.id === id ? { ...res.data, detailLoaded: true } : entry));
+    } catch (err) {
+      toast.error("Failed to load record details.");
+    }
+  };
+
   const handleDelete = (id, e) => {
     e?.stopPropagation(); // Prevent toggling expansion
 
@@ -127,6 +147,7 @@ export default function History() {
           const res = await axiosInstance.delete("/symptoms/clear-all/");
           if (res.status === 200 || res.status === 204) {
             setEntries([]);
+            setNextCursor(null);
             toast.success(res.data.message || "History cleared successfully!");
           }
         } catch (err) {
@@ -140,7 +161,11 @@ export default function History() {
   };
 
   const toggleExpand = (id) => {
-    setExpandedId(expandedId === id ? null : id);
+    const opening = expandedId !== id;
+    setExpandedId(opening ? id : null);
+    if (opening && !entries.find((entry) => entry.id === id)?.detailLoaded) {
+      fetchDetail(id);
+    }
   };
 
   // Filter entries based on selected time period
@@ -434,6 +459,17 @@ export default function History() {
                 </div>
               );
             })}
+            {nextCursor && (
+              <div className="text-center">
+                <button
+                  onClick={loadMore}
+                  disabled={isLoadingMore}
+                  className="px-6 py-3 rounded-xl bg-white dark:bg-slate-900 text-blue-600 dark:text-blue-400 font-bold border border-gray-100 dark:border-slate-800 shadow-sm hover:bg-gray-50 dark:hover:bg-slate-800 transition-all disabled:opacity-50"
+                >
+                  {isLoadingMore ? "Loading..." : "Load more"}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -8,4 +8,7 @@ export function getToken() {
 
 export function removeToken() {
   localStorage.removeItem("token");
+  // The consultation belongs to this user; the next one starts afresh
+  localStorage.removeItem("minimedi_chat_session");
+  localStorage.removeItem("minimedi_conversation_id");
 }